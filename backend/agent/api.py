@@ -2,6 +2,7 @@ from fastapi import APIRouter, HTTPException, Depends, Request, Body, File, Uplo
 from fastapi.responses import StreamingResponse
 import asyncio
 import json
+import re
 import traceback
 from datetime import datetime, timezone
 import uuid
@@ -12,15 +13,19 @@ import tempfile
 import os
 
 from agentpress.thread_manager import ThreadManager
+from agentpress.stream_coalescer import ContentChunkCoalescer
 from services.supabase import DBConnection
 from services import redis
 from agent.run import run_agent
+from agent import run_output
 from utils.auth_utils import get_current_user_id_from_jwt, get_user_id_from_stream_auth, verify_thread_access
-from utils.logger import logger
-from services.billing import check_billing_status
+from utils.logger import logger, request_id
+from utils import tracing
+from services.billing import check_billing_status, record_agent_run_usage, sweep_agent_run_usage
 from utils.config import config
 from sandbox.sandbox import create_sandbox, get_or_start_sandbox
 from services.llm import make_llm_api_call
+from services.llm_replay import is_model_allowed
 
 # Initialize shared resources
 router = APIRouter()
@@ -28,8 +33,12 @@ thread_manager = None
 db = None
 instance_id = None # Global instance ID for this backend instance
 
-# TTL for Redis response lists (24 hours)
-REDIS_RESPONSE_LIST_TTL = 3600 * 24
+# TTL for Redis response streams (24 hours)
+REDIS_RESPONSE_STREAM_TTL = 3600 * 24
+# How long a viewer waits without new output before checking that the run is still going
+RUN_STATUS_RECHECK_MS = 30000
+# Redis stream entry IDs, which are the SSE event IDs
+STREAM_ENTRY_ID_PATTERN = re.compile(r"\d+-\d+")
 
 MODEL_NAME_ALIASES = {
     # Short names to full names
@@ -154,6 +163,9 @@ async def update_agent_run_status(
                         actual_status = verify_result.data[0].get('status')
                         completed_at = verify_result.data[0].get('completed_at')
                         logger.info(f"Verified agent run update: status={actual_status}, completed_at={completed_at}")
+
+                    # Count the run's final time in the account's monthly usage
+                    await record_agent_run_usage(client, agent_run_id)
                     return True
                 else:
                     logger.warning(f"Database update returned no data for agent run {agent_run_id} on retry {retry}: {update_result}")
@@ -180,11 +192,9 @@ async def stop_agent_run(agent_run_id: str, error_message: Optional[str] = None)
     final_status = "failed" if error_message else "stopped"
 
     # Attempt to fetch final responses from Redis
-    response_list_key = f"agent_run:{agent_run_id}:responses"
     all_responses = []
     try:
-        all_responses_json = await redis.lrange(response_list_key, 0, -1)
-        all_responses = [json.loads(r) for r in all_responses_json]
+        all_responses = await run_output.get_responses(agent_run_id)
         logger.info(f"Fetched {len(all_responses)} responses from Redis for DB update on stop/fail: {agent_run_id}")
     except Exception as e:
         logger.error(f"Failed to fetch responses from Redis for {agent_run_id} during stop/fail: {e}")
@@ -206,6 +216,12 @@ async def stop_agent_run(agent_run_id: str, error_message: Optional[str] = None)
     except Exception as e:
         logger.error(f"Failed to publish STOP signal to global channel {global_control_channel}: {str(e)}")
 
+    # End the output stream for viewers, even if no instance is running the agent any more
+    try:
+        await run_output.append_control(agent_run_id, "STOP")
+    except Exception as e:
+        logger.error(f"Failed to append STOP signal to output stream of {agent_run_id}: {str(e)}")
+
     # Find all instances handling this agent run and send STOP to instance-specific channels
     try:
         instance_keys = await redis.keys(f"active_run:*:{agent_run_id}")
@@ -225,8 +241,8 @@ async def stop_agent_run(agent_run_id: str, error_message: Optional[str] = None)
             else:
                  logger.warning(f"Unexpected key format found: {key}")
 
-        # Clean up the response list immediately on stop/fail
-        await _cleanup_redis_response_list(agent_run_id)
+        # Clean up the response stream immediately on stop/fail
+        await _cleanup_redis_response_stream(agent_run_id)
 
     except Exception as e:
         logger.error(f"Failed to find or signal active instances for {agent_run_id}: {str(e)}")
@@ -234,14 +250,13 @@ async def stop_agent_run(agent_run_id: str, error_message: Optional[str] = None)
     logger.info(f"Successfully initiated stop process for agent run: {agent_run_id}")
 
 
-async def _cleanup_redis_response_list(agent_run_id: str):
-    """Set TTL on the Redis response list."""
-    response_list_key = f"agent_run:{agent_run_id}:responses"
+async def _cleanup_redis_response_stream(agent_run_id: str):
+    """Set TTL on the Redis response stream."""
     try:
-        await redis.expire(response_list_key, REDIS_RESPONSE_LIST_TTL)
-        logger.debug(f"Set TTL ({REDIS_RESPONSE_LIST_TTL}s) on response list: {response_list_key}")
+        await run_output.expire(agent_run_id, REDIS_RESPONSE_STREAM_TTL)
+        logger.debug(f"Set TTL ({REDIS_RESPONSE_STREAM_TTL}s) on response stream of agent run {agent_run_id}")
     except Exception as e:
-        logger.warning(f"Failed to set TTL on response list {response_list_key}: {str(e)}")
+        logger.warning(f"Failed to set TTL on response stream of agent run {agent_run_id}: {str(e)}")
 
 async def restore_running_agent_runs():
     """Mark agent runs that were still 'running' in the database as failed and clean up Redis resources."""
@@ -259,9 +274,8 @@ async def restore_running_agent_runs():
             active_run_key = f"active_run:{instance_id}:{agent_run_id}"
             await redis.delete(active_run_key)
 
-            # Clean up response list
-            response_list_key = f"agent_run:{agent_run_id}:responses"
-            await redis.delete(response_list_key)
+            # Clean up response stream
+            await run_output.delete(agent_run_id)
 
             # Clean up control channels
             control_channel = f"agent_run:{agent_run_id}:control"
@@ -276,6 +290,16 @@ async def restore_running_agent_runs():
         # Call stop_agent_run to handle status update and cleanup
         await stop_agent_run(agent_run_id, error_message="Server restarted while agent was running")
 
+async def sweep_usage_periodically():
+    """Periodically count the time of agent runs in progress towards monthly usage."""
+    while True:
+        await asyncio.sleep(config.USAGE_SWEEP_INTERVAL)
+        try:
+            client = await db.client
+            await sweep_agent_run_usage(client)
+        except Exception as e:
+            logger.error(f"Error in usage sweep: {str(e)}")
+
 async def check_for_active_project_agent_run(client, project_id: str):
     """
     Check if there is an active agent run for any thread in the given project.
@@ -387,6 +411,9 @@ async def start_agent(
     # Update model_name to use the resolved version
     model_name = resolved_model
 
+    if not is_model_allowed(model_name):
+        raise HTTPException(status_code=400, detail=f"Model {model_name} is not available")
+
     logger.info(f"Starting new agent for thread: {thread_id} with config: model={model_name}, thinking={body.enable_thinking}, effort={body.reasoning_effort}, stream={body.stream}, context_manager={body.enable_context_manager} (Instance: {instance_id})")
     client = await db.client
 
@@ -483,177 +510,93 @@ async def get_agent_run(agent_run_id: str, user_id: str = Depends(get_current_us
 async def stream_agent_run(
     agent_run_id: str,
     token: Optional[str] = None,
+    last_event_id: Optional[str] = None,
     request: Request = None
 ):
-    """Stream the responses of an agent run using Redis Lists and Pub/Sub."""
+    """Stream the responses of an agent run from its Redis stream.
+
+    A client reconnecting with the ID of the last event it received, in the
+    Last-Event-ID header (sent by EventSource on reconnect) or the last_event_id
+    query param, is sent only the responses after it.
+    """
     logger.info(f"Starting stream for agent run: {agent_run_id}")
     client = await db.client
 
     user_id = await get_user_id_from_stream_auth(request, token)
     agent_run_data = await get_agent_run_with_access_check(client, agent_run_id, user_id)
 
-    response_list_key = f"agent_run:{agent_run_id}:responses"
-    response_channel = f"agent_run:{agent_run_id}:new_response"
-    control_channel = f"agent_run:{agent_run_id}:control" # Global control channel
+    resume_from = (request.headers.get("last-event-id") if request else None) or last_event_id
+    if resume_from and not STREAM_ENTRY_ID_PATTERN.fullmatch(resume_from):
+        logger.warning(f"Ignoring invalid Last-Event-ID '{resume_from}' for agent run {agent_run_id}, sending all responses")
+        resume_from = None
+
+    def sse_frame(entry: run_output.RunOutputEntry) -> str:
+        # Responses are sent as stored; the stream entry ID is the event ID
+        data = entry.data if entry.data is not None else json.dumps({'type': 'status', 'status': entry.control})
+        return f"id: {entry.id}\ndata: {data}\n\n"
+
+    async def is_run_active() -> bool:
+        run_status = await client.table('agent_runs').select('status').eq("id", agent_run_id).maybe_single().execute()
+        current_status = run_status.data.get('status') if run_status.data else None
+        if current_status != 'running':
+            logger.info(f"Agent run {agent_run_id} is not running (status: {current_status}). Ending stream.")
+            return False
+        return True
 
     async def stream_generator():
-        logger.debug(f"Streaming responses for {agent_run_id} using Redis list {response_list_key} and channel {response_channel}")
-        last_processed_index = -1
-        pubsub_response = None
-        pubsub_control = None
-        listener_task = None
-        terminate_stream = False
+        logger.debug(f"Streaming responses for {agent_run_id} from Redis stream {run_output.stream_key(agent_run_id)}")
+        last_id = resume_from or "0-0"
         initial_yield_complete = False
 
         try:
-            # 1. Fetch and yield initial responses from Redis list
-            initial_responses_json = await redis.lrange(response_list_key, 0, -1)
-            initial_responses = []
-            if initial_responses_json:
-                initial_responses = [json.loads(r) for r in initial_responses_json]
-                logger.debug(f"Sending {len(initial_responses)} initial responses for {agent_run_id}")
-                for response in initial_responses:
-                    yield f"data: {json.dumps(response)}\n\n"
-                last_processed_index = len(initial_responses) - 1
+            # 1. Fetch and yield the responses stored so far (after the client's last event, if resuming)
+            initial_entries = await run_output.read_entries(agent_run_id, after_id=resume_from)
+            logger.debug(f"Sending {len(initial_entries)} initial responses for {agent_run_id}" + (f" (after {resume_from})" if resume_from else ""))
+            for entry in initial_entries:
+                yield sse_frame(entry)
+                last_id = entry.id
+                if entry.end:
+                    return
             initial_yield_complete = True
 
             # 2. Check run status *after* yielding initial data
-            run_status = await client.table('agent_runs').select('status').eq("id", agent_run_id).maybe_single().execute()
-            current_status = run_status.data.get('status') if run_status.data else None
-
-            if current_status != 'running':
-                logger.info(f"Agent run {agent_run_id} is not running (status: {current_status}). Ending stream.")
+            if not await is_run_active():
                 yield f"data: {json.dumps({'type': 'status', 'status': 'completed'})}\n\n"
                 return
 
-            # 3. Set up Pub/Sub listeners for new responses and control signals
-            pubsub_response = await redis.create_pubsub()
-            await pubsub_response.subscribe(response_channel)
-            logger.debug(f"Subscribed to response channel: {response_channel}")
-
-            pubsub_control = await redis.create_pubsub()
-            await pubsub_control.subscribe(control_channel)
-            logger.debug(f"Subscribed to control channel: {control_channel}")
-
-            # Queue to communicate between listeners and the main generator loop
-            message_queue = asyncio.Queue()
-
-            async def listen_messages():
-                response_reader = pubsub_response.listen()
-                control_reader = pubsub_control.listen()
-                tasks = [asyncio.create_task(response_reader.__anext__()), asyncio.create_task(control_reader.__anext__())]
-
-                while not terminate_stream:
-                    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
-                    for task in done:
-                        try:
-                            message = task.result()
-                            if message and isinstance(message, dict) and message.get("type") == "message":
-                                channel = message.get("channel")
-                                data = message.get("data")
-                                if isinstance(data, bytes): data = data.decode('utf-8')
-
-                                if channel == response_channel and data == "new":
-                                    await message_queue.put({"type": "new_response"})
-                                elif channel == control_channel and data in ["STOP", "END_STREAM", "ERROR"]:
-                                    logger.info(f"Received control signal '{data}' for {agent_run_id}")
-                                    await message_queue.put({"type": "control", "data": data})
-                                    return # Stop listening on control signal
-
-                        except StopAsyncIteration:
-                            logger.warning(f"Listener {task} stopped.")
-                            # Decide how to handle listener stopping, maybe terminate?
-                            await message_queue.put({"type": "error", "data": "Listener stopped unexpectedly"})
-                            return
-                        except Exception as e:
-                            logger.error(f"Error in listener for {agent_run_id}: {e}")
-                            await message_queue.put({"type": "error", "data": "Listener failed"})
+            # 3. Follow the stream with blocking reads until the run's output ends
+            idle_ms = 0
+            while True:
+                entries = await run_output.wait_for_entries(agent_run_id, last_id)
+                if not entries:
+                    # Nothing new for a while; make sure the run has not died without ending its output
+                    idle_ms += config.AGENT_RUN_STREAM_BLOCK_MS
+                    if idle_ms >= RUN_STATUS_RECHECK_MS:
+                        idle_ms = 0
+                        if not await is_run_active():
+                            yield f"data: {json.dumps({'type': 'status', 'status': 'completed'})}\n\n"
                             return
-                        finally:
-                            # Reschedule the completed listener task
-                            if task in tasks:
-                                tasks.remove(task)
-                                if message and isinstance(message, dict) and message.get("channel") == response_channel:
-                                     tasks.append(asyncio.create_task(response_reader.__anext__()))
-                                elif message and isinstance(message, dict) and message.get("channel") == control_channel:
-                                     tasks.append(asyncio.create_task(control_reader.__anext__()))
+                    continue
 
-                # Cancel pending listener tasks on exit
-                for p_task in pending: p_task.cancel()
-                for task in tasks: task.cancel()
-
-
-            listener_task = asyncio.create_task(listen_messages())
-
-            # 4. Main loop to process messages from the queue
-            while not terminate_stream:
-                try:
-                    queue_item = await message_queue.get()
-
-                    if queue_item["type"] == "new_response":
-                        # Fetch new responses from Redis list starting after the last processed index
-                        new_start_index = last_processed_index + 1
-                        new_responses_json = await redis.lrange(response_list_key, new_start_index, -1)
-
-                        if new_responses_json:
-                            new_responses = [json.loads(r) for r in new_responses_json]
-                            num_new = len(new_responses)
-                            logger.debug(f"Received {num_new} new responses for {agent_run_id} (index {new_start_index} onwards)")
-                            for response in new_responses:
-                                yield f"data: {json.dumps(response)}\n\n"
-                                # Check if this response signals completion
-                                if response.get('type') == 'status' and response.get('status') in ['completed', 'failed', 'stopped']:
-                                    logger.info(f"Detected run completion via status message in stream: {response.get('status')}")
-                                    terminate_stream = True
-                                    break # Stop processing further new responses
-                            last_processed_index += num_new
-                        if terminate_stream: break
-
-                    elif queue_item["type"] == "control":
-                        control_signal = queue_item["data"]
-                        terminate_stream = True # Stop the stream on any control signal
-                        yield f"data: {json.dumps({'type': 'status', 'status': control_signal})}\n\n"
-                        break
-
-                    elif queue_item["type"] == "error":
-                        logger.error(f"Listener error for {agent_run_id}: {queue_item['data']}")
-                        terminate_stream = True
-                        yield f"data: {json.dumps({'type': 'status', 'status': 'error'})}\n\n"
-                        break
-
-                except asyncio.CancelledError:
-                     logger.info(f"Stream generator main loop cancelled for {agent_run_id}")
-                     terminate_stream = True
-                     break
-                except Exception as loop_err:
-                    logger.error(f"Error in stream generator main loop for {agent_run_id}: {loop_err}", exc_info=True)
-                    terminate_stream = True
-                    yield f"data: {json.dumps({'type': 'status', 'status': 'error', 'message': f'Stream failed: {loop_err}'})}\n\n"
-                    break
+                idle_ms = 0
+                logger.debug(f"Received {len(entries)} new responses for {agent_run_id} (after {last_id})")
+                for entry in entries:
+                    yield sse_frame(entry)
+                    last_id = entry.id
+                    if entry.end:
+                        logger.info(f"Detected end of output for {agent_run_id}: {entry.control or 'final status'}")
+                        return
 
+        except asyncio.CancelledError:
+            logger.info(f"Stream generator cancelled for {agent_run_id}")
+            raise
         except Exception as e:
-            logger.error(f"Error setting up stream for agent run {agent_run_id}: {e}", exc_info=True)
-            # Only yield error if initial yield didn't happen
+            logger.error(f"Error streaming agent run {agent_run_id}: {e}", exc_info=True)
             if not initial_yield_complete:
-                 yield f"data: {json.dumps({'type': 'status', 'status': 'error', 'message': f'Failed to start stream: {e}'})}\n\n"
+                yield f"data: {json.dumps({'type': 'status', 'status': 'error', 'message': f'Failed to start stream: {e}'})}\n\n"
+            else:
+                yield f"data: {json.dumps({'type': 'status', 'status': 'error', 'message': f'Stream failed: {e}'})}\n\n"
         finally:
-            terminate_stream = True
-            # Graceful shutdown order: unsubscribe → close → cancel
-            if pubsub_response: await pubsub_response.unsubscribe(response_channel)
-            if pubsub_control: await pubsub_control.unsubscribe(control_channel)
-            if pubsub_response: await pubsub_response.close()
-            if pubsub_control: await pubsub_control.close()
-
-            if listener_task:
-                listener_task.cancel()
-                try:
-                    await listener_task  # Reap inner tasks & swallow their errors
-                except asyncio.CancelledError:
-                    pass
-                except Exception as e:
-                    logger.debug(f"listener_task ended with: {e}")
-            # Wait briefly for tasks to cancel
-            await asyncio.sleep(0.1)
             logger.debug(f"Streaming cleanup complete for agent run: {agent_run_id}")
 
     return StreamingResponse(stream_generator(), media_type="text/event-stream", headers={
@@ -679,16 +622,19 @@ async def run_agent_background(
     logger.info(f"Starting background agent run: {agent_run_id} for thread: {thread_id} (Instance: {instance_id})")
     logger.info(f"🚀 Using model: {model_name} (thinking: {enable_thinking}, reasoning_effort: {reasoning_effort})")
 
+    # Runs in its own task, so the request ID and trace scope only cover this run
+    request_id.set(agent_run_id)
+    run_span = tracing.start_run("agent.run", agent_run_id=agent_run_id, thread_id=thread_id, model=model_name)
+
     client = await db.client
     start_time = datetime.now(timezone.utc)
     total_responses = 0
     pubsub = None
     stop_checker = None
     stop_signal_received = False
+    response_stream = None
 
     # Define Redis keys and channels
-    response_list_key = f"agent_run:{agent_run_id}:responses"
-    response_channel = f"agent_run:{agent_run_id}:new_response"
     instance_control_channel = f"agent_run:{agent_run_id}:control:{instance_id}"
     global_control_channel = f"agent_run:{agent_run_id}:control"
     instance_active_key = f"active_run:{instance_id}:{agent_run_id}"
@@ -736,19 +682,24 @@ async def run_agent_background(
             user_id=user_id  # Pass user_id to run_agent
         )
 
+        # Merge bursts of content chunks so each Redis round trip carries more tokens
+        coalescer = ContentChunkCoalescer(
+            window_ms=config.STREAM_COALESCE_WINDOW_MS,
+            max_bytes=config.STREAM_COALESCE_MAX_BYTES
+        )
+        response_stream = coalescer.coalesce(agent_gen)
+
         final_status = "running"
         error_message = None
 
-        async for response in agent_gen:
+        async for response in response_stream:
             if stop_signal_received:
                 logger.info(f"Agent run {agent_run_id} stopped by signal.")
                 final_status = "stopped"
                 break
 
-            # Store response in Redis list and publish notification
-            response_json = json.dumps(response)
-            await redis.rpush(response_list_key, response_json)
-            await redis.publish(response_channel, "new")
+            # Append response to the run's Redis stream, waking its viewers
+            await run_output.append_response(agent_run_id, response)
             total_responses += 1
 
             # Check for agent-signaled completion or error
@@ -767,24 +718,21 @@ async def run_agent_background(
              duration = (datetime.now(timezone.utc) - start_time).total_seconds()
              logger.info(f"Agent run {agent_run_id} completed normally (duration: {duration:.2f}s, responses: {total_responses})")
              completion_message = {"type": "status", "status": "completed", "message": "Agent run completed successfully"}
-             await redis.rpush(response_list_key, json.dumps(completion_message))
-             await redis.publish(response_channel, "new") # Notify about the completion message
+             await run_output.append_response(agent_run_id, completion_message)
 
         # Fetch final responses from Redis for DB update
-        all_responses_json = await redis.lrange(response_list_key, 0, -1)
-        all_responses = [json.loads(r) for r in all_responses_json]
+        all_responses = await run_output.get_responses(agent_run_id)
 
         # Update DB status
         await update_agent_run_status(client, agent_run_id, final_status, error=error_message, responses=all_responses)
 
-        # Publish final control signal (END_STREAM or ERROR)
+        # Append final control signal (END_STREAM or ERROR) to end the output for viewers
         control_signal = "END_STREAM" if final_status == "completed" else "ERROR" if final_status == "failed" else "STOP"
         try:
-            await redis.publish(global_control_channel, control_signal)
-            # No need to publish to instance channel as the run is ending on this instance
-            logger.debug(f"Published final control signal '{control_signal}' to {global_control_channel}")
+            await run_output.append_control(agent_run_id, control_signal)
+            logger.debug(f"Appended final control signal '{control_signal}' to output stream of {agent_run_id}")
         except Exception as e:
-            logger.warning(f"Failed to publish final control signal {control_signal}: {str(e)}")
+            logger.warning(f"Failed to append final control signal {control_signal}: {str(e)}")
 
     except Exception as e:
         error_message = str(e)
@@ -793,19 +741,17 @@ async def run_agent_background(
         logger.error(f"Error in agent run {agent_run_id} after {duration:.2f}s: {error_message}\n{traceback_str} (Instance: {instance_id})")
         final_status = "failed"
 
-        # Push error message to Redis list
+        # Append error message to the Redis stream
         error_response = {"type": "status", "status": "error", "message": error_message}
         try:
-            await redis.rpush(response_list_key, json.dumps(error_response))
-            await redis.publish(response_channel, "new")
+            await run_output.append_response(agent_run_id, error_response)
         except Exception as redis_err:
              logger.error(f"Failed to push error response to Redis for {agent_run_id}: {redis_err}")
 
         # Fetch final responses (including the error)
         all_responses = []
         try:
-             all_responses_json = await redis.lrange(response_list_key, 0, -1)
-             all_responses = [json.loads(r) for r in all_responses_json]
+             all_responses = await run_output.get_responses(agent_run_id)
         except Exception as fetch_err:
              logger.error(f"Failed to fetch responses from Redis after error for {agent_run_id}: {fetch_err}")
              all_responses = [error_response] # Use the error message we tried to push
@@ -813,14 +759,19 @@ async def run_agent_background(
         # Update DB status
         await update_agent_run_status(client, agent_run_id, "failed", error=f"{error_message}\n{traceback_str}", responses=all_responses)
 
-        # Publish ERROR signal
+        # Append ERROR signal to end the output for viewers
         try:
-            await redis.publish(global_control_channel, "ERROR")
-            logger.debug(f"Published ERROR signal to {global_control_channel}")
+            await run_output.append_control(agent_run_id, "ERROR")
+            logger.debug(f"Appended ERROR signal to output stream of {agent_run_id}")
         except Exception as e:
-            logger.warning(f"Failed to publish ERROR signal: {str(e)}")
+            logger.warning(f"Failed to append ERROR signal: {str(e)}")
 
     finally:
+        # Close the coalescing stage so any in-flight fetch from the agent generator is cancelled
+        if response_stream:
+            try: await response_stream.aclose()
+            except Exception as e: logger.warning(f"Error closing response stream for {agent_run_id}: {e}")
+
         # Cleanup stop checker task
         if stop_checker and not stop_checker.done():
             stop_checker.cancel()
@@ -837,13 +788,15 @@ async def run_agent_background(
             except Exception as e:
                 logger.warning(f"Error closing pubsub for {agent_run_id}: {str(e)}")
 
-        # Set TTL on the response list in Redis
-        await _cleanup_redis_response_list(agent_run_id)
+        # Set TTL on the response stream in Redis
+        await _cleanup_redis_response_stream(agent_run_id)
 
         # Remove the instance-specific active run key
         await _cleanup_redis_instance_key(agent_run_id)
 
         logger.info(f"Agent run background task fully completed for: {agent_run_id} (Instance: {instance_id}) with final status: {final_status}")
+        run_span.set_attributes({"status": final_status, "responses": total_responses})
+        run_span.end()
 
 async def generate_and_update_project_name(project_id: str, prompt: str):
     """Generates a project name using an LLM and updates the database."""
@@ -917,6 +870,9 @@ async def initiate_agent_with_files(
     # Update model_name to use the resolved version
     model_name = resolved_model
 
+    if not is_model_allowed(model_name):
+        raise HTTPException(status_code=400, detail=f"Model {model_name} is not available")
+
     logger.info(f"[\033[91mDEBUG\033[0m] Initiating new agent with prompt and {len(files)} files (Instance: {instance_id}), model: {model_name}, enable_thinking: {enable_thinking}")
     client = await db.client
     account_id = user_id # In Basejump, personal account_id is the same as user_id
@@ -3,6 +3,8 @@ import json
 import re
 from uuid import uuid4
 from typing import Optional
+from functools import lru_cache
+import httpx
 
 # from agent.tools.message_tool import MessageTool
 from agent.tools.message_tool import MessageTool
@@ -13,21 +15,83 @@ from dotenv import load_dotenv
 from utils.config import config
 
 from agentpress.thread_manager import ThreadManager
+from agentpress.tool_registry import ToolRegistryTemplate
+from agentpress.image_pipeline import get_image_pipeline, hash_distance
+from agentpress.context_slots import ThreadContextSlots
 from agentpress.response_processor import ProcessorConfig
 from agent.tools.sb_shell_tool import SandboxShellTool
 from agent.tools.sb_files_tool import SandboxFilesTool
 from agent.tools.sb_browser_tool import SandboxBrowserTool
 from agent.tools.data_providers_tool import DataProvidersTool
+from agent.tools.tool_output_tool import ToolOutputTool
 from agent.prompt import get_system_prompt
 from utils import logger
+from utils import tracing
 from utils.auth_utils import get_account_id_from_thread
-from services.billing import check_billing_status
+from agent.run_state import AgentRunState
 from agent.tools.sb_vision_tool import SandboxVisionTool
 from services.supabase import DBConnection
 from services.billing import get_user_subscription
 
 load_dotenv()
 
+@lru_cache(maxsize=2)
+def _build_system_prompt_content(include_sample_response: bool) -> str:
+    """Build the system prompt text, reading the sample response from disk only once."""
+    if not include_sample_response:
+        return get_system_prompt()
+    sample_response_path = os.path.join(os.path.dirname(__file__), 'sample_responses/1.txt')
+    with open(sample_response_path, 'r') as file:
+        sample_response = file.read()
+    return get_system_prompt() + "\n\n <sample_assistant_response>" + sample_response + "</sample_assistant_response>"
+
+def get_system_message(include_sample_response: bool) -> dict:
+    """Get the agent's base system message for a model family."""
+    return { "role": "system", "content": _build_system_prompt_content(include_sample_response) }
+
+async def screen_unchanged(context_slots: ThreadContextSlots, thread_id: str, perceptual_hash: Optional[int]) -> bool:
+    """Check whether a screenshot looks the same as the thread's previous one, and record it as the latest."""
+    if perceptual_hash is None or config.SCREENSHOT_UNCHANGED_MAX_DISTANCE < 0:
+        return False
+    previous = await context_slots.consume(thread_id, "last_screenshot")
+    await context_slots.put(thread_id, "last_screenshot", {"perceptual_hash": format(perceptual_hash, "x")})
+    if not previous or not previous.get("perceptual_hash"):
+        return False
+    return hash_distance(perceptual_hash, int(previous["perceptual_hash"], 16)) <= config.SCREENSHOT_UNCHANGED_MAX_DISTANCE
+
+# HTTP client shared by the agent's tools; owned by the API lifespan, which closes it on shutdown
+tools_http_client: Optional[httpx.AsyncClient] = None
+
+def initialize(http_client: httpx.AsyncClient):
+    """Set the HTTP client shared by the agent's tools.
+
+    Args:
+        http_client: Client to share between runs; the caller closes it
+    """
+    global tools_http_client
+    tools_http_client = http_client
+    # Rebuild the tools with the new client on next use
+    get_tool_registry_template.cache_clear()
+
+@lru_cache(maxsize=1)
+def get_tool_registry_template() -> ToolRegistryTemplate:
+    """Get the agent's tools, resolved once per process and bound to each run by ThreadManager.add_tools."""
+    template = ToolRegistryTemplate()
+    template.add_tool(SandboxShellTool)
+    template.add_tool(SandboxFilesTool)
+    template.add_tool(SandboxBrowserTool)
+    template.add_tool(SandboxDeployTool)
+    template.add_tool(SandboxExposeTool)
+    template.add_tool(MessageTool) # we are just doing this via prompt as there is no need to call it as a tool
+    # Shared by all runs, along with its Tavily client
+    template.add_tool(WebSearchTool, http_client=tools_http_client)
+    template.add_tool(SandboxVisionTool)
+    template.add_tool(ToolOutputTool)
+    # Add data providers tool if RapidAPI key is available
+    if config.RAPID_API_KEY:
+        template.add_tool(DataProvidersTool)
+    return template
+
 async def run_agent(
     thread_id: str,
     project_id: str,
@@ -45,7 +109,7 @@ async def run_agent(
     
     print(f"🚀 Starting agent with model: {model_name}")
 
-    thread_manager = ThreadManager()
+    thread_manager = ThreadManager(write_behind=config.MESSAGE_WRITE_BEHIND)
 
     client = await thread_manager.db.client
 
@@ -66,40 +130,33 @@ async def run_agent(
 
     # Initialize tools with project_id instead of sandbox object
     # This ensures each tool independently verifies it's operating on the correct project
-    thread_manager.add_tool(SandboxShellTool, project_id=project_id, thread_manager=thread_manager)
-    thread_manager.add_tool(SandboxFilesTool, project_id=project_id, thread_manager=thread_manager)
-    thread_manager.add_tool(SandboxBrowserTool, project_id=project_id, thread_id=thread_id, thread_manager=thread_manager)
-    thread_manager.add_tool(SandboxDeployTool, project_id=project_id, thread_manager=thread_manager)
-    thread_manager.add_tool(SandboxExposeTool, project_id=project_id, thread_manager=thread_manager)
-    thread_manager.add_tool(MessageTool) # we are just doing this via prompt as there is no need to call it as a tool
-    thread_manager.add_tool(WebSearchTool)
-    thread_manager.add_tool(SandboxVisionTool, project_id=project_id, thread_id=thread_id, thread_manager=thread_manager)
-    # Add data providers tool if RapidAPI key is available
-    if config.RAPID_API_KEY:
-        thread_manager.add_tool(DataProvidersTool)
+    thread_manager.add_tools(get_tool_registry_template(), project_id=project_id, thread_id=thread_id)
 
 
     # Only include sample response if the model name does not contain "anthropic"
-    if "anthropic" not in model_name.lower():
-        sample_response_path = os.path.join(os.path.dirname(__file__), 'sample_responses/1.txt')
-        with open(sample_response_path, 'r') as file:
-            sample_response = file.read()
-        
-        system_message = { "role": "system", "content": get_system_prompt() + "\n\n <sample_assistant_response>" + sample_response + "</sample_assistant_response>" }
-    else:
-        system_message = { "role": "system", "content": get_system_prompt() }
+    system_message = get_system_message(include_sample_response="anthropic" not in model_name.lower())
+
+    # Screenshots and images are downscaled and re-encoded for the model before they are sent
+    image_pipeline = get_image_pipeline()
+
+    run_state = AgentRunState(client, thread_id, account_id, thread_manager.context_slots)
 
     iteration_count = 0
     continue_execution = True
 
     while continue_execution and iteration_count < max_iterations:
         iteration_count += 1
+        tracing.start_step("agent.iteration", iteration=iteration_count)
         # logger.debug(f"Running iteration {iteration_count}...")
 
-        # Billing check on each iteration - still needed within the iterations
-        can_run, message, subscription = await check_billing_status(client, account_id)
-        if not can_run:
-            error_msg = f"Billing limit reached: {message}"
+        # Persist queued messages before reading the thread back directly; raises,
+        # failing the run, if earlier messages could not be saved
+        await thread_manager.flush_messages(thread_id)
+
+        # Billing check plus latest message and pending context rows, in one round trip
+        preamble = await run_state.begin_iteration()
+        if not preamble.can_run:
+            error_msg = f"Billing limit reached: {preamble.billing_message}"
             # Yield a special message to indicate billing limit reached
             yield {
                 "type": "status",
@@ -107,76 +164,71 @@ async def run_agent(
                 "message": error_msg
             }
             break
-        # Check if last message is from assistant using direct Supabase query
-        latest_message = await client.table('messages').select('*').eq('thread_id', thread_id).in_('type', ['assistant', 'tool', 'user']).order('created_at', desc=True).limit(1).execute()
-        if latest_message.data and len(latest_message.data) > 0:
-            message_type = latest_message.data[0].get('type')
-            if message_type == 'assistant':
-                print(f"Last message was from assistant, stopping execution")
-                continue_execution = False
-                break
+
+        # Check if last message is from assistant
+        if preamble.latest_message_type == 'assistant':
+            print(f"Last message was from assistant, stopping execution")
+            continue_execution = False
+            break
 
         # ---- Temporary Message Handling (Browser State & Image Context) ----
         temporary_message = None
         temp_message_content_list = [] # List to hold text/image blocks
 
-        # Get the latest browser_state message
-        latest_browser_state_msg = await client.table('messages').select('*').eq('thread_id', thread_id).eq('type', 'browser_state').order('created_at', desc=True).limit(1).execute()
-        if latest_browser_state_msg.data and len(latest_browser_state_msg.data) > 0:
-            try:
-                browser_content = json.loads(latest_browser_state_msg.data[0]["content"])
-                screenshot_base64 = browser_content.get("screenshot_base64")
-                # Create a copy of the browser state without screenshot
-                browser_state_text = browser_content.copy()
-                browser_state_text.pop('screenshot_base64', None)
-                browser_state_text.pop('screenshot_url', None)
-                browser_state_text.pop('screenshot_url_base64', None)
-
-                if browser_state_text:
+        # The latest browser state (already consumed)
+        if preamble.browser_state:
+            browser_content = preamble.browser_state
+            screenshot_base64 = browser_content.get("screenshot_base64")
+            # Create a copy of the browser state without screenshot
+            browser_state_text = browser_content.copy()
+            browser_state_text.pop('screenshot_base64', None)
+            browser_state_text.pop('screenshot_url', None)
+            browser_state_text.pop('screenshot_url_base64', None)
+
+            if browser_state_text:
+                temp_message_content_list.append({
+                    "type": "text",
+                    "text": f"The following is the current state of the browser:\n{json.dumps(browser_state_text, indent=2)}"
+                })
+            if screenshot_base64:
+                screenshot = await image_pipeline.normalize_base64(screenshot_base64, "image/jpeg", model_name)
+                # The previous screenshot was only in the previous LLM call, so the frame is always
+                # sent; scrolls, waits and failed clicks that left the screen as it was are pointed out
+                if await screen_unchanged(thread_manager.context_slots, thread_id, screenshot.perceptual_hash):
                     temp_message_content_list.append({
                         "type": "text",
-                        "text": f"The following is the current state of the browser:\n{json.dumps(browser_state_text, indent=2)}"
+                        "text": "The screen has not changed since the previous browser action."
                     })
-                if screenshot_base64:
-                    temp_message_content_list.append({
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{screenshot_base64}",
-                        }
-                    })
-                else:
-                    logger.warning("Browser state found but no screenshot base64 data.")
-
-                await client.table('messages').delete().eq('message_id', latest_browser_state_msg.data[0]["message_id"]).execute()
-            except Exception as e:
-                logger.error(f"Error parsing browser state: {e}")
-
-        # Get the latest image_context message (NEW)
-        latest_image_context_msg = await client.table('messages').select('*').eq('thread_id', thread_id).eq('type', 'image_context').order('created_at', desc=True).limit(1).execute()
-        if latest_image_context_msg.data and len(latest_image_context_msg.data) > 0:
-            try:
-                image_context_content = json.loads(latest_image_context_msg.data[0]["content"])
-                base64_image = image_context_content.get("base64")
-                mime_type = image_context_content.get("mime_type")
-                file_path = image_context_content.get("file_path", "unknown file")
-
-                if base64_image and mime_type:
-                    temp_message_content_list.append({
-                        "type": "text",
-                        "text": f"Here is the image you requested to see: '{file_path}'"
-                    })
-                    temp_message_content_list.append({
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:{mime_type};base64,{base64_image}",
-                        }
-                    })
-                else:
-                    logger.warning(f"Image context found for '{file_path}' but missing base64 or mime_type.")
-
-                await client.table('messages').delete().eq('message_id', latest_image_context_msg.data[0]["message_id"]).execute()
-            except Exception as e:
-                logger.error(f"Error parsing image context: {e}")
+                temp_message_content_list.append({
+                    "type": "image_url",
+                    "image_url": {
+                        "url": screenshot.data_url,
+                    }
+                })
+            else:
+                logger.warning("Browser state found but no screenshot base64 data.")
+
+        # The latest image context (already consumed)
+        if preamble.image_context:
+            image_context_content = preamble.image_context
+            base64_image = image_context_content.get("base64")
+            mime_type = image_context_content.get("mime_type")
+            file_path = image_context_content.get("file_path", "unknown file")
+
+            if base64_image and mime_type:
+                temp_message_content_list.append({
+                    "type": "text",
+                    "text": f"Here is the image you requested to see: '{file_path}'"
+                })
+                image = await image_pipeline.normalize_base64(base64_image, mime_type, model_name)
+                temp_message_content_list.append({
+                    "type": "image_url",
+                    "image_url": {
+                        "url": image.data_url,
+                    }
+                })
+            else:
+                logger.warning(f"Image context found for '{file_path}' but missing base64 or mime_type.")
 
         # If we have any content, construct the temporary_message
         if temp_message_content_list:
@@ -207,16 +259,20 @@ async def run_agent(
                 execute_tools=True,
                 execute_on_stream=True,
                 tool_execution_strategy="parallel",
-                xml_adding_strategy="user_message"
+                xml_adding_strategy="user_message",
+                status_event_tier="ephemeral"
             ),
             native_max_auto_continues=native_max_auto_continues,
             include_xml_examples=True,
             enable_thinking=enable_thinking,
             reasoning_effort=reasoning_effort,
-            enable_context_manager=enable_context_manager
+            enable_context_manager=enable_context_manager,
+            prompt_cache_layout="stable",
+            hedge_account_id=account_id
         )
 
         if isinstance(response, dict) and "status" in response and response["status"] == "error":
+            tracing.end_step()
             yield response
             return
 
@@ -285,6 +341,11 @@ async def run_agent(
             print(f"Agent decided to stop with tool: {last_tool_call}")
             continue_execution = False
 
+    tracing.end_step()
+
+    # Make sure everything from the final iteration reaches the database
+    await thread_manager.flush_messages()
+
 
 # # TESTING
 
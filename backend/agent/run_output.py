@@ -0,0 +1,107 @@
+"""
+Transport of agent run output over Redis Streams.
+
+The background run appends each response to the run's stream (XADD), and each
+SSE viewer follows the stream with blocking XREADs from the last entry it sent.
+A response costs the writer one round trip and each viewer one, without pub/sub
+connections, and the stream entry ID serves as the SSE event ID.
+
+The stream is never trimmed: it is the run's complete output, which is saved to
+agent_runs.responses and replayed to viewers that join late or resume. It is
+removed by its TTL once the run has ended.
+
+Entries have one of two fields:
+    data     a response, JSON-encoded
+    control  a control signal ending the run's output (END_STREAM, STOP or ERROR)
+Responses with a final status ('completed', 'failed', 'stopped') also have an
+"end" field, so viewers know where the output ends without decoding it.
+"""
+
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from services import redis
+from utils.config import config
+
+FINAL_STATUSES = ('completed', 'failed', 'stopped')
+
+
+def stream_key(agent_run_id: str) -> str:
+    return f"agent_run:{agent_run_id}:stream"
+
+
+@dataclass
+class RunOutputEntry:
+    """An entry of a run's output stream.
+
+    Attributes:
+        id: Stream entry ID
+        data: The response as stored (JSON), for response entries
+        control: The control signal, for control entries
+        end: Whether the run's output ends with this entry
+    """
+    id: str
+    data: Optional[str] = None
+    control: Optional[str] = None
+    end: bool = False
+
+    @classmethod
+    def from_fields(cls, entry_id: str, fields: Dict[str, str]) -> "RunOutputEntry":
+        control = fields.get("control")
+        return cls(id=entry_id, data=fields.get("data"), control=control, end=control is not None or "end" in fields)
+
+
+async def append_response(agent_run_id: str, response: Dict[str, Any]) -> str:
+    """Append a response to a run's output.
+
+    Returns:
+        The entry ID
+    """
+    fields = {"data": json.dumps(response)}
+    if response.get('type') == 'status' and response.get('status') in FINAL_STATUSES:
+        fields["end"] = "1"
+    return await redis.xadd(stream_key(agent_run_id), fields)
+
+
+async def append_control(agent_run_id: str, signal: str) -> str:
+    """Append a control signal (END_STREAM, STOP or ERROR), ending a run's output for its viewers."""
+    return await redis.xadd(stream_key(agent_run_id), {"control": signal})
+
+
+async def read_entries(agent_run_id: str, after_id: Optional[str] = None) -> List[RunOutputEntry]:
+    """Get the stored entries of a run's output, all or those after an entry ID."""
+    start = f"({after_id}" if after_id else "-"
+    entries = await redis.xrange(stream_key(agent_run_id), start=start)
+    return [RunOutputEntry.from_fields(entry_id, fields) for entry_id, fields in entries]
+
+
+async def wait_for_entries(agent_run_id: str, after_id: str, block_ms: Optional[int] = None) -> List[RunOutputEntry]:
+    """Get the entries of a run's output after an entry ID, waiting for new ones.
+
+    Args:
+        agent_run_id: The run
+        after_id: ID of the last entry already seen ("0-0" for none)
+        block_ms: Longest wait; defaults to AGENT_RUN_STREAM_BLOCK_MS
+
+    Returns:
+        The new entries, empty if none arrived in time
+    """
+    block_ms = config.AGENT_RUN_STREAM_BLOCK_MS if block_ms is None else block_ms
+    entries = await redis.xread(stream_key(agent_run_id), after_id, block_ms=block_ms)
+    return [RunOutputEntry.from_fields(entry_id, fields) for entry_id, fields in entries]
+
+
+async def get_responses(agent_run_id: str) -> List[Dict[str, Any]]:
+    """Get the decoded responses of a run's output."""
+    return [json.loads(entry.data) for entry in await read_entries(agent_run_id) if entry.data is not None]
+
+
+async def expire(agent_run_id: str, ttl: int) -> None:
+    """Set the time to live of a run's output."""
+    await redis.expire(stream_key(agent_run_id), ttl)
+
+
+async def delete(agent_run_id: str) -> None:
+    """Delete a run's output."""
+    await redis.delete(stream_key(agent_run_id))
@@ -0,0 +1,153 @@
+"""
+Per-iteration state for the agent loop.
+
+Before each LLM call the loop needs the billing status, the type of the latest
+conversation message, and any pending browser_state / image_context (which are
+consumed). Fetched one by one these cost several sequential Supabase round
+trips per iteration; `AgentRunState.begin_iteration` reads the thread with a
+single RPC (`consume_agent_iteration_state`), takes the pending context from
+the thread's context slots, and repeats the billing check only every
+BILLING_RECHECK_SECONDS within a run, so most iterations make one database
+round trip. The RPC still consumes image_context message rows written before
+tools used the context slots; browser_state rows are kept for the UI. They
+hold the text state of each browser action and the sandbox path of its
+screenshot, which only the context slot carries inline.
+"""
+
+import json
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from agentpress.context_slots import ThreadContextSlots
+from services.billing import check_billing_status
+from utils.logger import logger
+
+# Billing can only change slowly during a run; re-check at most this often
+BILLING_RECHECK_SECONDS = 60
+
+CONTEXT_SLOTS = ('browser_state', 'image_context')
+
+
+@dataclass
+class IterationPreamble:
+    """Everything an agent loop iteration needs before calling the LLM.
+
+    Attributes:
+        can_run: Whether billing allows the run to continue
+        billing_message: Billing status message
+        latest_message_type: Type of the latest assistant/tool/user message, if any
+        browser_state: The consumed browser state, if any
+        image_context: The consumed image context, if any
+    """
+    can_run: bool
+    billing_message: str
+    latest_message_type: Optional[str] = None
+    browser_state: Optional[Dict[str, Any]] = None
+    image_context: Optional[Dict[str, Any]] = None
+
+
+def _parse_content(content: Any) -> Optional[Dict[str, Any]]:
+    """Parse message content that may be stored as a JSON string."""
+    if content is None:
+        return None
+    if isinstance(content, str):
+        return json.loads(content)
+    return content
+
+
+class AgentRunState:
+    """Fetches the iteration preamble of one agent run."""
+
+    def __init__(self, client, thread_id: str, account_id: str, context_slots: ThreadContextSlots):
+        """Initialize the run state.
+
+        Args:
+            client: Supabase client
+            thread_id: Thread the agent runs on
+            account_id: Account billed for the run
+            context_slots: Context slots the run's tools write browser_state / image_context to
+        """
+        self.client = client
+        self.thread_id = thread_id
+        self.account_id = account_id
+        self.context_slots = context_slots
+        self._billing: Optional[tuple] = None
+        self._billing_checked_at = 0.0
+        self._use_rpc = True
+
+    async def begin_iteration(self) -> IterationPreamble:
+        """Check billing, then consume the thread's iteration state.
+
+        Returns:
+            The iteration preamble. If billing does not allow the run, the
+            thread state is not read, so no context rows are consumed.
+        """
+        can_run, message = await self._check_billing()
+        if not can_run:
+            return IterationPreamble(can_run=False, billing_message=message)
+
+        state = await self._consume_thread_state()
+        latest_message_type = state.get('latest_message_type')
+        # As with the rows, nothing is consumed if the loop is about to stop
+        slots = {}
+        if latest_message_type != 'assistant':
+            slots = await self.context_slots.consume_many(self.thread_id, CONTEXT_SLOTS)
+
+        return IterationPreamble(
+            can_run=True,
+            billing_message=message,
+            latest_message_type=latest_message_type,
+            browser_state=slots.get('browser_state'),
+            image_context=slots.get('image_context') or self._parse(state.get('image_context'), 'image context')
+        )
+
+    async def _check_billing(self) -> tuple:
+        """Get (can_run, message), re-checking only every BILLING_RECHECK_SECONDS while allowed."""
+        now = time.monotonic()
+        if self._billing is not None and self._billing[0] and now - self._billing_checked_at < BILLING_RECHECK_SECONDS:
+            return self._billing
+        can_run, message, _ = await check_billing_status(self.client, self.account_id)
+        self._billing = (can_run, message)
+        self._billing_checked_at = now
+        return self._billing
+
+    async def _consume_thread_state(self) -> Dict[str, Any]:
+        """Read the latest message type and consume a pending image_context row in one RPC.
+
+        Falls back to individual queries if the RPC is not available (migration not applied).
+        """
+        if self._use_rpc:
+            try:
+                result = await self.client.rpc('consume_agent_iteration_state', {'p_thread_id': self.thread_id}).execute()
+                data = result.data
+                if isinstance(data, str):
+                    data = json.loads(data)
+                return data or {}
+            except Exception as e:
+                logger.warning(f"consume_agent_iteration_state RPC failed, using individual queries: {str(e)}")
+                self._use_rpc = False
+        return await self._consume_thread_state_queries()
+
+    async def _consume_thread_state_queries(self) -> Dict[str, Any]:
+        """Same as the RPC, with one query per step."""
+        state: Dict[str, Any] = {}
+        latest_message = await self.client.table('messages').select('type').eq('thread_id', self.thread_id).in_('type', ['assistant', 'tool', 'user']).order('created_at', desc=True).limit(1).execute()
+        if latest_message.data:
+            state['latest_message_type'] = latest_message.data[0].get('type')
+        if state.get('latest_message_type') == 'assistant':
+            return state
+
+        latest = await self.client.table('messages').select('message_id, content').eq('thread_id', self.thread_id).eq('type', 'image_context').order('created_at', desc=True).limit(1).execute()
+        if latest.data:
+            await self.client.table('messages').delete().eq('message_id', latest.data[0]['message_id']).execute()
+            state['image_context'] = latest.data[0]['content']
+        return state
+
+    @staticmethod
+    def _parse(content: Any, label: str) -> Optional[Dict[str, Any]]:
+        try:
+            return _parse_content(content)
+        except Exception as e:
+            logger.error(f"Error parsing {label}: {e}")
+            return None
@@ -1,12 +1,19 @@
 import json
 
 from agentpress.tool import Tool, ToolResult, openapi_schema, xml_schema
+from agentpress.tool_cache import cacheable
 from agent.tools.data_providers.LinkedinProvider import LinkedinProvider
 from agent.tools.data_providers.YahooFinanceProvider import YahooFinanceProvider
 from agent.tools.data_providers.AmazonProvider import AmazonProvider
 from agent.tools.data_providers.ZillowProvider import ZillowProvider
 from agent.tools.data_providers.TwitterProvider import TwitterProvider
 
+DATA_PROVIDER_CACHE_TTL = 30 * 60
+
+def _data_provider_cache_key(service_name, route, payload):
+    """Cache key for execute_data_provider_call; the JSON payload is normalized."""
+    return [service_name, route, json.loads(payload) if isinstance(payload, str) else payload]
+
 class DataProvidersTool(Tool):
     """Tool for making requests to various data providers."""
 
@@ -126,6 +133,7 @@ Use this tool when you need to discover what endpoints are available.
         </execute-data-provider-call>
         '''
     )
+    @cacheable(ttl=DATA_PROVIDER_CACHE_TTL, key=_data_provider_cache_key)
     async def execute_data_provider_call(
         self,
         service_name: str,
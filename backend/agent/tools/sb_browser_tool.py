@@ -1,11 +1,17 @@
 import traceback
 import json
+import base64
+import uuid
+from typing import Optional
 
 from agentpress.tool import ToolResult, openapi_schema, xml_schema
 from agentpress.thread_manager import ThreadManager
 from sandbox.sandbox import SandboxToolsBase, Sandbox
 from utils.logger import logger
 
+# Screenshots shown by the UI are kept in the sandbox rather than in the messages table
+SCREENSHOT_DIR = "/workspace/.browser_screenshots"
+
 
 class SandboxBrowserTool(SandboxToolsBase):
     """Tool for executing tasks in a Daytona sandbox with browser-use capabilities."""
@@ -13,6 +19,26 @@ class SandboxBrowserTool(SandboxToolsBase):
     def __init__(self, project_id: str, thread_id: str, thread_manager: ThreadManager):
         super().__init__(project_id, thread_manager)
         self.thread_id = thread_id
+        self._screenshot_dir_ready = False
+
+    def _save_screenshot(self, screenshot_base64: Optional[str]) -> Optional[str]:
+        """Save a screenshot in the sandbox for the UI.
+
+        Returns:
+            Path of the screenshot in the sandbox, or None if there is none or it could not be saved
+        """
+        if not screenshot_base64:
+            return None
+        try:
+            if not self._screenshot_dir_ready:
+                self.sandbox.fs.create_folder(SCREENSHOT_DIR, "755")
+                self._screenshot_dir_ready = True
+            path = f"{SCREENSHOT_DIR}/{uuid.uuid4()}.jpg"
+            self.sandbox.fs.upload_file(path, base64.b64decode(screenshot_base64))
+            return path
+        except Exception as e:
+            logger.warning(f"Failed to save browser screenshot in sandbox: {str(e)}")
+            return None
 
     async def _execute_browser_action(self, endpoint: str, params: dict = None, method: str = "POST") -> ToolResult:
         """Execute a browser automation action through the API
@@ -59,11 +85,18 @@ class SandboxBrowserTool(SandboxToolsBase):
 
                     logger.info("Browser automation request completed successfully")
 
-                    # Add full result to thread messages for state tracking
+                    # Keep the full result (with screenshot) as context for the next LLM call
+                    await self.thread_manager.context_slots.put(self.thread_id, "browser_state", result)
+
+                    # Save a small row for the UI: the text state and where the screenshot of this action is kept
+                    ui_state = {key: value for key, value in result.items() if key != "screenshot_base64"}
+                    screenshot_path = self._save_screenshot(result.get("screenshot_base64"))
+                    if screenshot_path:
+                        ui_state["screenshot_path"] = screenshot_path
                     added_message = await self.thread_manager.add_message(
                         thread_id=self.thread_id,
                         type="browser_state",
-                        content=result,
+                        content=ui_state,
                         is_llm_message=False
                     )
 
@@ -103,22 +103,16 @@ class SandboxVisionTool(SandboxToolsBase):
             
             logger.info(f"Successfully read and encoded image '{cleaned_path}' as {mime_type}")
 
-            # Prepare the temporary message content
+            # Prepare the image context
             image_context_data = {
                 "mime_type": mime_type,
                 "base64": base64_image,
                 "file_path": cleaned_path # Include path for context
             }
 
-            # Add the temporary message using the thread_manager callback
-            # Use a distinct type like 'image_context'
-            await self.thread_manager.add_message(
-                thread_id=self.thread_id,
-                type="image_context", # Use a specific type for this
-                content=image_context_data, # Store the dict directly
-                is_llm_message=False # This is context generated by a tool
-            )
-            logger.info(f"Added image context message for '{cleaned_path}' to thread {self.thread_id}")
+            # Keep the image as context for the next LLM call
+            await self.thread_manager.context_slots.put(self.thread_id, "image_context", image_context_data)
+            logger.info(f"Added image context for '{cleaned_path}' to thread {self.thread_id}")
 
             # Inform the agent the image will be available next turn
             return self.success_response(f"Successfully loaded the image '{cleaned_path}'.")
@@ -0,0 +1,105 @@
+from agentpress.tool import Tool, ToolResult, openapi_schema, xml_schema
+from agentpress.tool_output_store import get_tool_output_store
+from utils.config import config
+from utils.logger import logger
+
+DEFAULT_PAGE_CHARS = 10000
+
+class ToolOutputTool(Tool):
+    """Tool for reading large tool outputs that were stored outside the conversation."""
+
+    def __init__(self):
+        super().__init__()
+
+    @openapi_schema({
+        "type": "function",
+        "function": {
+            "name": "read_tool_output",
+            "description": "Read part of a large tool output that was truncated in the conversation. Truncated outputs show a handle; use it with an offset and length to page through the full output.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "handle": {
+                        "type": "string",
+                        "description": "The handle shown in the truncation notice of the tool output"
+                    },
+                    "offset": {
+                        "type": "integer",
+                        "description": "Character offset to start reading from",
+                        "default": 0
+                    },
+                    "length": {
+                        "type": "integer",
+                        "description": "Number of characters to read",
+                        "default": DEFAULT_PAGE_CHARS
+                    }
+                },
+                "required": ["handle"]
+            }
+        }
+    })
+    @xml_schema(
+        tag_name="read-tool-output",
+        mappings=[
+            {"param_name": "handle", "node_type": "attribute", "path": "."},
+            {"param_name": "offset", "node_type": "attribute", "path": ".", "required": False},
+            {"param_name": "length", "node_type": "attribute", "path": ".", "required": False}
+        ],
+        example='''
+        <!--
+        Large tool outputs are truncated in the conversation and stored with a handle.
+        Use read-tool-output to read the omitted part, one page at a time.
+        -->
+
+        <!-- Read the first 10000 characters of a stored output -->
+        <read-tool-output handle="3f1c9a0b7d2e4f6a8b0c1d2e" offset="0" length="10000">
+        </read-tool-output>
+
+        <!-- Read the next page -->
+        <read-tool-output handle="3f1c9a0b7d2e4f6a8b0c1d2e" offset="10000" length="10000">
+        </read-tool-output>
+        '''
+    )
+    async def read_tool_output(
+        self,
+        handle: str,
+        offset: int = 0,
+        length: int = DEFAULT_PAGE_CHARS
+    ) -> ToolResult:
+        """
+        Read a page of a stored tool output.
+
+        Parameters:
+        - handle: Handle of the stored output
+        - offset: Character offset to start reading from
+        - length: Number of characters to read
+        """
+        try:
+            if not handle:
+                return self.fail_response("A tool output handle is required.")
+
+            try:
+                offset = max(0, int(offset or 0))
+                length = int(length or DEFAULT_PAGE_CHARS)
+            except (TypeError, ValueError):
+                return self.fail_response("offset and length must be integers.")
+
+            # Pages must stay below the offload threshold so they are not truncated again
+            max_page = config.TOOL_OUTPUT_OFFLOAD_CHARS - 500 if config.TOOL_OUTPUT_OFFLOAD_CHARS > 0 else DEFAULT_PAGE_CHARS
+            length = max(1, min(length, max_page))
+
+            content = await get_tool_output_store().get(handle.strip())
+            if content is None:
+                return self.fail_response(f"No stored tool output found for handle '{handle}'. It may have expired.")
+
+            if offset >= len(content):
+                return self.fail_response(f"Offset {offset} is past the end of the output ({len(content)} characters).")
+
+            page = content[offset:offset + length]
+            end = offset + len(page)
+            header = f"[Characters {offset}-{end} of {len(content)}" + ("; end of output]" if end >= len(content) else f"; continue with offset=\"{end}\"]")
+            return self.success_response(f"{header}\n{page}")
+
+        except Exception as e:
+            logger.error(f"Error reading tool output {handle}: {str(e)}")
+            return self.fail_response(f"Error reading tool output: {str(e)[:200]}")
@@ -5,15 +5,38 @@ from datetime import datetime
 import os
 from dotenv import load_dotenv
 from agentpress.tool import Tool, ToolResult, openapi_schema, xml_schema
+from agentpress.tool_cache import cacheable
 from utils.config import config
 import json
 
 # TODO: add subpages, etc... in filters as sometimes its necessary 
 
+# Search results change quickly, page content less so
+WEB_SEARCH_CACHE_TTL = 15 * 60
+SCRAPE_CACHE_TTL = 60 * 60
+
+def _search_cache_key(query, num_results=20):
+    """Cache key for web_search; equivalent queries share an entry."""
+    return [" ".join(str(query).lower().split()), str(num_results)]
+
+def _scrape_cache_key(url):
+    """Cache key for scrape_webpage; URLs with and without a protocol share an entry."""
+    url = str(url).strip()
+    if not (url.startswith('http://') or url.startswith('https://')):
+        url = 'https://' + url
+    return url
+
 class WebSearchTool(Tool):
     """Tool for performing web searches using Tavily API and web scraping using Firecrawl."""
 
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, http_client: Optional[httpx.AsyncClient] = None):
+        """Initialize the tool.
+
+        Args:
+            api_key: Tavily API key; defaults to TAVILY_API_KEY
+            http_client: Client for Firecrawl requests, shared to reuse connections;
+                         a client is created per request if not given
+        """
         super().__init__()
         # Load environment variables
         load_dotenv()
@@ -29,6 +52,7 @@ class WebSearchTool(Tool):
 
         # Tavily asynchronous search client
         self.tavily_client = AsyncTavilyClient(api_key=self.tavily_api_key)
+        self.http_client = http_client
 
     @openapi_schema({
         "type": "function",
@@ -88,6 +112,7 @@ class WebSearchTool(Tool):
         </web-search>
         '''
     )
+    @cacheable(ttl=WEB_SEARCH_CACHE_TTL, key=_search_cache_key)
     async def web_search(
         self, 
         query: str, 
@@ -224,6 +249,7 @@ class WebSearchTool(Tool):
         -->
         '''
     )
+    @cacheable(ttl=SCRAPE_CACHE_TTL, key=_scrape_cache_key, max_entries=64, max_bytes=2 * 1024 * 1024)
     async def scrape_webpage(
         self,
         url: str
@@ -261,23 +287,21 @@ class WebSearchTool(Tool):
                 return self.fail_response("URL must be a string.")
                 
             # ---------- Firecrawl scrape endpoint ----------
-            async with httpx.AsyncClient() as client:
-                headers = {
-                    "Authorization": f"Bearer {self.firecrawl_api_key}",
-                    "Content-Type": "application/json",
-                }
-                payload = {
-                    "url": url,
-                    "formats": ["markdown"]
-                }
-                response = await client.post(
-                    f"{self.firecrawl_url}/v1/scrape",
-                    json=payload,
-                    headers=headers,
-                    timeout=60,
-                )
-                response.raise_for_status()
-                data = response.json()
+            headers = {
+                "Authorization": f"Bearer {self.firecrawl_api_key}",
+                "Content-Type": "application/json",
+            }
+            payload = {
+                "url": url,
+                "formats": ["markdown"]
+            }
+            if self.http_client is not None:
+                response = await self._firecrawl_scrape(self.http_client, payload, headers)
+            else:
+                async with httpx.AsyncClient() as client:
+                    response = await self._firecrawl_scrape(client, payload, headers)
+            response.raise_for_status()
+            data = response.json()
 
             # Format the response
             formatted_result = {
@@ -300,6 +324,15 @@ class WebSearchTool(Tool):
                 simplified_message += "..."
             return self.fail_response(simplified_message)
 
+    async def _firecrawl_scrape(self, client: httpx.AsyncClient, payload: dict, headers: dict) -> httpx.Response:
+        """Call the Firecrawl scrape endpoint."""
+        return await client.post(
+            f"{self.firecrawl_url}/v1/scrape",
+            json=payload,
+            headers=headers,
+            timeout=60,
+        )
+
 
 if __name__ == "__main__":
     import asyncio
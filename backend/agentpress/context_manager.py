@@ -5,10 +5,14 @@ This module handles token counting and thread summarization to prevent
 reaching the context window limitations of LLM models.
 """
 
+import asyncio
 import json
-from typing import List, Dict, Any, Optional
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple
 
 from litellm import token_counter, completion, completion_cost
+from agentpress.message_cache import get_thread_message_cache, summary_view_filter
+from agentpress.token_counts import message_token_counter
 from services.supabase import DBConnection
 from services.llm import make_llm_api_call
 from utils.logger import logger
@@ -18,6 +22,19 @@ DEFAULT_TOKEN_THRESHOLD = 120000  # 80k tokens threshold for summarization
 SUMMARY_TARGET_TOKENS = 10000    # Target ~10k tokens for the summary message
 RESERVE_TOKENS = 5000            # Reserve tokens for new messages
 
+# Background compaction
+COMPACTION_WATERMARK = 0.7       # Start compacting at this fraction of the token threshold
+COMPACTION_KEEP_TOKENS = 30000   # Recent context left verbatim after compaction
+COMPACTION_MIN_KEEP_MESSAGES = 4 # Always keep at least this many recent messages
+SUMMARY_BOUNDARY_OFFSET = timedelta(microseconds=1) # Summary created_at, after the last summarized message
+
+# Threads with a compaction in progress, shared by all ContextManagers in the process
+_compaction_tasks: Dict[str, asyncio.Task] = {}
+
+def _row_time(row: Dict[str, Any]) -> datetime:
+    """Parse the created_at of a message row."""
+    return datetime.fromisoformat(row['created_at'].replace('Z', '+00:00'))
+
 class ContextManager:
     """Manages thread context including token counting and summarization."""
     
@@ -29,6 +46,7 @@ class ContextManager:
         """
         self.db = DBConnection()
         self.token_threshold = token_threshold
+        self.compaction_watermark = int(token_threshold * COMPACTION_WATERMARK)
     
     async def get_thread_token_count(self, thread_id: str) -> int:
         """Get the current token count for a thread using LiteLLM.
@@ -43,15 +61,15 @@ class ContextManager:
         
         try:
             # Get messages for the thread
-            messages = await self.get_messages_for_summarization(thread_id)
+            messages, message_ids = await self._get_messages_with_ids_for_summarization(thread_id)
             
             if not messages:
                 logger.debug(f"No messages found for thread {thread_id}")
                 return 0
             
-            # Use litellm's token_counter for accurate model-specific counting
-            # This is much more accurate than the SQL-based estimation
-            token_count = token_counter(model="gpt-4", messages=messages)
+            # Use litellm's token_counter for accurate model-specific counting,
+            # cached per message so only new messages are tokenized
+            token_count = message_token_counter.count_messages(messages, "gpt-4", message_ids)
             
             logger.info(f"Thread {thread_id} has {token_count} tokens (calculated with litellm)")
             return token_count
@@ -73,6 +91,11 @@ class ContextManager:
         Returns:
             List of message objects to summarize
         """
+        messages, _ = await self._get_messages_with_ids_for_summarization(thread_id)
+        return messages
+
+    async def _get_messages_with_ids_for_summarization(self, thread_id: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Get the messages to summarize along with their message IDs."""
         logger.debug(f"Getting messages for summarization for thread {thread_id}")
         client = await self.db.client
         
@@ -109,6 +132,7 @@ class ContextManager:
             
             # Parse the message content if needed
             messages = []
+            message_ids = []
             for msg in messages_result.data:
                 # Skip existing summary messages - we don't want to summarize summaries
                 if msg.get('type') == 'summary':
@@ -131,13 +155,14 @@ class ContextManager:
                         content = {'role': role, 'content': content}
                 
                 messages.append(content)
+                message_ids.append(msg.get('message_id'))
             
             logger.info(f"Got {len(messages)} messages to summarize for thread {thread_id}")
-            return messages
+            return messages, message_ids
             
         except Exception as e:
             logger.error(f"Error getting messages for summarization: {str(e)}", exc_info=True)
-            return []
+            return [], []
     
     async def create_summary(
         self, 
@@ -295,4 +320,132 @@ The above is a summary of the conversation history. The conversation continues b
                 
         except Exception as e:
             logger.error(f"Error in check_and_summarize_if_needed: {str(e)}", exc_info=True)
-            return False 
\ No newline at end of file
+            return False 
+
+    def schedule_compaction(self, thread_id: str, token_count: int, model: str) -> bool:
+        """Start a background compaction if the thread has passed the soft watermark.
+
+        Never blocks: the summary is generated in a background task and the
+        next message fetch picks up the compacted view once it is stored.
+
+        Args:
+            thread_id: ID of the thread
+            token_count: Current token count of the thread's LLM context
+            model: Model used to count tokens and generate the summary
+
+        Returns:
+            True if a compaction task was started
+        """
+        if token_count < self.compaction_watermark:
+            return False
+        running = _compaction_tasks.get(thread_id)
+        if running and not running.done():
+            return False
+
+        logger.info(f"Thread {thread_id} passed compaction watermark ({token_count} >= {self.compaction_watermark}), compacting in background")
+        task = asyncio.create_task(self.compact_thread(thread_id, model))
+        _compaction_tasks[thread_id] = task
+        task.add_done_callback(lambda t: _compaction_tasks.pop(thread_id, None) if _compaction_tasks.get(thread_id) is t else None)
+        return True
+
+    async def compact_thread(self, thread_id: str, model: str) -> bool:
+        """Summarize the older part of a thread and move the summary boundary.
+
+        The latest summary and older messages are summarized, while the most
+        recent messages (up to COMPACTION_KEEP_TOKENS) stay verbatim. The summary
+        row is inserted with a created_at just after the last summarized message
+        (and strictly before the first kept one, so no LLM message shares its
+        timestamp), so a single insert moves the boundary and everything newer
+        stays visible.
+
+        Args:
+            thread_id: ID of the thread to compact
+            model: Model used to count tokens and generate the summary
+
+        Returns:
+            True if a summary was stored
+        """
+        try:
+            client = await self.db.client
+            rows = await self._get_llm_view_rows(thread_id)
+            messages = [self._parse_row_content(row) for row in rows]
+
+            # Walk back from the newest message until the keep budget is used up
+            kept_tokens = 0
+            cutoff = len(rows)
+            while cutoff > 0:
+                tokens = message_token_counter.count_message(messages[cutoff - 1], model, rows[cutoff - 1]['message_id'])
+                if len(rows) - cutoff >= COMPACTION_MIN_KEEP_MESSAGES and kept_tokens + tokens > COMPACTION_KEEP_TOKENS:
+                    break
+                kept_tokens += tokens
+                cutoff -= 1
+            # Don't separate tool results from the assistant message that called them, and
+            # leave room for the summary's created_at before the first kept message
+            while 0 < cutoff < len(rows) and (
+                messages[cutoff].get('role') == 'tool'
+                or _row_time(rows[cutoff]) - _row_time(rows[cutoff - 1]) <= SUMMARY_BOUNDARY_OFFSET
+            ):
+                cutoff -= 1
+
+            if cutoff < 3:
+                logger.info(f"Thread {thread_id} has too few older messages ({cutoff}) to compact")
+                return False
+
+            summary = await self.create_summary(thread_id, messages[:cutoff], model)
+            if not summary:
+                logger.error(f"Failed to create compaction summary for thread {thread_id}")
+                return False
+
+            # Strictly after the last summarized message and before the first kept one
+            boundary = _row_time(rows[cutoff - 1]) + SUMMARY_BOUNDARY_OFFSET
+            await client.table('messages').insert({
+                'thread_id': thread_id,
+                'type': 'summary',
+                'content': json.dumps(summary),
+                'is_llm_message': True,
+                'metadata': json.dumps({
+                    "compacted_messages": cutoff,
+                    "summarized_until": rows[cutoff - 1]['message_id'],
+                    "kept_tokens": kept_tokens
+                }),
+                'created_at': boundary.isoformat(),
+                'updated_at': boundary.isoformat(),
+            }).execute()
+
+            get_thread_message_cache().invalidate(thread_id)
+            logger.info(f"Compacted {cutoff} messages of thread {thread_id}, keeping {len(rows) - cutoff} recent messages")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error compacting thread {thread_id}: {str(e)}", exc_info=True)
+            return False
+
+    async def _get_llm_view_rows(self, thread_id: str) -> List[Dict[str, Any]]:
+        """Get the rows of the thread's current LLM view: the latest summary and everything after it."""
+        client = await self.db.client
+        summary_result = await client.table('messages').select('message_id, created_at') \
+            .eq('thread_id', thread_id) \
+            .eq('type', 'summary') \
+            .eq('is_llm_message', True) \
+            .order('created_at', desc=True) \
+            .limit(1) \
+            .execute()
+
+        query = client.table('messages').select('message_id, type, content, created_at') \
+            .eq('thread_id', thread_id) \
+            .eq('is_llm_message', True)
+        if summary_result.data:
+            query = query.or_(summary_view_filter(summary_result.data[0]))
+        result = await query.order('created_at').execute()
+        return result.data or []
+
+    @staticmethod
+    def _parse_row_content(row: Dict[str, Any]) -> Dict[str, Any]:
+        """Parse the stored content of a message row."""
+        content = row['content']
+        if isinstance(content, str):
+            try:
+                content = json.loads(content)
+            except json.JSONDecodeError:
+                content = {'role': 'user', 'content': content}
+        return content
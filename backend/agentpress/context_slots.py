@@ -0,0 +1,101 @@
+"""
+Ephemeral per-thread context slots for AgentPress.
+
+Some tools produce context that only the next LLM call needs, like the browser
+tool's page state (with a base64 screenshot) or an image loaded by the vision
+tool. Stored as messages, each one costs an insert, a select and a delete and
+pushes megabytes of base64 through PostgREST. Instead, tools put it in a named
+slot of the thread, which is held in process memory and mirrored to Redis with
+a TTL, and the agent loop consumes (reads and clears) the slot before its next
+LLM call. Only the latest value of a slot is kept.
+"""
+
+import asyncio
+import json
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from services import redis
+from utils.config import config
+from utils.logger import logger
+
+REDIS_KEY_PREFIX = "thread_context"
+
+
+class ThreadContextSlots:
+    """Latest unconsumed value of each context slot, by thread."""
+
+    def __init__(self, ttl: int):
+        """Initialize the slots.
+
+        Args:
+            ttl: Seconds an unconsumed value is kept
+        """
+        self.ttl = ttl
+        # (thread_id, slot) -> (value, monotonic expiry)
+        self._local: Dict[Tuple[str, str], Tuple[Dict[str, Any], float]] = {}
+
+    async def put(self, thread_id: str, slot: str, value: Dict[str, Any]) -> None:
+        """Set a slot of a thread, replacing any unconsumed value.
+
+        Args:
+            thread_id: The thread
+            slot: Slot name, e.g. "browser_state"
+            value: JSON-serializable value
+        """
+        self._prune()
+        self._local[(thread_id, slot)] = (value, time.monotonic() + self.ttl)
+        try:
+            await redis.set(f"{REDIS_KEY_PREFIX}:{thread_id}:{slot}", json.dumps(value), ex=self.ttl)
+        except Exception as e:
+            # The in-process value still serves runs on this worker
+            logger.warning(f"Failed to store {slot} context of thread {thread_id} in Redis: {str(e)}")
+
+    async def consume(self, thread_id: str, slot: str) -> Optional[Dict[str, Any]]:
+        """Get and clear a slot of a thread.
+
+        Returns:
+            The slot's value, or None if it is empty or expired
+        """
+        local = self._local.pop((thread_id, slot), None)
+        try:
+            shared = await redis.getdel(f"{REDIS_KEY_PREFIX}:{thread_id}:{slot}")
+        except Exception as e:
+            logger.warning(f"Failed to consume {slot} context of thread {thread_id} from Redis: {str(e)}")
+            shared = None
+
+        if local is not None and local[1] > time.monotonic():
+            return local[0]
+        if shared:
+            try:
+                return json.loads(shared)
+            except Exception as e:
+                logger.error(f"Error parsing {slot} context of thread {thread_id}: {e}")
+        return None
+
+    async def consume_many(self, thread_id: str, slots: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Get and clear several slots of a thread concurrently.
+
+        Returns:
+            Dict mapping slot names to their values (None for empty slots)
+        """
+        slots = list(slots)
+        values = await asyncio.gather(*(self.consume(thread_id, slot) for slot in slots))
+        return dict(zip(slots, values))
+
+    def _prune(self) -> None:
+        """Drop expired values of threads that never consumed them."""
+        now = time.monotonic()
+        for key in [key for key, (_, expires_at) in self._local.items() if expires_at <= now]:
+            del self._local[key]
+
+
+_context_slots: Optional[ThreadContextSlots] = None
+
+
+def get_thread_context_slots() -> ThreadContextSlots:
+    """Get the process-wide thread context slots."""
+    global _context_slots
+    if _context_slots is None:
+        _context_slots = ThreadContextSlots(ttl=config.THREAD_CONTEXT_TTL)
+    return _context_slots
@@ -0,0 +1,274 @@
+"""
+Normalization of images before they are sent to an LLM.
+
+Browser screenshots and images loaded with `see_image` are inlined into the
+prompt as base64. Sent as-is they are often larger than the model uses: the
+provider downscales them anyway, but only after the full request body has been
+uploaded, and image tokens are billed on the size the model sees. Each image
+is therefore normalized for the target model before submission:
+
+- downscaled to fit the model family's resolution limits (longest edge and
+  total pixels), honouring the EXIF orientation;
+- re-encoded as IMAGE_FORMAT ("webp" or "jpeg") at IMAGE_QUALITY, dropping
+  EXIF and other metadata; if that does not make an image that needs no
+  downscaling smaller, the original is kept;
+- given a perceptual hash (dHash), so callers can tell when an image looks
+  the same as one they sent before;
+- cached by content hash and target, so an image seen on several steps is
+  processed once.
+
+Decoding and encoding run on a pool of IMAGE_WORKERS threads (Pillow releases
+the GIL while it works), so the event loop is not blocked. With
+IMAGE_NORMALIZATION_ENABLED off the original image is used, but still hashed.
+Without Pillow, or if an image cannot be decoded, the original image is used
+and has no perceptual hash.
+"""
+
+import asyncio
+import base64
+import binascii
+import hashlib
+import io
+import math
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from utils.config import config
+from utils.logger import logger
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Images are then sent unchanged
+    Image = None
+    ImageOps = None
+
+# Formats every supported provider accepts, by Pillow format name
+ACCEPTED_FORMATS = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp", "GIF": "image/gif"}
+
+# dHash grid; the hash has width * height bits. Coarser grids (e.g. 8x8) cannot
+# tell apart pages of text, which all shrink to the same gray stripes.
+PERCEPTUAL_HASH_WIDTH = 64
+PERCEPTUAL_HASH_HEIGHT = 48
+
+# Normalized images kept in the cache
+CACHE_MAX_ENTRIES = 64
+CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+
+@dataclass(frozen=True)
+class ImageTarget:
+    """Resolution an LLM uses for images.
+
+    Attributes:
+        max_edge: Longest edge in pixels
+        max_pixels: Total pixels
+    """
+    max_edge: int
+    max_pixels: int
+
+
+# Larger images are downscaled by the provider; by model name substring, first match wins
+IMAGE_TARGETS = (
+    ("claude", ImageTarget(max_edge=1568, max_pixels=1_150_000)),
+    ("gpt", ImageTarget(max_edge=2048, max_pixels=768 * 2048)),
+    ("gemini", ImageTarget(max_edge=1536, max_pixels=1536 * 1536)),
+)
+DEFAULT_IMAGE_TARGET = ImageTarget(max_edge=1568, max_pixels=1_150_000)
+
+
+def get_image_target(model_name: str) -> ImageTarget:
+    """Get the image resolution limits for a model."""
+    model_name = (model_name or "").lower()
+    for pattern, target in IMAGE_TARGETS:
+        if pattern in model_name:
+            return target
+    return DEFAULT_IMAGE_TARGET
+
+
+@dataclass
+class NormalizedImage:
+    """An image ready to be inlined into a prompt.
+
+    Attributes:
+        mime_type: MIME type of the image data
+        base64: Base64-encoded image data
+        original_bytes: Size of the input image
+        bytes: Size of the normalized image
+        perceptual_hash: dHash of the image, if it could be decoded
+    """
+    mime_type: str
+    base64: str
+    original_bytes: int
+    bytes: int
+    perceptual_hash: Optional[int] = None
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.base64}"
+
+
+def _scaled_size(width: int, height: int, target: ImageTarget) -> Tuple[int, int]:
+    scale = min(1.0, target.max_edge / max(width, height), math.sqrt(target.max_pixels / (width * height)))
+    if scale >= 1.0:
+        return width, height
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def hash_distance(a: int, b: int) -> int:
+    """Number of differing bits between two perceptual hashes."""
+    return bin(a ^ b).count("1")
+
+
+def _difference_hash(image: "Image.Image") -> int:
+    """dHash: whether each pixel of a small grayscale thumbnail is brighter than its right neighbour."""
+    thumbnail = image.convert("L").resize((PERCEPTUAL_HASH_WIDTH + 1, PERCEPTUAL_HASH_HEIGHT), Image.BILINEAR)
+    pixels = thumbnail.tobytes()
+    value = 0
+    for row in range(PERCEPTUAL_HASH_HEIGHT):
+        offset = row * (PERCEPTUAL_HASH_WIDTH + 1)
+        for col in range(PERCEPTUAL_HASH_WIDTH):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def _normalize(data: bytes, target: ImageTarget, output_format: str, quality: int, reencode: bool) -> Tuple[bytes, str, int]:
+    """Hash, downscale and re-encode an image; runs in the worker pool.
+
+    Returns:
+        (image bytes, MIME type, perceptual hash). The bytes and MIME type are
+        those of the original if re-encoding is off or does not make it smaller.
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        source_format = source.format
+        image = ImageOps.exif_transpose(source)
+        perceptual_hash = _difference_hash(image)
+        if not reencode and source_format in ACCEPTED_FORMATS:
+            return data, ACCEPTED_FORMATS[source_format], perceptual_hash
+
+        size = _scaled_size(image.width, image.height, target)
+        resized = size != (image.width, image.height)
+
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+        if output_format == "jpeg" or not has_alpha:
+            if has_alpha:
+                # JPEG has no alpha channel; flatten onto white
+                rgba = image.convert("RGBA")
+                image = Image.new("RGB", rgba.size, (255, 255, 255))
+                image.paste(rgba, mask=rgba.getchannel("A"))
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+        elif image.mode != "RGBA":
+            image = image.convert("RGBA")
+
+        if resized:
+            image = image.resize(size, Image.LANCZOS)
+
+        out = io.BytesIO()
+        if output_format == "webp":
+            image.save(out, format="WEBP", quality=quality, method=4)
+            mime_type = "image/webp"
+        else:
+            image.save(out, format="JPEG", quality=quality, optimize=True)
+            mime_type = "image/jpeg"
+        encoded = out.getvalue()
+
+    if not resized and source_format in ACCEPTED_FORMATS and len(encoded) >= len(data):
+        return data, ACCEPTED_FORMATS[source_format], perceptual_hash
+    return encoded, mime_type, perceptual_hash
+
+
+def _unchanged(data: bytes, mime_type: str) -> NormalizedImage:
+    return NormalizedImage(mime_type, base64.b64encode(data).decode("utf-8"), len(data), len(data))
+
+
+class ImagePipeline:
+    """Normalizes images for LLM submission on a worker pool, caching results."""
+
+    def __init__(self, workers: int, output_format: str, quality: int):
+        """Initialize the pipeline.
+
+        Args:
+            workers: Number of worker threads
+            output_format: "webp" or "jpeg"
+            quality: Encoder quality (1-100)
+        """
+        self.output_format = output_format
+        self.quality = quality
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image")
+        self._cache: "OrderedDict[Tuple[str, ImageTarget], NormalizedImage]" = OrderedDict()
+        self._cache_bytes = 0
+
+    async def normalize(self, data: bytes, mime_type: str, model_name: str) -> NormalizedImage:
+        """Normalize an image for a model.
+
+        Args:
+            data: Image data
+            mime_type: MIME type of the data, used if the original image is kept
+            model_name: Model the image is sent to
+
+        Returns:
+            The normalized image, or the original if it cannot be improved
+        """
+        if Image is None:
+            return _unchanged(data, mime_type)
+
+        target = get_image_target(model_name)
+        key = (hashlib.sha256(data).hexdigest(), target)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            return cached
+
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                self._executor, _normalize, data, target, self.output_format, self.quality, config.IMAGE_NORMALIZATION_ENABLED
+            )
+        except Exception as e:
+            logger.warning(f"Could not normalize {mime_type} image of {len(data)} bytes, sending it unchanged: {str(e)}")
+            result = None
+
+        if result is None:
+            normalized = _unchanged(data, mime_type)
+        else:
+            encoded, encoded_mime_type, perceptual_hash = result
+            normalized = NormalizedImage(encoded_mime_type, base64.b64encode(encoded).decode("utf-8"), len(data), len(encoded), perceptual_hash)
+            logger.debug(f"Normalized {mime_type} image for {model_name}: {len(data)} -> {len(encoded)} bytes")
+
+        self._put(key, normalized)
+        return normalized
+
+    async def normalize_base64(self, base64_data: str, mime_type: str, model_name: str) -> NormalizedImage:
+        """Normalize a base64-encoded image for a model; see normalize."""
+        try:
+            data = base64.b64decode(base64_data, validate=True)
+        except (binascii.Error, ValueError) as e:
+            logger.warning(f"Invalid base64 {mime_type} image, sending it unchanged: {str(e)}")
+            return NormalizedImage(mime_type, base64_data, len(base64_data), len(base64_data))
+        return await self.normalize(data, mime_type, model_name)
+
+    def _put(self, key: Tuple[str, ImageTarget], image: NormalizedImage) -> None:
+        size = len(image.base64)
+        if size > CACHE_MAX_BYTES:
+            return
+        previous = self._cache.pop(key, None)
+        if previous is not None:
+            self._cache_bytes -= len(previous.base64)
+        self._cache[key] = image
+        self._cache_bytes += size
+        while len(self._cache) > CACHE_MAX_ENTRIES or self._cache_bytes > CACHE_MAX_BYTES:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= len(evicted.base64)
+
+
+_pipeline: Optional[ImagePipeline] = None
+
+
+def get_image_pipeline() -> ImagePipeline:
+    """Get the process-wide image pipeline."""
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = ImagePipeline(workers=config.IMAGE_WORKERS, output_format=config.IMAGE_FORMAT, quality=config.IMAGE_QUALITY)
+    return _pipeline
@@ -0,0 +1,185 @@
+"""
+Write-behind message persistence for AgentPress threads.
+
+Instead of awaiting one PostgREST insert per message, rows are built locally
+(with their message_id), queued per thread and flushed to the messages table in
+ordered batches through the `insert_messages` RPC, which assigns created_at from
+the database clock in queue order. Callers get the row (without created_at)
+immediately.
+
+A batch that still fails after MAX_FLUSH_RETRIES attempts is kept at the head of
+its thread's queue and retried by the next flush, and `flush()` raises
+MessagePersistenceError, so a caller that flushes before reading the thread back
+(like the agent loop) fails instead of silently continuing without the messages.
+"""
+
+import asyncio
+import json
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Set, Union
+
+from services.supabase import DBConnection
+from utils.logger import logger
+from utils import tracing
+
+DEFAULT_MAX_BATCH_SIZE = 50
+DEFAULT_FLUSH_INTERVAL_MS = 100
+MAX_FLUSH_RETRIES = 3
+
+
+class MessagePersistenceError(Exception):
+    """Queued messages could not be written to the database."""
+    pass
+
+
+class MessageWriteBuffer:
+    """Per-thread write-behind buffer for the messages table.
+
+    Rows for a thread are written in the order they were queued. A batch is
+    flushed when it reaches max_batch_size, after flush_interval_ms, or when
+    `flush()` is called (e.g. before reading the thread back from the database).
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        flush_interval_ms: int = DEFAULT_FLUSH_INTERVAL_MS,
+        on_saved: Optional[Callable[[Dict[str, Any]], None]] = None
+    ):
+        """Initialize the buffer.
+
+        Args:
+            max_batch_size: Number of queued rows that triggers an immediate flush
+            flush_interval_ms: Maximum time a row waits before being flushed
+            on_saved: Called with each persisted row (including its created_at), in order
+        """
+        self.db = DBConnection()
+        self.max_batch_size = max_batch_size
+        self.flush_interval_ms = flush_interval_ms
+        self.on_saved = on_saved
+        self._pending: Dict[str, List[Dict[str, Any]]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._timers: Dict[str, asyncio.Task] = {}
+        self._background_tasks: Set[asyncio.Task] = set()
+
+    def build_row(
+        self,
+        thread_id: str,
+        type: str,
+        content: Union[Dict[str, Any], List[Any], str],
+        is_llm_message: bool = False,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Build a messages row with a locally assigned ID; created_at is assigned on insert."""
+        return {
+            'message_id': str(uuid.uuid4()),
+            'thread_id': thread_id,
+            'type': type,
+            'content': json.dumps(content) if isinstance(content, (dict, list)) else content,
+            'is_llm_message': is_llm_message,
+            'metadata': json.dumps(metadata or {}),
+        }
+
+    def enqueue(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue a row for persistence and schedule a flush for its thread.
+
+        Args:
+            row: Row built with `build_row`
+
+        Returns:
+            The queued row
+        """
+        thread_id = row['thread_id']
+        queue = self._pending.setdefault(thread_id, [])
+        queue.append(row)
+
+        if len(queue) >= self.max_batch_size:
+            task = asyncio.create_task(self._flush_in_background(thread_id))
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+        elif thread_id not in self._timers:
+            self._timers[thread_id] = asyncio.create_task(self._flush_after_interval(thread_id))
+
+        return row
+
+    def pending_count(self, thread_id: Optional[str] = None) -> int:
+        """Number of rows not yet persisted for a thread (or all threads)."""
+        if thread_id:
+            return len(self._pending.get(thread_id, []))
+        return sum(len(rows) for rows in self._pending.values())
+
+    async def _flush_after_interval(self, thread_id: str) -> None:
+        """Flush a thread once the flush interval has elapsed."""
+        try:
+            await asyncio.sleep(self.flush_interval_ms / 1000)
+            # Drop the timer first so rows queued during the flush schedule a new one
+            self._timers.pop(thread_id, None)
+            await self._flush_in_background(thread_id)
+        except asyncio.CancelledError:
+            self._timers.pop(thread_id, None)
+
+    async def _flush_in_background(self, thread_id: str) -> None:
+        """Flush a thread, logging instead of raising; failed rows stay queued."""
+        try:
+            await self.flush(thread_id)
+        except Exception as e:
+            logger.error(f"Background flush failed for thread {thread_id}: {str(e)}", exc_info=True)
+
+    async def flush(self, thread_id: Optional[str] = None) -> None:
+        """Write all queued rows for a thread (or every thread) to the database.
+
+        Args:
+            thread_id: Thread to flush, or None to flush all threads
+
+        Raises:
+            MessagePersistenceError: A batch could not be written; its rows stay queued
+        """
+        thread_ids = [thread_id] if thread_id else list(self._pending.keys())
+        errors = []
+        for tid in thread_ids:
+            lock = self._locks.setdefault(tid, asyncio.Lock())
+            async with lock:
+                batch = self._pending.pop(tid, [])
+                if not batch:
+                    continue
+                try:
+                    await self._write_batch(tid, batch)
+                except MessagePersistenceError as e:
+                    # Keep the rows, ahead of any queued since, for the next flush
+                    self._pending[tid] = batch + self._pending.get(tid, [])
+                    errors.append(e)
+        if errors:
+            raise errors[0]
+
+    async def _write_batch(self, thread_id: str, batch: List[Dict[str, Any]]) -> None:
+        """Insert a batch of rows in one request, retrying transient failures."""
+        client = await self.db.client
+        last_error = None
+
+        for retry in range(MAX_FLUSH_RETRIES):
+            try:
+                with tracing.span("db.insert_messages", thread_id=thread_id, rows=len(batch)):
+                    result = await client.rpc('insert_messages', {'p_messages': batch}).execute()
+                logger.info(f"Flushed {len(batch)} messages to thread {thread_id}")
+                break
+            except Exception as e:
+                last_error = e
+                logger.warning(f"Failed to flush {len(batch)} messages for thread {thread_id} (retry {retry}): {str(e)}")
+                if retry < MAX_FLUSH_RETRIES - 1:
+                    await asyncio.sleep(0.5 * (2 ** retry))
+        else:
+            raise MessagePersistenceError(
+                f"Failed to save {len(batch)} messages for thread {thread_id} after {MAX_FLUSH_RETRIES} attempts: {str(last_error)}"
+            ) from last_error
+
+        if self.on_saved:
+            for row in result.data or []:
+                if isinstance(row, dict):
+                    self.on_saved(row)
+
+    async def close(self) -> None:
+        """Flush everything and cancel scheduled flushes."""
+        for task in list(self._timers.values()):
+            task.cancel()
+        self._timers.clear()
+        await self.flush()
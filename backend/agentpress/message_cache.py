@@ -0,0 +1,321 @@
+"""
+Incremental per-thread cache of LLM-visible messages for AgentPress.
+
+Fetching a thread through the `get_llm_formatted_messages` RPC re-downloads and
+re-parses every message on each LLM call. This cache keeps the parsed messages
+of recently used threads in-process (with an optional Redis snapshot tier),
+remembers the last `created_at` it has seen, and afterwards only asks the
+database for newer rows. Messages written through `ThreadManager.add_message`
+are applied directly, and a summary message triggers a full reload so the
+cached view always matches what the RPC would return.
+"""
+
+import asyncio
+import bisect
+import copy
+import json
+from collections import OrderedDict
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from services import redis
+from services.supabase import DBConnection
+from utils.config import config
+from utils.logger import logger
+
+DEFAULT_MAX_THREADS = 100
+REDIS_SNAPSHOT_TTL = 3600
+# Rows committed by other writers may carry slightly older timestamps than rows
+# applied locally, so incremental fetches look back this far and skip known IDs
+CURSOR_LOOKBACK = timedelta(seconds=5)
+
+MESSAGE_COLUMNS = 'message_id, type, content, created_at'
+
+
+def _parse_timestamp(value: str) -> datetime:
+    """Parse a Postgres/ISO timestamp string."""
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def summary_view_filter(summary: Dict[str, Any]) -> str:
+    """PostgREST `or` filter for a thread's LLM view: the summary row and every row after it.
+
+    Matches get_llm_formatted_messages, so a row sharing the summary's created_at
+    is not in the view.
+    """
+    return f'created_at.gt."{summary["created_at"]}",message_id.eq.{summary["message_id"]}'
+
+
+def _parse_content(content: Any) -> Optional[Dict[str, Any]]:
+    """Parse a stored message content value into the LLM message dict."""
+    if isinstance(content, str):
+        try:
+            content = json.loads(content)
+        except json.JSONDecodeError:
+            logger.error(f"Failed to parse message: {content}")
+            return None
+
+    # Ensure tool_calls have properly formatted function arguments
+    if isinstance(content, dict) and content.get('tool_calls'):
+        for tool_call in content['tool_calls']:
+            if isinstance(tool_call, dict) and 'function' in tool_call:
+                if 'arguments' in tool_call['function'] and not isinstance(tool_call['function']['arguments'], str):
+                    tool_call['function']['arguments'] = json.dumps(tool_call['function']['arguments'])
+    return content
+
+
+@dataclass
+class CachedMessage:
+    """A parsed LLM-visible message with its ordering keys.
+
+    Attributes:
+        message_id (str): ID of the message row
+        created_at (str): Creation timestamp of the row (ISO format)
+        type (str): Message type
+        content (Dict[str, Any]): Parsed LLM message
+    """
+    message_id: str
+    created_at: str
+    type: str
+    content: Dict[str, Any]
+
+    @property
+    def sort_key(self):
+        return (_parse_timestamp(self.created_at), self.message_id)
+
+
+@dataclass
+class CachedThread:
+    """Cached messages of one thread.
+
+    Attributes:
+        messages (List[CachedMessage]): Messages in created_at order, starting at the latest summary
+        message_ids (Set[str]): IDs of all cached messages
+        needs_reload (bool): Whether the next read must reload the thread from scratch
+    """
+    messages: List[CachedMessage] = field(default_factory=list)
+    message_ids: Set[str] = field(default_factory=set)
+    needs_reload: bool = False
+
+    def add(self, message: CachedMessage) -> None:
+        """Insert a message in created_at order, ignoring duplicates."""
+        if message.message_id in self.message_ids:
+            return
+        self.message_ids.add(message.message_id)
+        if not self.messages or self.messages[-1].sort_key <= message.sort_key:
+            self.messages.append(message)
+        else:
+            keys = [m.sort_key for m in self.messages]
+            self.messages.insert(bisect.bisect_right(keys, message.sort_key), message)
+
+    @property
+    def cursor(self) -> Optional[str]:
+        """created_at of the newest cached message."""
+        return self.messages[-1].created_at if self.messages else None
+
+
+class ThreadMessageCache:
+    """Process-wide cache of LLM-visible thread messages with incremental refresh.
+
+    Attributes:
+        max_threads (int): Number of threads kept in memory (least recently used are evicted)
+        use_redis (bool): Whether to keep snapshots in Redis for other workers
+        full_loads (int): Number of full thread loads
+        incremental_loads (int): Number of incremental fetches
+    """
+
+    def __init__(self, max_threads: int = DEFAULT_MAX_THREADS, use_redis: bool = False):
+        """Initialize the cache.
+
+        Args:
+            max_threads: Maximum number of threads kept in memory
+            use_redis: Keep a snapshot of each thread in Redis as a second tier
+        """
+        self.db = DBConnection()
+        self.max_threads = max_threads
+        self.use_redis = use_redis
+        self.full_loads = 0
+        self.incremental_loads = 0
+        self._threads: "OrderedDict[str, CachedThread]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def _store(self, thread_id: str, thread: CachedThread) -> None:
+        """Keep a thread in the LRU, evicting the least recently used threads."""
+        self._threads[thread_id] = thread
+        self._threads.move_to_end(thread_id)
+        while len(self._threads) > self.max_threads:
+            evicted_id, _ = self._threads.popitem(last=False)
+            self._locks.pop(evicted_id, None)
+
+    async def get_messages(self, thread_id: str) -> List[Dict[str, Any]]:
+        """Get the LLM-formatted messages of a thread, fetching only what is new.
+
+        Args:
+            thread_id: The ID of the thread
+
+        Returns:
+            List of message dicts, equivalent to the `get_llm_formatted_messages` RPC.
+            The list is a copy and may be modified by the caller.
+        """
+        messages, _ = await self.get_messages_with_ids(thread_id)
+        return messages
+
+    async def get_messages_with_ids(self, thread_id: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Get the LLM-formatted messages of a thread along with their message IDs.
+
+        Args:
+            thread_id: The ID of the thread
+
+        Returns:
+            Tuple of (messages, message_ids) with aligned entries. The messages are a copy.
+        """
+        lock = self._locks.setdefault(thread_id, asyncio.Lock())
+        async with lock:
+            thread = self._threads.get(thread_id)
+            if thread is None and self.use_redis:
+                thread = await self._load_snapshot(thread_id)
+
+            if thread is None or thread.needs_reload:
+                thread = await self._load_full(thread_id)
+            else:
+                thread = await self._load_incremental(thread_id, thread)
+
+            self._store(thread_id, thread)
+            return (
+                copy.deepcopy([message.content for message in thread.messages]),
+                [message.message_id for message in thread.messages]
+            )
+
+    def apply_local(self, row: Dict[str, Any]) -> None:
+        """Apply a message row written by this process to the cached thread.
+
+        Args:
+            row: Message row as returned by `ThreadManager.add_message`
+        """
+        if not row or not row.get('is_llm_message'):
+            return
+        thread = self._threads.get(row.get('thread_id'))
+        if thread is None:
+            return
+
+        if row.get('type') == 'summary':
+            # Everything before the summary drops out of the LLM view
+            thread.needs_reload = True
+            return
+
+        content = _parse_content(copy.deepcopy(row.get('content')))
+        if content is None or not row.get('message_id') or not row.get('created_at'):
+            thread.needs_reload = True
+            return
+        thread.add(CachedMessage(row['message_id'], row['created_at'], row.get('type'), content))
+
+    def invalidate(self, thread_id: str) -> None:
+        """Force the next read of a thread to reload it from the database."""
+        thread = self._threads.get(thread_id)
+        if thread is not None:
+            thread.needs_reload = True
+
+    async def _load_full(self, thread_id: str) -> CachedThread:
+        """Load the latest summary and every LLM message after it."""
+        client = await self.db.client
+        self.full_loads += 1
+
+        summary = await client.table('messages').select('message_id, created_at') \
+            .eq('thread_id', thread_id) \
+            .eq('type', 'summary') \
+            .eq('is_llm_message', True) \
+            .order('created_at', desc=True) \
+            .limit(1) \
+            .execute()
+
+        query = client.table('messages').select(MESSAGE_COLUMNS) \
+            .eq('thread_id', thread_id) \
+            .eq('is_llm_message', True)
+        if summary.data:
+            query = query.or_(summary_view_filter(summary.data[0]))
+        result = await query.order('created_at').execute()
+
+        thread = CachedThread()
+        self._add_rows(thread, result.data or [])
+        logger.debug(f"Loaded {len(thread.messages)} messages for thread {thread_id}")
+        await self._save_snapshot(thread_id, thread)
+        return thread
+
+    async def _load_incremental(self, thread_id: str, thread: CachedThread) -> CachedThread:
+        """Fetch rows newer than the cursor and append them to the cached thread."""
+        if thread.cursor is None:
+            return await self._load_full(thread_id)
+
+        client = await self.db.client
+        self.incremental_loads += 1
+
+        since = _parse_timestamp(thread.cursor) - CURSOR_LOOKBACK
+        known_ids = [m.message_id for m in reversed(thread.messages) if m.sort_key[0] >= since]
+
+        # Also pick up summaries placed behind the cursor (background compaction moves
+        # the boundary to an older position), as long as they are newer than ours
+        boundary = thread.messages[0].created_at
+        query = client.table('messages').select(MESSAGE_COLUMNS) \
+            .eq('thread_id', thread_id) \
+            .eq('is_llm_message', True) \
+            .or_(f'created_at.gte."{since.isoformat()}",and(type.eq.summary,created_at.gt."{boundary}")')
+        if known_ids:
+            query = query.not_.in_('message_id', known_ids)
+        result = await query.order('created_at').execute()
+        rows = result.data or []
+
+        if any(row.get('type') == 'summary' for row in rows):
+            logger.debug(f"Summary found for thread {thread_id}, reloading messages")
+            return await self._load_full(thread_id)
+
+        if rows:
+            self._add_rows(thread, rows)
+            logger.debug(f"Fetched {len(rows)} new messages for thread {thread_id}")
+            await self._save_snapshot(thread_id, thread)
+        return thread
+
+    def _add_rows(self, thread: CachedThread, rows: List[Dict[str, Any]]) -> None:
+        """Parse database rows into a cached thread."""
+        for row in rows:
+            content = _parse_content(row.get('content'))
+            if content is not None:
+                thread.add(CachedMessage(row['message_id'], row['created_at'], row.get('type'), content))
+
+    async def _load_snapshot(self, thread_id: str) -> Optional[CachedThread]:
+        """Load a thread snapshot from Redis."""
+        try:
+            data = await redis.get(f"thread_messages:{thread_id}")
+            if not data:
+                return None
+            thread = CachedThread()
+            for message in json.loads(data):
+                thread.add(CachedMessage(**message))
+            return thread
+        except Exception as e:
+            logger.warning(f"Failed to load message snapshot for thread {thread_id}: {str(e)}")
+            return None
+
+    async def _save_snapshot(self, thread_id: str, thread: CachedThread) -> None:
+        """Store a thread snapshot in Redis."""
+        if not self.use_redis:
+            return
+        try:
+            await redis.set(
+                f"thread_messages:{thread_id}",
+                json.dumps([asdict(message) for message in thread.messages]),
+                ex=REDIS_SNAPSHOT_TTL
+            )
+        except Exception as e:
+            logger.warning(f"Failed to save message snapshot for thread {thread_id}: {str(e)}")
+
+
+_shared_cache: Optional[ThreadMessageCache] = None
+
+
+def get_thread_message_cache() -> ThreadMessageCache:
+    """Get the process-wide thread message cache, creating it on first use."""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = ThreadMessageCache(use_redis=config.THREAD_MESSAGE_CACHE_REDIS)
+    return _shared_cache
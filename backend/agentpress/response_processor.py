@@ -20,7 +20,12 @@ from litellm import completion_cost, token_counter
 
 from agentpress.tool import Tool, ToolResult
 from agentpress.tool_registry import ToolRegistry
+from agentpress.xml_scanner import XmlToolCallScanner, extract_xml_chunks
+from agentpress.tool_output_store import offload_tool_output
+from services.llm import extract_cache_usage
+from services.llm_replay import is_replay_model
 from utils.logger import logger
+from utils import tracing
 
 # Type alias for XML result adding strategy
 XmlAddingStrategy = Literal["user_message", "assistant_message", "inline_edit"]
@@ -28,6 +33,9 @@ XmlAddingStrategy = Literal["user_message", "assistant_message", "inline_edit"]
 # Type alias for tool execution strategy
 ToolExecutionStrategy = Literal["sequential", "parallel"]
 
+# Type alias for where status events are kept
+StatusEventTier = Literal["persisted", "ephemeral"]
+
 @dataclass
 class ToolExecutionContext:
     """Context for a tool execution including call details, result, and display info."""
@@ -56,6 +64,8 @@ class ProcessorConfig:
         tool_execution_strategy: How to execute multiple tools ("sequential" or "parallel")
         xml_adding_strategy: How to add XML tool results to the conversation
         max_xml_tool_calls: Maximum number of XML tool calls to process (0 = no limit)
+        status_event_tier: Where status events go ("persisted" saves them to the messages table,
+            "ephemeral" only yields them to the run stream; error statuses are always persisted)
     """
 
     xml_tool_calling: bool = True  
@@ -66,6 +76,7 @@ class ProcessorConfig:
     tool_execution_strategy: ToolExecutionStrategy = "sequential"
     xml_adding_strategy: XmlAddingStrategy = "assistant_message"
     max_xml_tool_calls: int = 0  # 0 means no limit
+    status_event_tier: StatusEventTier = "persisted"
     
     def __post_init__(self):
         """Validate configuration after initialization."""
@@ -78,6 +89,9 @@ class ProcessorConfig:
         if self.max_xml_tool_calls < 0:
             raise ValueError("max_xml_tool_calls must be a non-negative integer (0 = no limit)")
 
+        if self.status_event_tier not in ["persisted", "ephemeral"]:
+            raise ValueError("status_event_tier must be 'persisted' or 'ephemeral'")
+
 class ResponseProcessor:
     """Processes LLM responses, extracting and executing tool calls."""
     
@@ -114,13 +128,14 @@ class ResponseProcessor:
         """
         accumulated_content = ""
         tool_calls_buffer = {}
-        current_xml_content = ""
+        xml_scanner = XmlToolCallScanner(self.tool_registry.xml_tools.keys())
         xml_chunks_buffer = []
         pending_tool_executions = []
         yielded_tool_indices = set() # Stores indices of tools whose *status* has been yielded
         tool_index = 0
         xml_tool_call_count = 0
         finish_reason = None
+        usage = None # Set from the final chunk when usage is requested (stream_options)
         last_assistant_message_object = None # Store the final saved assistant message object
         tool_result_message_objects = {} # tool_index -> full saved message object
         has_printed_thinking_prefix = False # Flag for printing thinking prefix only once
@@ -133,21 +148,18 @@ class ResponseProcessor:
         try:
             # --- Save and Yield Start Events ---
             start_content = {"status_type": "thread_run_start", "thread_run_id": thread_run_id}
-            start_msg_obj = await self.add_message(
-                thread_id=thread_id, type="status", content=start_content, 
-                is_llm_message=False, metadata={"thread_run_id": thread_run_id}
-            )
+            start_msg_obj = await self._add_status_message(thread_id, start_content, {"thread_run_id": thread_run_id}, config.status_event_tier)
             if start_msg_obj: yield start_msg_obj
 
             assist_start_content = {"status_type": "assistant_response_start"}
-            assist_start_msg_obj = await self.add_message(
-                thread_id=thread_id, type="status", content=assist_start_content, 
-                is_llm_message=False, metadata={"thread_run_id": thread_run_id}
-            )
+            assist_start_msg_obj = await self._add_status_message(thread_id, assist_start_content, {"thread_run_id": thread_run_id}, config.status_event_tier)
             if assist_start_msg_obj: yield assist_start_msg_obj
             # --- End Start Events ---
 
             async for chunk in llm_response:
+                if getattr(chunk, 'usage', None):
+                    usage = chunk.usage
+
                 if hasattr(chunk, 'choices') and chunk.choices and hasattr(chunk.choices[0], 'finish_reason') and chunk.choices[0].finish_reason:
                     finish_reason = chunk.choices[0].finish_reason
                     logger.debug(f"Detected finish_reason: {finish_reason}")
@@ -169,7 +181,6 @@ class ResponseProcessor:
                         chunk_content = delta.content
                         # print(chunk_content, end='', flush=True)
                         accumulated_content += chunk_content
-                        current_xml_content += chunk_content
 
                         if not (config.max_xml_tool_calls > 0 and xml_tool_call_count >= config.max_xml_tool_calls):
                             # Yield ONLY content chunk (don't save)
@@ -186,9 +197,9 @@ class ResponseProcessor:
 
                         # --- Process XML Tool Calls (if enabled and limit not reached) ---
                         if config.xml_tool_calling and not (config.max_xml_tool_calls > 0 and xml_tool_call_count >= config.max_xml_tool_calls):
-                            xml_chunks = self._extract_xml_chunks(current_xml_content)
+                            # Scanner keeps its position between deltas and only returns newly closed chunks
+                            xml_chunks = xml_scanner.feed(chunk_content)
                             for xml_chunk in xml_chunks:
-                                current_xml_content = current_xml_content.replace(xml_chunk, "", 1)
                                 xml_chunks_buffer.append(xml_chunk)
                                 result = self._parse_xml_tool_call(xml_chunk)
                                 if result:
@@ -201,7 +212,7 @@ class ResponseProcessor:
 
                                     if config.execute_tools and config.execute_on_stream:
                                         # Save and Yield tool_started status
-                                        started_msg_obj = await self._yield_and_save_tool_started(context, thread_id, thread_run_id)
+                                        started_msg_obj = await self._yield_and_save_tool_started(context, thread_id, thread_run_id, config.status_event_tier)
                                         if started_msg_obj: yield started_msg_obj
                                         yielded_tool_indices.add(tool_index) # Mark status as yielded
 
@@ -271,7 +282,7 @@ class ResponseProcessor:
                                 )
 
                                 # Save and Yield tool_started status
-                                started_msg_obj = await self._yield_and_save_tool_started(context, thread_id, thread_run_id)
+                                started_msg_obj = await self._yield_and_save_tool_started(context, thread_id, thread_run_id, config.status_event_tier)
                                 if started_msg_obj: yield started_msg_obj
                                 yielded_tool_indices.add(tool_index) # Mark status as yielded
 
@@ -316,7 +327,7 @@ class ResponseProcessor:
                              logger.error(f"Error getting result for pending tool execution {tool_idx}: {str(e)}")
                              context.error = e
                              # Save and Yield tool error status message (even if started was yielded)
-                             error_msg_obj = await self._yield_and_save_tool_error(context, thread_id, thread_run_id)
+                             error_msg_obj = await self._yield_and_save_tool_error(context, thread_id, thread_run_id, config.status_event_tier)
                              if error_msg_obj: yield error_msg_obj
                          continue # Skip further status yielding for this tool index
 
@@ -328,7 +339,7 @@ class ResponseProcessor:
                             tool_results_buffer.append((execution["tool_call"], result, tool_idx, context))
                             # Save and Yield tool completed/failed status
                             completed_msg_obj = await self._yield_and_save_tool_completed(
-                                context, None, thread_id, thread_run_id
+                                context, None, thread_id, thread_run_id, config.status_event_tier
                             )
                             if completed_msg_obj: yield completed_msg_obj
                             yielded_tool_indices.add(tool_idx)
@@ -336,7 +347,7 @@ class ResponseProcessor:
                         logger.error(f"Error getting result/yielding status for pending tool execution {tool_idx}: {str(e)}")
                         context.error = e
                         # Save and Yield tool error status
-                        error_msg_obj = await self._yield_and_save_tool_error(context, thread_id, thread_run_id)
+                        error_msg_obj = await self._yield_and_save_tool_error(context, thread_id, thread_run_id, config.status_event_tier)
                         if error_msg_obj: yield error_msg_obj
                         yielded_tool_indices.add(tool_idx)
 
@@ -344,10 +355,7 @@ class ResponseProcessor:
             # Save and yield finish status if limit was reached
             if finish_reason == "xml_tool_limit_reached":
                 finish_content = {"status_type": "finish", "finish_reason": "xml_tool_limit_reached"}
-                finish_msg_obj = await self.add_message(
-                    thread_id=thread_id, type="status", content=finish_content, 
-                    is_llm_message=False, metadata={"thread_run_id": thread_run_id}
-                )
+                finish_msg_obj = await self._add_status_message(thread_id, finish_content, {"thread_run_id": thread_run_id}, config.status_event_tier)
                 if finish_msg_obj: yield finish_msg_obj
                 logger.info(f"Stream finished with reason: xml_tool_limit_reached after {xml_tool_call_count} XML tool calls")
 
@@ -392,10 +400,7 @@ class ResponseProcessor:
                     logger.error(f"Failed to save final assistant message for thread {thread_id}")
                     # Save and yield an error status
                     err_content = {"role": "system", "status_type": "error", "message": "Failed to save final assistant message"}
-                    err_msg_obj = await self.add_message(
-                        thread_id=thread_id, type="status", content=err_content, 
-                        is_llm_message=False, metadata={"thread_run_id": thread_run_id}
-                    )
+                    err_msg_obj = await self._add_status_message(thread_id, err_content, {"thread_run_id": thread_run_id}, config.status_event_tier)
                     if err_msg_obj: yield err_msg_obj
 
             # --- Process All Tool Results Now ---
@@ -413,9 +418,7 @@ class ResponseProcessor:
                  # Gather XML tool calls from buffer (up to limit)
                 parsed_xml_data = []
                 if config.xml_tool_calling:
-                    # Reparse remaining content just in case (should be empty if processed correctly)
-                    xml_chunks = self._extract_xml_chunks(current_xml_content)
-                    xml_chunks_buffer.extend(xml_chunks)
+                    # The streaming scanner has already emitted every complete chunk into xml_chunks_buffer
                     # Process only chunks not already handled in the stream loop
                     remaining_limit = config.max_xml_tool_calls - xml_tool_call_count if config.max_xml_tool_calls > 0 else len(xml_chunks_buffer)
                     xml_chunks_to_process = xml_chunks_buffer[:remaining_limit] # Ensure limit is respected
@@ -490,7 +493,7 @@ class ResponseProcessor:
 
                         # Yield start status ONLY IF executing non-streamed (already yielded if streamed)
                         if not config.execute_on_stream and tool_idx not in yielded_tool_indices:
-                            started_msg_obj = await self._yield_and_save_tool_started(context, thread_id, thread_run_id)
+                            started_msg_obj = await self._yield_and_save_tool_started(context, thread_id, thread_run_id, config.status_event_tier)
                             if started_msg_obj: yield started_msg_obj
                             yielded_tool_indices.add(tool_idx) # Mark status yielded
 
@@ -504,7 +507,7 @@ class ResponseProcessor:
                         completed_msg_obj = await self._yield_and_save_tool_completed(
                             context,
                             saved_tool_result_object['message_id'] if saved_tool_result_object else None,
-                            thread_id, thread_run_id
+                            thread_id, thread_run_id, config.status_event_tier
                         )
                         if completed_msg_obj: yield completed_msg_obj
                         # Don't add to yielded_tool_indices here, completion status is separate yield
@@ -518,7 +521,9 @@ class ResponseProcessor:
                              # Optionally yield error status for saving failure?
 
             # --- Calculate and Store Cost ---
-            if last_assistant_message_object: # Only calculate if assistant message was saved
+            usage_info = self._log_llm_usage(thread_id, llm_model, usage)
+            # Only calculate if assistant message was saved; replayed responses have no cost
+            if last_assistant_message_object and not is_replay_model(llm_model):
                 try:
                     # Use accumulated_content for streaming cost calculation
                     final_cost = completion_cost(
@@ -531,7 +536,7 @@ class ResponseProcessor:
                         await self.add_message(
                             thread_id=thread_id,
                             type="cost",
-                            content={"cost": final_cost},
+                            content=self._cost_content(final_cost, usage_info),
                             is_llm_message=False, # Cost is metadata
                             metadata={"thread_run_id": thread_run_id} # Keep track of the run
                         )
@@ -545,29 +550,20 @@ class ResponseProcessor:
             # --- Final Finish Status ---
             if finish_reason and finish_reason != "xml_tool_limit_reached":
                 finish_content = {"status_type": "finish", "finish_reason": finish_reason}
-                finish_msg_obj = await self.add_message(
-                    thread_id=thread_id, type="status", content=finish_content, 
-                    is_llm_message=False, metadata={"thread_run_id": thread_run_id}
-                )
+                finish_msg_obj = await self._add_status_message(thread_id, finish_content, {"thread_run_id": thread_run_id}, config.status_event_tier)
                 if finish_msg_obj: yield finish_msg_obj
 
         except Exception as e:
             logger.error(f"Error processing stream: {str(e)}", exc_info=True)
             # Save and yield error status message
             err_content = {"role": "system", "status_type": "error", "message": str(e)}
-            err_msg_obj = await self.add_message(
-                thread_id=thread_id, type="status", content=err_content, 
-                is_llm_message=False, metadata={"thread_run_id": thread_run_id if 'thread_run_id' in locals() else None}
-            )
+            err_msg_obj = await self._add_status_message(thread_id, err_content, {"thread_run_id": thread_run_id if 'thread_run_id' in locals() else None}, config.status_event_tier)
             if err_msg_obj: yield err_msg_obj # Yield the saved error message
 
         finally:
             # Save and Yield the final thread_run_end status
             end_content = {"status_type": "thread_run_end"}
-            end_msg_obj = await self.add_message(
-                thread_id=thread_id, type="status", content=end_content, 
-                is_llm_message=False, metadata={"thread_run_id": thread_run_id if 'thread_run_id' in locals() else None}
-            )
+            end_msg_obj = await self._add_status_message(thread_id, end_content, {"thread_run_id": thread_run_id if 'thread_run_id' in locals() else None}, config.status_event_tier)
             if end_msg_obj: yield end_msg_obj
 
     async def process_non_streaming_response(
@@ -602,10 +598,7 @@ class ResponseProcessor:
         try:
             # Save and Yield thread_run_start status message
             start_content = {"status_type": "thread_run_start", "thread_run_id": thread_run_id}
-            start_msg_obj = await self.add_message(
-                thread_id=thread_id, type="status", content=start_content,
-                is_llm_message=False, metadata={"thread_run_id": thread_run_id}
-            )
+            start_msg_obj = await self._add_status_message(thread_id, start_content, {"thread_run_id": thread_run_id}, config.status_event_tier)
             if start_msg_obj: yield start_msg_obj
 
             # Extract finish_reason, content, tool calls
@@ -661,14 +654,13 @@ class ResponseProcessor:
             else:
                  logger.error(f"Failed to save non-streaming assistant message for thread {thread_id}")
                  err_content = {"role": "system", "status_type": "error", "message": "Failed to save assistant message"}
-                 err_msg_obj = await self.add_message(
-                     thread_id=thread_id, type="status", content=err_content, 
-                     is_llm_message=False, metadata={"thread_run_id": thread_run_id}
-                 )
+                 err_msg_obj = await self._add_status_message(thread_id, err_content, {"thread_run_id": thread_run_id}, config.status_event_tier)
                  if err_msg_obj: yield err_msg_obj
 
             # --- Calculate and Store Cost ---
-            if assistant_message_object: # Only calculate if assistant message was saved
+            usage_info = self._log_llm_usage(thread_id, llm_model, getattr(llm_response, 'usage', None))
+            # Only calculate if assistant message was saved; replayed responses have no cost
+            if assistant_message_object and not is_replay_model(llm_model):
                 try:
                     # Use the full llm_response object for potentially more accurate cost calculation
                     final_cost = None
@@ -690,7 +682,7 @@ class ResponseProcessor:
                         await self.add_message(
                             thread_id=thread_id,
                             type="cost",
-                            content={"cost": final_cost},
+                            content=self._cost_content(final_cost, usage_info),
                             is_llm_message=False, # Cost is metadata
                             metadata={"thread_run_id": thread_run_id} # Keep track of the run
                         )
@@ -719,7 +711,7 @@ class ResponseProcessor:
                     context.result = result
 
                     # Save and Yield start status
-                    started_msg_obj = await self._yield_and_save_tool_started(context, thread_id, thread_run_id)
+                    started_msg_obj = await self._yield_and_save_tool_started(context, thread_id, thread_run_id, config.status_event_tier)
                     if started_msg_obj: yield started_msg_obj
 
                     # Save tool result
@@ -732,7 +724,7 @@ class ResponseProcessor:
                     completed_msg_obj = await self._yield_and_save_tool_completed(
                         context,
                         saved_tool_result_object['message_id'] if saved_tool_result_object else None,
-                        thread_id, thread_run_id
+                        thread_id, thread_run_id, config.status_event_tier
                     )
                     if completed_msg_obj: yield completed_msg_obj
 
@@ -748,31 +740,59 @@ class ResponseProcessor:
             # --- Save and Yield Final Status ---
             if finish_reason:
                 finish_content = {"status_type": "finish", "finish_reason": finish_reason}
-                finish_msg_obj = await self.add_message(
-                    thread_id=thread_id, type="status", content=finish_content, 
-                    is_llm_message=False, metadata={"thread_run_id": thread_run_id}
-                )
+                finish_msg_obj = await self._add_status_message(thread_id, finish_content, {"thread_run_id": thread_run_id}, config.status_event_tier)
                 if finish_msg_obj: yield finish_msg_obj
 
         except Exception as e:
              logger.error(f"Error processing non-streaming response: {str(e)}", exc_info=True)
              # Save and yield error status
              err_content = {"role": "system", "status_type": "error", "message": str(e)}
-             err_msg_obj = await self.add_message(
-                 thread_id=thread_id, type="status", content=err_content, 
-                 is_llm_message=False, metadata={"thread_run_id": thread_run_id if 'thread_run_id' in locals() else None}
-             )
+             err_msg_obj = await self._add_status_message(thread_id, err_content, {"thread_run_id": thread_run_id if 'thread_run_id' in locals() else None}, config.status_event_tier)
              if err_msg_obj: yield err_msg_obj
 
         finally:
              # Save and Yield the final thread_run_end status
             end_content = {"status_type": "thread_run_end"}
-            end_msg_obj = await self.add_message(
-                thread_id=thread_id, type="status", content=end_content, 
-                is_llm_message=False, metadata={"thread_run_id": thread_run_id if 'thread_run_id' in locals() else None}
-            )
+            end_msg_obj = await self._add_status_message(thread_id, end_content, {"thread_run_id": thread_run_id if 'thread_run_id' in locals() else None}, config.status_event_tier)
             if end_msg_obj: yield end_msg_obj
 
+    def _log_llm_usage(self, thread_id: str, llm_model: str, usage: Any) -> Optional[Dict[str, int]]:
+        """Log the token usage of an LLM call, including prompt cache reads and writes.
+
+        Args:
+            thread_id: ID of the thread the call was made for
+            llm_model: Model used for the call
+            usage: Usage object of the response, if the provider returned one
+
+        Returns:
+            Token counts from extract_cache_usage, or None if no usage is available
+        """
+        try:
+            usage_info = extract_cache_usage(usage)
+        except Exception as e:
+            logger.warning(f"Could not read LLM usage for thread {thread_id}: {str(e)}")
+            return None
+        if usage_info is None:
+            return None
+
+        # Depending on the provider, prompt_tokens may or may not include cached tokens
+        total_input = max(usage_info["prompt_tokens"], usage_info["cache_read_tokens"] + usage_info["cache_write_tokens"])
+        hit_rate = (usage_info["cache_read_tokens"] / total_input * 100) if total_input else 0.0
+        logger.info(
+            f"LLM usage for thread {thread_id} ({llm_model}): prompt={usage_info['prompt_tokens']}, "
+            f"completion={usage_info['completion_tokens']}, cache_read={usage_info['cache_read_tokens']}, "
+            f"cache_write={usage_info['cache_write_tokens']} ({hit_rate:.1f}% cache hit)"
+        )
+        return usage_info
+
+    @staticmethod
+    def _cost_content(final_cost: float, usage_info: Optional[Dict[str, int]]) -> Dict[str, Any]:
+        """Build the content of a cost message, with token usage when available."""
+        content = {"cost": final_cost}
+        if usage_info:
+            content["usage"] = usage_info
+        return content
+
     # XML parsing methods
     def _extract_tag_content(self, xml_chunk: str, tag_name: str) -> Tuple[Optional[str], Optional[str]]:
         """Extract content between opening and closing tags, handling nested tags."""
@@ -847,69 +867,13 @@ class ResponseProcessor:
             return None
 
     def _extract_xml_chunks(self, content: str) -> List[str]:
-        """Extract complete XML chunks using start and end pattern matching."""
-        chunks = []
-        pos = 0
-        
+        """Extract complete XML chunks for all registered tags in a single pass."""
         try:
-            while pos < len(content):
-                # Find the next tool tag
-                next_tag_start = -1
-                current_tag = None
-                
-                # Find the earliest occurrence of any registered tag
-                for tag_name in self.tool_registry.xml_tools.keys():
-                    start_pattern = f'<{tag_name}'
-                    tag_pos = content.find(start_pattern, pos)
-                    
-                    if tag_pos != -1 and (next_tag_start == -1 or tag_pos < next_tag_start):
-                        next_tag_start = tag_pos
-                        current_tag = tag_name
-                
-                if next_tag_start == -1 or not current_tag:
-                    break
-                
-                # Find the matching end tag
-                end_pattern = f'</{current_tag}>'
-                tag_stack = []
-                chunk_start = next_tag_start
-                current_pos = next_tag_start
-                
-                while current_pos < len(content):
-                    # Look for next start or end tag of the same type
-                    next_start = content.find(f'<{current_tag}', current_pos + 1)
-                    next_end = content.find(end_pattern, current_pos)
-                    
-                    if next_end == -1:  # No closing tag found
-                        break
-                    
-                    if next_start != -1 and next_start < next_end:
-                        # Found nested start tag
-                        tag_stack.append(next_start)
-                        current_pos = next_start + 1
-                    else:
-                        # Found end tag
-                        if not tag_stack:  # This is our matching end tag
-                            chunk_end = next_end + len(end_pattern)
-                            chunk = content[chunk_start:chunk_end]
-                            chunks.append(chunk)
-                            pos = chunk_end
-                            break
-                        else:
-                            # Pop nested tag
-                            tag_stack.pop()
-                            current_pos = next_end + 1
-                
-                if current_pos >= len(content):  # Reached end without finding closing tag
-                    break
-                
-                pos = max(pos + 1, current_pos)
-        
+            return extract_xml_chunks(content, self.tool_registry.xml_tools.keys())
         except Exception as e:
             logger.error(f"Error extracting XML chunks: {e}")
             logger.error(f"Content was: {content}")
-        
-        return chunks
+            return []
 
     def _parse_xml_tool_call(self, xml_chunk: str) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
         """Parse XML chunk into tool call format and return parsing details.
@@ -1066,7 +1030,9 @@ class ResponseProcessor:
                 return ToolResult(success=False, output=f"Tool function '{function_name}' not found")
             
             logger.debug(f"Found tool function for '{function_name}', executing...")
-            result = await tool_fn(**arguments)
+            with tracing.span("tool.execute", function_name=function_name) as tool_span:
+                result = await tool_fn(**arguments)
+                tool_span.set_attribute("success", getattr(result, 'success', None))
             logger.info(f"Tool execution complete: {function_name} -> {result}")
             return result
         except Exception as e:
@@ -1234,6 +1200,14 @@ class ResponseProcessor:
                 metadata["parsing_details"] = parsing_details
                 logger.info("Adding parsing_details to tool result metadata")
             # ---
+
+            # Keep large outputs out of the thread, leaving a preview and a handle
+            if isinstance(result, ToolResult) and isinstance(result.output, str):
+                preview, handle = await offload_tool_output(result.output)
+                if preview is not result.output:
+                    result = ToolResult(success=result.success, output=preview)
+                    if handle:
+                        metadata["tool_output_handle"] = handle
             
             # Check if this is a native function call (has id field)
             if "id" in tool_call:
@@ -1362,7 +1336,32 @@ class ResponseProcessor:
         
         return context
         
-    async def _yield_and_save_tool_started(self, context: ToolExecutionContext, thread_id: str, thread_run_id: str) -> Optional[Dict[str, Any]]:
+    async def _add_status_message(self, thread_id: str, content: Dict[str, Any], metadata: Dict[str, Any], tier: StatusEventTier = "persisted") -> Optional[Dict[str, Any]]:
+        """Saves a status message, or builds it locally for the ephemeral tier.
+
+        Ephemeral status events are never sent to the LLM, so they are only yielded to
+        the run stream (and end up in the run's response record) instead of being
+        written to the messages table. Error statuses are always persisted.
+        """
+        if tier == "persisted" or content.get("status_type") == "error":
+            return await self.add_message(
+                thread_id=thread_id, type="status", content=content,
+                is_llm_message=False, metadata=metadata
+            )
+
+        timestamp = datetime.now(timezone.utc).isoformat()
+        return {
+            "message_id": str(uuid.uuid4()),
+            "thread_id": thread_id,
+            "type": "status",
+            "is_llm_message": False,
+            "content": json.dumps(content),
+            "metadata": json.dumps({**metadata, "ephemeral": True}),
+            "created_at": timestamp,
+            "updated_at": timestamp
+        }
+
+    async def _yield_and_save_tool_started(self, context: ToolExecutionContext, thread_id: str, thread_run_id: str, tier: StatusEventTier = "persisted") -> Optional[Dict[str, Any]]:
         """Formats, saves, and returns a tool started status message."""
         tool_name = context.xml_tag_name or context.function_name
         content = {
@@ -1372,16 +1371,14 @@ class ResponseProcessor:
             "tool_call_id": context.tool_call.get("id") # Include tool_call ID if native
         }
         metadata = {"thread_run_id": thread_run_id}
-        saved_message_obj = await self.add_message(
-            thread_id=thread_id, type="status", content=content, is_llm_message=False, metadata=metadata
-        )
+        saved_message_obj = await self._add_status_message(thread_id, content, metadata, tier)
         return saved_message_obj # Return the full object (or None if saving failed)
 
-    async def _yield_and_save_tool_completed(self, context: ToolExecutionContext, tool_message_id: Optional[str], thread_id: str, thread_run_id: str) -> Optional[Dict[str, Any]]:
+    async def _yield_and_save_tool_completed(self, context: ToolExecutionContext, tool_message_id: Optional[str], thread_id: str, thread_run_id: str, tier: StatusEventTier = "persisted") -> Optional[Dict[str, Any]]:
         """Formats, saves, and returns a tool completed/failed status message."""
         if not context.result:
             # Delegate to error saving if result is missing (e.g., execution failed)
-            return await self._yield_and_save_tool_error(context, thread_id, thread_run_id)
+            return await self._yield_and_save_tool_error(context, thread_id, thread_run_id, tier)
 
         tool_name = context.xml_tag_name or context.function_name
         status_type = "tool_completed" if context.result.success else "tool_failed"
@@ -1404,12 +1401,10 @@ class ResponseProcessor:
             logger.info(f"Marking tool status for '{context.function_name}' with termination signal.")
         # <<< END ADDED >>>
 
-        saved_message_obj = await self.add_message(
-            thread_id=thread_id, type="status", content=content, is_llm_message=False, metadata=metadata
-        )
+        saved_message_obj = await self._add_status_message(thread_id, content, metadata, tier)
         return saved_message_obj
 
-    async def _yield_and_save_tool_error(self, context: ToolExecutionContext, thread_id: str, thread_run_id: str) -> Optional[Dict[str, Any]]:
+    async def _yield_and_save_tool_error(self, context: ToolExecutionContext, thread_id: str, thread_run_id: str, tier: StatusEventTier = "persisted") -> Optional[Dict[str, Any]]:
         """Formats, saves, and returns a tool error status message."""
         error_msg = str(context.error) if context.error else "Unknown error during tool execution"
         tool_name = context.xml_tag_name or context.function_name
@@ -1422,7 +1417,5 @@ class ResponseProcessor:
         }
         metadata = {"thread_run_id": thread_run_id}
         # Save the status message with is_llm_message=False
-        saved_message_obj = await self.add_message(
-            thread_id=thread_id, type="status", content=content, is_llm_message=False, metadata=metadata
-        )
+        saved_message_obj = await self._add_status_message(thread_id, content, metadata, tier)
         return saved_message_obj
\ No newline at end of file
@@ -0,0 +1,171 @@
+"""
+Content chunk coalescing for AgentPress response streams.
+
+Streaming responses yield one message per LLM delta. This module merges adjacent
+assistant content chunks into larger frames by time window and byte size, so
+that downstream transports (e.g. the Redis run stream) handle a few frames per
+second instead of one per token. Any other message flushes the pending frame
+first, which keeps tool status events in order and delivered without delay.
+"""
+
+import asyncio
+import json
+import time
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from utils.logger import logger
+
+DEFAULT_WINDOW_MS = 40
+DEFAULT_MAX_BYTES = 4096
+
+
+def is_content_chunk(response: Dict[str, Any]) -> bool:
+    """Check whether a response is a transient assistant content chunk."""
+    if response.get('type') != 'assistant' or response.get('message_id') is not None:
+        return False
+    metadata = response.get('metadata')
+    if isinstance(metadata, str):
+        try:
+            metadata = json.loads(metadata)
+        except json.JSONDecodeError:
+            return False
+    return isinstance(metadata, dict) and metadata.get('stream_status') == 'chunk'
+
+
+class ContentChunkCoalescer:
+    """Merges adjacent assistant content chunks from a response generator.
+
+    Attributes:
+        window_ms (int): Maximum time a chunk may wait before its frame is flushed (0 disables merging)
+        max_bytes (int): Frame size in bytes that triggers an immediate flush
+        frames_in (int): Number of content chunks received
+        frames_out (int): Number of merged content frames emitted
+    """
+
+    def __init__(self, window_ms: int = DEFAULT_WINDOW_MS, max_bytes: int = DEFAULT_MAX_BYTES):
+        """Initialize the coalescer.
+
+        Args:
+            window_ms: Time window for merging chunks, in milliseconds
+            max_bytes: Maximum merged frame size in bytes
+        """
+        self.window_ms = window_ms
+        self.max_bytes = max_bytes
+        self.frames_in = 0
+        self.frames_out = 0
+        self._buffer: List[Dict[str, Any]] = []
+        self._texts: List[str] = []
+        self._buffer_bytes = 0
+        self._buffer_started: Optional[float] = None
+        self._first_sequence = 0
+
+    def _add(self, chunk: Dict[str, Any]) -> None:
+        """Add a content chunk to the pending frame."""
+        try:
+            text = json.loads(chunk['content']).get('content', '')
+        except (json.JSONDecodeError, TypeError, AttributeError):
+            text = ''
+        if not self._buffer:
+            self._buffer_started = time.monotonic()
+            self._first_sequence = self.frames_in
+        self._buffer.append(chunk)
+        self._texts.append(text)
+        self._buffer_bytes += len(text.encode('utf-8'))
+        self.frames_in += 1
+
+    def _flush(self) -> Optional[Dict[str, Any]]:
+        """Build a single frame from the pending chunks and reset the buffer."""
+        if not self._buffer:
+            return None
+
+        first = self._buffer[0]
+        try:
+            metadata = json.loads(first.get('metadata') or '{}')
+        except json.JSONDecodeError:
+            metadata = {}
+        # Ordering index of the first merged chunk within this run, plus how many were merged
+        metadata['sequence'] = self._first_sequence
+        metadata['chunk_count'] = len(self._buffer)
+
+        frame = {
+            **first,
+            'content': json.dumps({"role": "assistant", "content": "".join(self._texts)}),
+            'metadata': json.dumps(metadata),
+        }
+
+        self._buffer = []
+        self._texts = []
+        self._buffer_bytes = 0
+        self._buffer_started = None
+        self.frames_out += 1
+        return frame
+
+    def _remaining_window(self) -> Optional[float]:
+        """Seconds left before the pending frame must be flushed, or None if nothing is pending."""
+        if self._buffer_started is None:
+            return None
+        elapsed = time.monotonic() - self._buffer_started
+        return max(0.0, self.window_ms / 1000 - elapsed)
+
+    async def coalesce(self, responses: AsyncGenerator[Dict[str, Any], None]) -> AsyncGenerator[Dict[str, Any], None]:
+        """Yield responses with adjacent content chunks merged.
+
+        Pending chunks are flushed when the time window elapses (even if the source
+        is idle), when the frame reaches max_bytes, before any non-chunk message,
+        and when the source is exhausted.
+
+        Args:
+            responses: Async generator of processor responses
+
+        Yields:
+            Merged content frames and all other responses unchanged, in order.
+        """
+        if self.window_ms <= 0:
+            async for response in responses:
+                yield response
+            return
+
+        pending_next: Optional[asyncio.Future] = None
+        try:
+            while True:
+                if pending_next is None:
+                    pending_next = asyncio.ensure_future(responses.__anext__())
+
+                # Wait for the next response, but no longer than the open window allows
+                done, _ = await asyncio.wait({pending_next}, timeout=self._remaining_window())
+                if not done:
+                    frame = self._flush()
+                    if frame: yield frame
+                    continue
+
+                try:
+                    response = pending_next.result()
+                except StopAsyncIteration:
+                    pending_next = None
+                    break
+                pending_next = None
+
+                if is_content_chunk(response):
+                    self._add(response)
+                    if self._buffer_bytes >= self.max_bytes or self._remaining_window() == 0:
+                        frame = self._flush()
+                        if frame: yield frame
+                    continue
+
+                # Status events, saved messages etc. flush the pending frame first
+                frame = self._flush()
+                if frame: yield frame
+                yield response
+
+            frame = self._flush()
+            if frame: yield frame
+            logger.debug(f"Coalesced {self.frames_in} content chunks into {self.frames_out} frames")
+        finally:
+            if pending_next is not None and not pending_next.done():
+                pending_next.cancel()
+                try:
+                    await pending_next
+                except (asyncio.CancelledError, StopAsyncIteration):
+                    pass
+                except Exception as e:
+                    logger.debug(f"Pending response fetch ended with: {e}")
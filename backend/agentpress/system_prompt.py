@@ -0,0 +1,123 @@
+"""
+Memoized system prompt assembly for AgentPress.
+
+The system prompt sent to the LLM is the caller's base prompt plus the XML
+examples of every registered tool. Both only change when the model family or
+the registered tool set changes, so the assembled prompt is built once per
+(base prompt, tool set) signature and reused, together with a stable content
+hash. Reusing the same string also gives provider prompt caches a
+byte-identical prefix from run to run.
+"""
+
+import copy
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from agentpress.token_counts import message_token_counter
+from utils.logger import logger
+
+MAX_CACHED_PROMPTS = 32
+
+XML_EXAMPLES_PREAMBLE = """
+--- XML TOOL CALLING ---
+
+In this environment you have access to a set of tools you can use to answer the user's question. The tools are specified in XML format.
+Format your tool calls using the specified XML tags. Place parameters marked as 'attribute' within the opening tag (e.g., `<tag attribute='value'>`). Place parameters marked as 'content' between the opening and closing tags. Place parameters marked as 'element' within their own child tags (e.g., `<tag><element>value</element></tag>`). Refer to the examples provided below for the exact structure of each tool.
+String and scalar parameters should be specified as attributes, while content goes between tags.
+Note that spaces for string values are not stripped. The output is parsed with regular expressions.
+
+Here are the XML tools available with examples:
+"""
+
+
+@dataclass
+class AssembledSystemPrompt:
+    """A fully assembled system message.
+
+    Attributes:
+        message (Dict[str, Any]): The system message; treat as read-only and use `copy_message()`
+        prompt_hash (str): SHA-256 of the assembled content
+    """
+    message: Dict[str, Any]
+    prompt_hash: str
+
+    def copy_message(self) -> Dict[str, Any]:
+        """Get a copy of the system message that callers may modify."""
+        return copy.deepcopy(self.message)
+
+    def token_count(self, model: str) -> int:
+        """Get the token count of the system message for a model (computed once per model)."""
+        return message_token_counter.count_message(self.message, model, f"system_prompt:{self.prompt_hash}")
+
+
+def _content_hash(content: Any) -> str:
+    """Hash system message content (a string or a list of content blocks)."""
+    if isinstance(content, str):
+        data = content
+    else:
+        data = repr(content)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def _build_xml_examples(xml_examples: Dict[str, str]) -> str:
+    """Build the XML tool calling section from the registered examples."""
+    return XML_EXAMPLES_PREAMBLE + "".join(
+        f"<{tag_name}> Example: {example}\\n" for tag_name, example in xml_examples.items()
+    )
+
+
+def _append_to_content(message: Dict[str, Any], text: str) -> None:
+    """Append text to a system message's string content or first text block."""
+    content = message.get('content')
+    if isinstance(content, str):
+        message['content'] = content + text
+    elif isinstance(content, list):
+        for item in content:
+            if isinstance(item, dict) and item.get('type') == 'text' and 'text' in item:
+                item['text'] += text
+                logger.debug("Appended XML examples to the first text block in list system prompt content.")
+                return
+        logger.warning("System prompt content is a list but no text block found to append XML examples.")
+    else:
+        logger.warning(f"System prompt content is of unexpected type ({type(content)}), cannot add XML examples.")
+
+
+# Assembled prompts by (base prompt hash, XML tool tags) signature
+_assembled: "OrderedDict[Tuple[str, Optional[Tuple[str, ...]]], AssembledSystemPrompt]" = OrderedDict()
+
+
+def assemble_system_prompt(
+    system_prompt: Dict[str, Any],
+    xml_tool_tags: Optional[Tuple[str, ...]] = None,
+    get_xml_examples: Optional[Callable[[], Dict[str, str]]] = None
+) -> AssembledSystemPrompt:
+    """Get the assembled system prompt for a base prompt and tool set, building it on first use.
+
+    Args:
+        system_prompt: Base system message
+        xml_tool_tags: Registered XML tool tags in registration order, or None to leave out XML examples
+        get_xml_examples: Returns the XML examples by tag; only called when the prompt is built
+
+    Returns:
+        The assembled system prompt
+    """
+    key = (_content_hash(system_prompt.get('content')), xml_tool_tags)
+    assembled = _assembled.get(key)
+    if assembled is not None:
+        _assembled.move_to_end(key)
+        return assembled
+
+    message = copy.deepcopy(system_prompt)
+    if xml_tool_tags and get_xml_examples:
+        xml_examples = get_xml_examples()
+        if xml_examples:
+            _append_to_content(message, _build_xml_examples(xml_examples))
+
+    assembled = AssembledSystemPrompt(message=message, prompt_hash=_content_hash(message.get('content')))
+    _assembled[key] = assembled
+    while len(_assembled) > MAX_CACHED_PROMPTS:
+        _assembled.popitem(last=False)
+    logger.debug(f"Assembled system prompt {assembled.prompt_hash[:12]} for {len(xml_tool_tags or ())} XML tools")
+    return assembled
@@ -11,17 +11,23 @@ This module provides comprehensive conversation management, including:
 """
 
 import json
-from typing import List, Dict, Any, Optional, Type, Union, AsyncGenerator, Literal
-from services.llm import make_llm_api_call
+from typing import List, Dict, Any, Optional, Type, Union, AsyncGenerator, Literal, Tuple
+from services.llm import make_llm_api_call, PromptCacheLayout
 from agentpress.tool import Tool
-from agentpress.tool_registry import ToolRegistry
+from agentpress.tool_registry import ToolRegistry, ToolRegistryTemplate
 from agentpress.context_manager import ContextManager
+from agentpress.message_buffer import MessageWriteBuffer
+from agentpress.message_cache import ThreadMessageCache, get_thread_message_cache
+from agentpress.context_slots import ThreadContextSlots, get_thread_context_slots
+from agentpress.token_counts import message_token_counter
+from agentpress.system_prompt import assemble_system_prompt
 from agentpress.response_processor import (
     ResponseProcessor,
     ProcessorConfig
 )
 from services.supabase import DBConnection
 from utils.logger import logger
+from utils import tracing
 
 # Type alias for tool choice
 ToolChoice = Literal["auto", "required", "none"]
@@ -34,11 +40,25 @@ class ThreadManager:
     XML-based tool execution patterns.
     """
 
-    def __init__(self):
+    def __init__(self, write_behind: bool = False, message_cache: Optional[ThreadMessageCache] = None, use_message_cache: bool = True, context_slots: Optional[ThreadContextSlots] = None):
         """Initialize ThreadManager.
 
+        Args:
+            write_behind: Queue messages and persist them in ordered batches instead of
+                          awaiting one insert per message. The thread must then be
+                          flushed (`flush_messages`) to surface failed writes.
+            message_cache: Cache for LLM messages; defaults to the process-wide cache.
+            use_message_cache: Read thread messages through the incremental cache instead
+                               of fetching the whole thread on every call.
+            context_slots: Ephemeral per-thread context for the next LLM call; defaults
+                           to the process-wide slots.
         """
         self.db = DBConnection()
+        self.message_cache = (message_cache or get_thread_message_cache()) if use_message_cache else None
+        self.message_buffer = MessageWriteBuffer(
+            on_saved=self.message_cache.apply_local if self.message_cache else None
+        ) if write_behind else None
+        self.context_slots = context_slots or get_thread_context_slots()
         self.tool_registry = ToolRegistry()
         self.response_processor = ResponseProcessor(
             tool_registry=self.tool_registry,
@@ -50,6 +70,17 @@ class ThreadManager:
         """Add a tool to the ThreadManager."""
         self.tool_registry.register_tool(tool_class, function_names, **kwargs)
 
+    def add_tools(self, template: ToolRegistryTemplate, **context):
+        """Add the tools of a prebuilt template to the ThreadManager.
+
+        Args:
+            template: Template with the tool registrations
+            **context: Per-run tool constructor arguments (e.g. project_id, thread_id);
+                       thread_manager is set to this ThreadManager
+        """
+        template.register_into(self.tool_registry, thread_manager=self, **context)
+
+    @tracing.traced("thread.add_message")
     async def add_message(
         self,
         thread_id: str,
@@ -60,6 +91,10 @@ class ThreadManager:
     ):
         """Add a message to the thread in the database.
 
+        With write-behind enabled the row (including its message_id, but not its
+        created_at) is returned immediately and persisted by the next batch flush
+        for the thread.
+
         Args:
             thread_id: The ID of the thread to add the message to.
             type: The type of the message (e.g., 'text', 'image_url', 'tool_call', 'tool', 'user', 'assistant').
@@ -71,6 +106,13 @@ class ThreadManager:
                       Defaults to None, stored as an empty JSONB object if None.
         """
         logger.debug(f"Adding message of type '{type}' to thread {thread_id}")
+
+        if self.message_buffer:
+            # Applied to the message cache once saved, with its database created_at
+            return self.message_buffer.enqueue(
+                self.message_buffer.build_row(thread_id, type, content, is_llm_message, metadata)
+            )
+
         client = await self.db.client
 
         # Prepare data for insertion
@@ -88,6 +130,8 @@ class ThreadManager:
             logger.info(f"Successfully added message to thread {thread_id}")
 
             if result.data and len(result.data) > 0 and isinstance(result.data[0], dict) and 'message_id' in result.data[0]:
+                if self.message_cache:
+                    self.message_cache.apply_local(result.data[0])
                 return result.data[0]
             else:
                 logger.error(f"Insert operation failed or did not return expected data structure for thread {thread_id}. Result data: {result.data}")
@@ -96,11 +140,24 @@ class ThreadManager:
             logger.error(f"Failed to add message to thread {thread_id}: {str(e)}", exc_info=True)
             raise
 
+    async def flush_messages(self, thread_id: Optional[str] = None) -> None:
+        """Persist any queued messages for a thread (or all threads).
+
+        Call this before reading messages back from the database directly.
+
+        Raises:
+            MessagePersistenceError: Queued messages could not be saved; they stay
+                                     queued for the next flush
+        """
+        if self.message_buffer:
+            await self.message_buffer.flush(thread_id)
+
     async def get_llm_messages(self, thread_id: str) -> List[Dict[str, Any]]:
         """Get all messages for a thread.
 
         This method uses the SQL function which handles context truncation
-        by considering summary messages.
+        by considering summary messages. When the message cache is enabled,
+        only rows newer than the cached ones are fetched.
 
         Args:
             thread_id: The ID of the thread to get messages for.
@@ -108,7 +165,35 @@ class ThreadManager:
         Returns:
             List of message objects.
         """
+        messages, _ = await self.get_llm_messages_with_ids(thread_id)
+        return messages
+
+    async def get_llm_messages_with_ids(self, thread_id: str) -> Tuple[List[Dict[str, Any]], List[Optional[str]]]:
+        """Get all messages for a thread along with their message IDs.
+
+        Args:
+            thread_id: The ID of the thread to get messages for.
+
+        Returns:
+            Tuple of (messages, message_ids). IDs are None when the messages
+            were fetched through the RPC, which does not return them.
+        """
         logger.debug(f"Getting messages for thread {thread_id}")
+        # Make sure queued writes are visible to the RPC
+        await self.flush_messages(thread_id)
+
+        if self.message_cache:
+            try:
+                return await self.message_cache.get_messages_with_ids(thread_id)
+            except Exception as e:
+                logger.warning(f"Message cache read failed for thread {thread_id}, falling back to full fetch: {str(e)}")
+                self.message_cache.invalidate(thread_id)
+
+        messages = await self._fetch_llm_messages(thread_id)
+        return messages, [None] * len(messages)
+
+    async def _fetch_llm_messages(self, thread_id: str) -> List[Dict[str, Any]]:
+        """Fetch all LLM messages of a thread through the get_llm_formatted_messages RPC."""
         client = await self.db.client
 
         try:
@@ -161,7 +246,9 @@ class ThreadManager:
         include_xml_examples: bool = False,
         enable_thinking: Optional[bool] = False,
         reasoning_effort: Optional[str] = 'low',
-        enable_context_manager: bool = True
+        enable_context_manager: bool = True,
+        prompt_cache_layout: PromptCacheLayout = "legacy",
+        hedge_account_id: Optional[str] = None
     ) -> Union[Dict[str, Any], AsyncGenerator]:
         """Run a conversation thread with LLM integration and tool execution.
 
@@ -182,6 +269,10 @@ class ThreadManager:
             enable_thinking: Whether to enable thinking before making a decision
             reasoning_effort: The effort level for reasoning
             enable_context_manager: Whether to enable automatic context summarization.
+            prompt_cache_layout: "legacy" inserts the temporary message before the last user
+                                 message; "stable" appends it at the tail so the persisted
+                                 history stays a byte-stable, cacheable prefix
+            hedge_account_id: Account whose budget pays for hedged LLM requests (None disables hedging)
 
         Returns:
             An async generator yielding response chunks or error dict
@@ -200,51 +291,22 @@ class ThreadManager:
         if max_xml_tool_calls > 0 and not processor_config.max_xml_tool_calls:
             processor_config.max_xml_tool_calls = max_xml_tool_calls
 
-        # Create a working copy of the system prompt to potentially modify
-        working_system_prompt = system_prompt.copy()
-
-        # Add XML examples to system prompt if requested, do this only ONCE before the loop
+        # Assemble the system prompt with XML examples once per (prompt, tool set) signature
+        xml_tool_tags = None
         if include_xml_examples and processor_config.xml_tool_calling:
-            xml_examples = self.tool_registry.get_xml_examples()
-            if xml_examples:
-                examples_content = """
---- XML TOOL CALLING ---
+            xml_tool_tags = tuple(self.tool_registry.xml_tools.keys())
+        assembled_system_prompt = assemble_system_prompt(
+            system_prompt, xml_tool_tags, self.tool_registry.get_xml_examples
+        )
+        working_system_prompt = assembled_system_prompt.copy_message()
 
-In this environment you have access to a set of tools you can use to answer the user's question. The tools are specified in XML format.
-Format your tool calls using the specified XML tags. Place parameters marked as 'attribute' within the opening tag (e.g., `<tag attribute='value'>`). Place parameters marked as 'content' between the opening and closing tags. Place parameters marked as 'element' within their own child tags (e.g., `<tag><element>value</element></tag>`). Refer to the examples provided below for the exact structure of each tool.
-String and scalar parameters should be specified as attributes, while content goes between tags.
-Note that spaces for string values are not stripped. The output is parsed with regular expressions.
+        # Count the system prompt (including XML examples) once for all iterations
+        system_prompt_tokens = 0
+        try:
+            system_prompt_tokens = assembled_system_prompt.token_count(llm_model)
+        except Exception as e:
+            logger.error(f"Error counting system prompt tokens: {str(e)}")
 
-Here are the XML tools available with examples:
-"""
-                for tag_name, example in xml_examples.items():
-                    examples_content += f"<{tag_name}> Example: {example}\\n"
-
-                # # Save examples content to a file
-                # try:
-                #     with open('xml_examples.txt', 'w') as f:
-                #         f.write(examples_content)
-                #     logger.debug("Saved XML examples to xml_examples.txt")
-                # except Exception as e:
-                #     logger.error(f"Failed to save XML examples to file: {e}")
-
-                system_content = working_system_prompt.get('content')
-
-                if isinstance(system_content, str):
-                    working_system_prompt['content'] += examples_content
-                    logger.debug("Appended XML examples to string system prompt content.")
-                elif isinstance(system_content, list):
-                    appended = False
-                    for item in working_system_prompt['content']: # Modify the copy
-                        if isinstance(item, dict) and item.get('type') == 'text' and 'text' in item:
-                            item['text'] += examples_content
-                            logger.debug("Appended XML examples to the first text block in list system prompt content.")
-                            appended = True
-                            break
-                    if not appended:
-                        logger.warning("System prompt content is a list but no text block found to append XML examples.")
-                else:
-                    logger.warning(f"System prompt content is of unexpected type ({type(system_content)}), cannot add XML examples.")
         # Control whether we need to auto-continue due to tool_calls finish reason
         auto_continue = True
         auto_continue_count = 0
@@ -257,35 +319,20 @@ Here are the XML tools available with examples:
                 # Note: processor_config is now guaranteed to exist due to check above
 
                 # 1. Get messages from thread for LLM call
-                messages = await self.get_llm_messages(thread_id)
+                messages, message_ids = await self.get_llm_messages_with_ids(thread_id)
 
                 # 2. Check token count before proceeding
                 token_count = 0
                 try:
-                    from litellm import token_counter
-                    # Use the potentially modified working_system_prompt for token counting
-                    token_count = token_counter(model=llm_model, messages=[working_system_prompt] + messages)
+                    # Per-message counts are cached, so only new messages are tokenized
+                    token_count = system_prompt_tokens + message_token_counter.count_messages(messages, llm_model, message_ids)
                     token_threshold = self.context_manager.token_threshold
                     logger.info(f"Thread {thread_id} token count: {token_count}/{token_threshold} ({(token_count/token_threshold)*100:.1f}%)")
 
-                    # if token_count >= token_threshold and enable_context_manager:
-                    #     logger.info(f"Thread token count ({token_count}) exceeds threshold ({token_threshold}), summarizing...")
-                    #     summarized = await self.context_manager.check_and_summarize_if_needed(
-                    #         thread_id=thread_id,
-                    #         add_message_callback=self.add_message,
-                    #         model=llm_model,
-                    #         force=True
-                    #     )
-                    #     if summarized:
-                    #         logger.info("Summarization complete, fetching updated messages with summary")
-                    #         messages = await self.get_llm_messages(thread_id)
-                    #         # Recount tokens after summarization, using the modified prompt
-                    #         new_token_count = token_counter(model=llm_model, messages=[working_system_prompt] + messages)
-                    #         logger.info(f"After summarization: token count reduced from {token_count} to {new_token_count}")
-                    #     else:
-                    #         logger.warning("Summarization failed or wasn't needed - proceeding with original messages")
-                    # elif not enable_context_manager:
-                    #     logger.info("Automatic summarization disabled. Skipping token count check and summarization.")
+                    # Compact older context in the background once past the soft watermark;
+                    # the compacted view is picked up by a later fetch, this call never waits
+                    if enable_context_manager:
+                        self.context_manager.schedule_compaction(thread_id, token_count, llm_model)
 
                 except Exception as e:
                     logger.error(f"Error counting tokens or summarizing: {str(e)}")
@@ -300,8 +347,13 @@ Here are the XML tools available with examples:
                     if msg.get('role') == 'user':
                         last_user_index = i
 
-                # Insert temporary message before the last user message if it exists
-                if temp_msg and last_user_index >= 0:
+                # Insert temporary message before the last user message if it exists,
+                # unless the stable cache layout keeps volatile context at the tail
+                if temp_msg and prompt_cache_layout == "stable":
+                    prepared_messages.extend(messages)
+                    prepared_messages.append(temp_msg)
+                    logger.debug("Added temporary message to the volatile tail of prepared messages")
+                elif temp_msg and last_user_index >= 0:
                     prepared_messages.extend(messages[:last_user_index])
                     prepared_messages.append(temp_msg)
                     prepared_messages.extend(messages[last_user_index:])
@@ -331,7 +383,10 @@ Here are the XML tools available with examples:
                         tool_choice=tool_choice if processor_config.native_tool_calling else None,
                         stream=stream,
                         enable_thinking=enable_thinking,
-                        reasoning_effort=reasoning_effort
+                        reasoning_effort=reasoning_effort,
+                        cache_layout=prompt_cache_layout,
+                        volatile_tail=1 if temp_msg else 0,
+                        hedge_account_id=hedge_account_id
                     )
                     logger.debug("Successfully received raw LLM API response stream/object")
 
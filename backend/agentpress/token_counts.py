@@ -0,0 +1,111 @@
+"""
+Cached token counting for AgentPress messages.
+
+Counting the tokens of a whole thread with litellm on every LLM call re-tokenizes
+messages that have not changed since the previous call. This module counts each
+message once per model tokenizer, keyed by its message_id (or a content hash for
+messages without one, such as the system prompt), and sums the cached counts.
+"""
+
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from litellm import token_counter
+
+from utils.logger import logger
+
+DEFAULT_MAX_ENTRIES = 50000
+
+
+class MessageTokenCounter:
+    """Per-message token count cache.
+
+    Counts are computed for each message on its own, so a summed thread count
+    can differ from a single litellm call over the whole list by the few
+    per-request framing tokens litellm adds. Counts are only used for
+    threshold checks, where that difference does not matter.
+
+    Attributes:
+        max_entries (int): Maximum number of cached counts (least recently used are evicted)
+        hits (int): Number of counts served from the cache
+        misses (int): Number of messages that had to be tokenized
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        """Initialize the counter.
+
+        Args:
+            max_entries: Maximum number of cached counts
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._counts: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+
+    @staticmethod
+    def content_key(message: Dict[str, Any]) -> str:
+        """Stable hash of a message, used when it has no message_id."""
+        return "sha256:" + hashlib.sha256(
+            json.dumps(message, sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()
+
+    def count_message(self, message: Dict[str, Any], model: str, message_id: Optional[str] = None) -> int:
+        """Get the token count of a single message.
+
+        Args:
+            message: LLM message dict
+            model: Model whose tokenizer is used
+            message_id: ID of the stored message; the content hash is used if None
+
+        Returns:
+            Token count of the message
+        """
+        key = (message_id or self.content_key(message), model)
+        count = self._counts.get(key)
+        if count is not None:
+            self.hits += 1
+            self._counts.move_to_end(key)
+            return count
+
+        self.misses += 1
+        count = token_counter(model=model, messages=[message])
+        self._counts[key] = count
+        while len(self._counts) > self.max_entries:
+            self._counts.popitem(last=False)
+        return count
+
+    def count_messages(
+        self,
+        messages: List[Dict[str, Any]],
+        model: str,
+        message_ids: Optional[Sequence[Optional[str]]] = None
+    ) -> int:
+        """Get the summed token count of a list of messages.
+
+        Args:
+            messages: LLM message dicts
+            model: Model whose tokenizer is used
+            message_ids: IDs aligned with `messages` (None entries use the content hash)
+
+        Returns:
+            Total token count
+        """
+        if message_ids is None or len(message_ids) != len(messages):
+            if message_ids is not None:
+                logger.warning("message_ids do not match messages, counting by content hash")
+            message_ids = [None] * len(messages)
+        return sum(
+            self.count_message(message, model, message_id)
+            for message, message_id in zip(messages, message_ids)
+        )
+
+    def forget(self, message_id: str) -> None:
+        """Drop cached counts of a message for every model, e.g. after it was edited."""
+        for key in [key for key in self._counts if key[0] == message_id]:
+            del self._counts[key]
+
+
+# Process-wide counter shared by thread managers and the context manager
+message_token_counter = MessageTokenCounter()
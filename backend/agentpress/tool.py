@@ -109,17 +109,34 @@ class Tool(ABC):
     """
     
     def __init__(self):
-        """Initialize tool with empty schema registry."""
+        """Initialize tool with the schemas of its class."""
         self._schemas: Dict[str, List[ToolSchema]] = {}
         logger.debug(f"Initializing tool class: {self.__class__.__name__}")
         self._register_schemas()
 
     def _register_schemas(self):
         """Register schemas from all decorated methods."""
-        for name, method in inspect.getmembers(self, predicate=inspect.ismethod):
-            if hasattr(method, 'tool_schemas'):
-                self._schemas[name] = method.tool_schemas
-                logger.debug(f"Registered schemas for method '{name}' in {self.__class__.__name__}")
+        self._schemas = self.get_class_schemas()
+
+    @classmethod
+    def get_class_schemas(cls) -> Dict[str, List[ToolSchema]]:
+        """Get the schemas of the class's decorated methods.
+
+        The class is introspected once; all instances share the result, which
+        must not be modified.
+
+        Returns:
+            Dict mapping method names to their schema definitions
+        """
+        schemas = _class_schemas.get(cls)
+        if schemas is None:
+            schemas = {}
+            for name, method in inspect.getmembers(cls, predicate=inspect.isfunction):
+                if hasattr(method, 'tool_schemas'):
+                    schemas[name] = method.tool_schemas
+                    logger.debug(f"Registered schemas for method '{name}' in {cls.__name__}")
+            _class_schemas[cls] = schemas
+        return schemas
 
     def get_schemas(self) -> Dict[str, List[ToolSchema]]:
         """Get all registered tool schemas.
@@ -157,6 +174,9 @@ class Tool(ABC):
         logger.debug(f"Tool {self.__class__.__name__} returned failed result: {msg}")
         return ToolResult(success=False, output=msg)
 
+# Schemas of each tool class by class, see Tool.get_class_schemas
+_class_schemas: Dict[Type[Tool], Dict[str, List[ToolSchema]]] = {}
+
 def _add_schema(func, schema: ToolSchema):
     """Helper to add schema to a function."""
     if not hasattr(func, 'tool_schemas'):
@@ -0,0 +1,219 @@
+"""
+Result caching for AgentPress tools.
+
+Tools that call paid or rate-limited external APIs (search, scraping, data
+providers) can mark a method with `@cacheable` so repeated calls with the same
+arguments are answered from a cache instead of the provider. Each cached method
+gets its own namespace with an in-process LRU in front of a shared Redis tier,
+so a result fetched on one thread or worker is reused by every other one until
+its TTL expires.
+
+Example:
+    @xml_schema(tag_name="web-search", ...)
+    @cacheable(ttl=900, key=lambda query, num_results=20: (query.strip().lower(), num_results))
+    async def web_search(self, query: str, num_results: int = 20) -> ToolResult:
+        ...
+"""
+
+import functools
+import hashlib
+import inspect
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from agentpress.tool import ToolResult
+from services import redis
+from utils.config import config
+from utils.logger import logger
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 512 * 1024
+REDIS_KEY_PREFIX = "tool_cache"
+
+
+@dataclass
+class CacheStats:
+    """Hit and miss counters for a cached tool method.
+
+    Attributes:
+        local_hits (int): Lookups answered by the in-process LRU
+        redis_hits (int): Lookups answered by Redis
+        misses (int): Lookups that had to call the tool
+        stores (int): Results written to the cache
+        skipped (int): Results not cached (failed, too large or unkeyable)
+    """
+    local_hits: int = 0
+    redis_hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    skipped: int = 0
+
+
+class ToolResultCache:
+    """Two-tier (in-process LRU + Redis) cache for one tool method.
+
+    Attributes:
+        namespace (str): Cache namespace, usually the tool class and method name
+        ttl (int): Time to live of cached results in seconds
+        max_entries (int): Maximum number of results kept in the in-process LRU
+        max_bytes (int): Results larger than this are not cached
+        stats (CacheStats): Hit and miss counters
+    """
+
+    def __init__(self, namespace: str, ttl: int, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES):
+        """Initialize the cache.
+
+        Args:
+            namespace: Cache namespace
+            ttl: Time to live in seconds
+            max_entries: In-process LRU capacity
+            max_bytes: Maximum serialized size of a cached result
+        """
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._local: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    def make_key(self, key_material: Any) -> str:
+        """Hash key material into a Redis key for this namespace."""
+        digest = hashlib.sha256(
+            json.dumps(key_material, sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()
+        return f"{REDIS_KEY_PREFIX}:{self.namespace}:{digest}"
+
+    def _get_local(self, key: str) -> Optional[str]:
+        """Return a value from the LRU if present and not expired."""
+        entry = self._local.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._local[key]
+            return None
+        self._local.move_to_end(key)
+        return value
+
+    def _set_local(self, key: str, value: str, ttl: float) -> None:
+        """Store a value in the LRU, evicting the least recently used entries."""
+        self._local[key] = (time.monotonic() + ttl, value)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[ToolResult]:
+        """Look up a cached result, checking the LRU before Redis."""
+        value = self._get_local(key)
+        if value is not None:
+            self.stats.local_hits += 1
+            return ToolResult(**json.loads(value))
+
+        try:
+            redis_client = await redis.get_client()
+            async with redis_client.pipeline(transaction=False) as pipe:
+                pipe.get(key)
+                pipe.ttl(key)
+                value, remaining_ttl = await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Tool cache lookup failed for {self.namespace}: {str(e)}")
+            value = None
+
+        if value is None:
+            self.stats.misses += 1
+            return None
+
+        self.stats.redis_hits += 1
+        # Keep the local copy no longer than Redis would
+        self._set_local(key, value, remaining_ttl if remaining_ttl and remaining_ttl > 0 else self.ttl)
+        return ToolResult(**json.loads(value))
+
+    async def set(self, key: str, result: ToolResult) -> None:
+        """Cache a successful result in both tiers."""
+        value = json.dumps(asdict(result))
+        if not result.success or len(value) > self.max_bytes:
+            self.stats.skipped += 1
+            return
+
+        self._set_local(key, value, self.ttl)
+        self.stats.stores += 1
+        try:
+            await redis.set(key, value, ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"Tool cache store failed for {self.namespace}: {str(e)}")
+
+    def clear_local(self) -> None:
+        """Drop all entries from the in-process LRU."""
+        self._local.clear()
+
+
+# All caches created by @cacheable, keyed by namespace
+_caches: Dict[str, ToolResultCache] = {}
+
+
+def get_tool_cache_stats() -> Dict[str, Dict[str, int]]:
+    """Get hit and miss counters for every cached tool method.
+
+    Returns:
+        Dict mapping cache namespaces to their counters
+    """
+    return {namespace: asdict(cache.stats) for namespace, cache in _caches.items()}
+
+
+def cacheable(
+    ttl: int,
+    key: Optional[Callable[..., Any]] = None,
+    max_entries: int = DEFAULT_MAX_ENTRIES,
+    max_bytes: int = DEFAULT_MAX_BYTES
+):
+    """
+    Decorator caching the ToolResult of an async tool method.
+
+    Only successful results are cached. Cache errors never fail the tool call;
+    the method is simply executed as if the cache were empty.
+
+    Args:
+        ttl: Time to live of cached results in seconds
+        key: Optional callable receiving the method's arguments (without self, defaults
+            applied) and returning JSON-serializable key material. Use it to normalize
+            equivalent inputs. Defaults to all arguments. Raising from it skips the cache.
+        max_entries: In-process LRU capacity for this method
+        max_bytes: Results larger than this (serialized) are not cached
+    """
+    def decorator(func):
+        namespace = func.__qualname__
+        cache = _caches.setdefault(namespace, ToolResultCache(namespace, ttl, max_entries, max_bytes))
+        signature = inspect.signature(func)
+        logger.debug(f"Applying tool cache (ttl={ttl}s) to function {func.__name__}")
+
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            if not config.TOOL_CACHE_ENABLED:
+                return await func(self, *args, **kwargs)
+
+            try:
+                bound = signature.bind(self, *args, **kwargs)
+                bound.apply_defaults()
+                arguments = dict(list(bound.arguments.items())[1:])
+                cache_key = cache.make_key(key(**arguments) if key else arguments)
+            except Exception as e:
+                logger.debug(f"Not caching {namespace} call, could not build key: {str(e)}")
+                cache.stats.skipped += 1
+                return await func(self, *args, **kwargs)
+
+            cached = await cache.get(cache_key)
+            if cached is not None:
+                logger.debug(f"Tool cache hit for {namespace}")
+                return cached
+
+            result = await func(self, *args, **kwargs)
+            if isinstance(result, ToolResult):
+                await cache.set(cache_key, result)
+            return result
+
+        wrapper.tool_cache = cache
+        return wrapper
+    return decorator
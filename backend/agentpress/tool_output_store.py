@@ -0,0 +1,167 @@
+"""
+Offloading of large tool outputs for AgentPress.
+
+Tool results are stored in the thread and sent back to the LLM on every later
+turn, so a single large shell listing or scraped page keeps inflating the prompt.
+Outputs above a configurable size are written to a blob store under their
+content hash, and the conversation only gets a head/tail preview plus a handle
+that the `read-tool-output` tool can page through.
+"""
+
+import asyncio
+import hashlib
+import os
+from typing import Optional, Tuple
+
+from services import redis
+from utils.config import config
+from utils.logger import logger
+
+REDIS_KEY_PREFIX = "tool_output"
+HANDLE_LENGTH = 24
+
+
+def make_handle(content: str) -> str:
+    """Content-hash handle for a tool output."""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:HANDLE_LENGTH]
+
+
+class ToolOutputStore:
+    """Base class for tool output blob stores."""
+
+    async def put(self, content: str) -> str:
+        """Store content and return its handle."""
+        raise NotImplementedError
+
+    async def get(self, handle: str) -> Optional[str]:
+        """Get stored content by handle, or None if it is unknown or expired."""
+        raise NotImplementedError
+
+
+class RedisToolOutputStore(ToolOutputStore):
+    """Stores tool outputs in Redis with a TTL."""
+
+    def __init__(self, ttl: int):
+        """Initialize the store.
+
+        Args:
+            ttl: Time to live of stored outputs in seconds
+        """
+        self.ttl = ttl
+
+    async def put(self, content: str) -> str:
+        handle = make_handle(content)
+        await redis.set(f"{REDIS_KEY_PREFIX}:{handle}", content, ex=self.ttl)
+        return handle
+
+    async def get(self, handle: str) -> Optional[str]:
+        return await redis.get(f"{REDIS_KEY_PREFIX}:{handle}")
+
+
+class DiskToolOutputStore(ToolOutputStore):
+    """Stores tool outputs as files in a local directory."""
+
+    def __init__(self, directory: str):
+        """Initialize the store.
+
+        Args:
+            directory: Directory the outputs are written to
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, handle: str) -> str:
+        return os.path.join(self.directory, f"{handle}.txt")
+
+    async def put(self, content: str) -> str:
+        handle = make_handle(content)
+        path = self._path(handle)
+        if not os.path.exists(path):
+            await asyncio.to_thread(self._write, path, content)
+        return handle
+
+    async def get(self, handle: str) -> Optional[str]:
+        if not handle.isalnum():
+            return None
+        path = self._path(handle)
+        if not os.path.exists(path):
+            return None
+        return await asyncio.to_thread(self._read, path)
+
+    @staticmethod
+    def _write(path: str, content: str) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read(path: str) -> str:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+
+_store: Optional[ToolOutputStore] = None
+
+
+def get_tool_output_store() -> ToolOutputStore:
+    """Get the configured tool output store ("redis" or "disk")."""
+    global _store
+    if _store is None:
+        if config.TOOL_OUTPUT_STORE == "disk":
+            _store = DiskToolOutputStore(config.TOOL_OUTPUT_STORE_DIR)
+        else:
+            _store = RedisToolOutputStore(config.TOOL_OUTPUT_TTL)
+    return _store
+
+
+def build_preview(content: str, handle: Optional[str], preview_chars: int) -> str:
+    """Build the head/tail preview that replaces a large output in the conversation.
+
+    Args:
+        content: Full tool output
+        handle: Handle of the stored output, or None if it could not be stored
+        preview_chars: Number of characters kept from each end
+
+    Returns:
+        Preview text
+    """
+    head = content[:preview_chars]
+    tail = content[-preview_chars:]
+    omitted = len(content) - len(head) - len(tail)
+
+    if handle:
+        notice = (
+            f"[Output truncated: {len(content)} characters in total. The full output is stored with "
+            f"handle \"{handle}\"; use the read-tool-output tool with this handle to read the omitted part.]"
+        )
+    else:
+        notice = f"[Output truncated: {len(content)} characters in total, only the beginning and end are shown.]"
+
+    return f"{notice}\n{head}\n\n... [{omitted} characters omitted] ...\n\n{tail}"
+
+
+async def offload_tool_output(content: str) -> Tuple[str, Optional[str]]:
+    """Replace a large tool output with a preview, storing the full output.
+
+    Args:
+        content: Tool output text
+
+    Returns:
+        Tuple of (text for the conversation, handle or None). Outputs at or below
+        TOOL_OUTPUT_OFFLOAD_CHARS are returned unchanged with no handle.
+    """
+    threshold = config.TOOL_OUTPUT_OFFLOAD_CHARS
+    preview_chars = config.TOOL_OUTPUT_PREVIEW_CHARS
+    if threshold <= 0 or len(content) <= max(threshold, 2 * preview_chars):
+        return content, None
+
+    handle = None
+    try:
+        handle = await get_tool_output_store().put(content)
+        logger.info(f"Offloaded tool output of {len(content)} characters as {handle}")
+    except Exception as e:
+        # Still truncate so the prompt stays bounded; the full output is lost
+        logger.error(f"Failed to store tool output of {len(content)} characters: {str(e)}")
+
+    return build_preview(content, handle, preview_chars), handle
@@ -1,4 +1,6 @@
-from typing import Dict, Type, Any, List, Optional, Callable
+import inspect
+from dataclasses import dataclass, field
+from typing import Dict, Type, Any, List, Optional, Callable, Tuple
 from agentpress.tool import Tool, SchemaType, ToolSchema
 from utils.logger import logger
 
@@ -150,3 +152,109 @@ class ToolRegistry:
                 examples[schema.xml_schema.tag_name] = schema.xml_schema.example
         logger.debug(f"Retrieved {len(examples)} XML examples")
         return examples
+
+
+@dataclass
+class _TemplateTool:
+    """A tool registration resolved by a ToolRegistryTemplate.
+
+    Attributes:
+        tool_class: The tool class
+        kwargs: Constructor arguments shared by every registry
+        context_params: Constructor parameters taken from the registry's context
+        openapi: (function name, schema) pairs to register
+        xml: (tag name, function name, schema) triples to register
+        shared_instance: The instance used by every registry, for tools without context parameters
+    """
+    tool_class: Type[Tool]
+    kwargs: Dict[str, Any]
+    context_params: List[str]
+    openapi: List[Tuple[str, ToolSchema]] = field(default_factory=list)
+    xml: List[Tuple[str, str, ToolSchema]] = field(default_factory=list)
+    shared_instance: Optional[Tool] = None
+
+
+class ToolRegistryTemplate:
+    """A set of tool registrations resolved once and applied to many registries.
+
+    Registering tools on a fresh ToolRegistry introspects every tool class and
+    filters its schemas each time. A template does that once: `add_tool`
+    resolves the schemas and constructor parameters of a tool, and
+    `register_into` fills a registry from the result, constructing only the
+    tools that take per-registry context (e.g. project_id, thread_id).
+
+    Tools whose constructors need no context (every parameter is passed to
+    `add_tool` or has a default) are constructed once and their instance is
+    shared by every registry, so they must not keep per-run state.
+    Heavy resources (API clients, HTTP sessions) can be shared between the
+    per-registry instances by passing them to `add_tool`.
+
+    Methods:
+        add_tool: Add a tool with optional function filtering and shared arguments
+        register_into: Register the template's tools in a registry
+    """
+
+    def __init__(self):
+        """Initialize an empty template."""
+        self._tools: List[_TemplateTool] = []
+
+    def add_tool(self, tool_class: Type[Tool], function_names: Optional[List[str]] = None, **kwargs):
+        """Add a tool to the template.
+
+        Args:
+            tool_class: The tool class to register
+            function_names: Optional list of specific functions to register
+            **kwargs: Constructor arguments shared by every registry; the
+                      remaining constructor parameters without defaults are
+                      taken from the context passed to register_into
+        """
+        parameters = inspect.signature(tool_class.__init__).parameters.values()
+        context_params = [
+            p.name for p in parameters
+            if p.name != 'self' and p.name not in kwargs
+            and p.default is inspect.Parameter.empty
+            and p.kind not in (inspect.Parameter.VAR_POSITIONAL, inspect.Parameter.VAR_KEYWORD)
+        ]
+        entry = _TemplateTool(tool_class=tool_class, kwargs=kwargs, context_params=context_params)
+
+        for func_name, schema_list in tool_class.get_class_schemas().items():
+            if function_names is None or func_name in function_names:
+                for schema in schema_list:
+                    if schema.schema_type == SchemaType.OPENAPI:
+                        entry.openapi.append((func_name, schema))
+                    if schema.schema_type == SchemaType.XML and schema.xml_schema:
+                        entry.xml.append((schema.xml_schema.tag_name, func_name, schema))
+
+        if not context_params:
+            entry.shared_instance = tool_class(**kwargs)
+
+        self._tools.append(entry)
+        logger.debug(f"Added {tool_class.__name__} to tool registry template: {len(entry.openapi)} OpenAPI functions, {len(entry.xml)} XML tags, context: {context_params}")
+
+    def register_into(self, registry: ToolRegistry, **context):
+        """Register the template's tools in a registry.
+
+        Args:
+            registry: The registry to fill
+            **context: Per-registry constructor arguments (e.g. project_id,
+                       thread_id, thread_manager); each tool receives the ones
+                       its constructor accepts
+        """
+        for entry in self._tools:
+            instance = entry.shared_instance
+            if instance is None:
+                tool_context = {name: context[name] for name in entry.context_params if name in context}
+                instance = entry.tool_class(**entry.kwargs, **tool_context)
+
+            for func_name, schema in entry.openapi:
+                registry.tools[func_name] = {
+                    "instance": instance,
+                    "schema": schema
+                }
+            for tag_name, func_name, schema in entry.xml:
+                registry.xml_tools[tag_name] = {
+                    "instance": instance,
+                    "method": func_name,
+                    "schema": schema
+                }
+        logger.debug(f"Registered {len(self._tools)} tools from template")
@@ -0,0 +1,195 @@
+"""
+Incremental XML tool-call scanner for AgentPress.
+
+This module provides a streaming scanner that detects complete XML tool calls
+as content arrives from the LLM. Registered tag names are compiled into a trie
+so every '<' in the stream is matched against all tags in a single walk, and the
+scan position is kept between deltas so already-inspected text is never scanned
+again.
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Characters that may follow a tag name inside an opening tag
+_TAG_NAME_TERMINATORS = frozenset(" \t\r\n>/")
+
+# Sentinel key marking the end of a tag name in the trie
+_END = ""
+
+
+class XmlToolCallScanner:
+    """Streaming scanner emitting complete XML tool-call chunks.
+
+    Feed content deltas with `feed()`; each call returns the chunks whose
+    closing tag arrived in that delta, in stream order. Nested tags of the
+    same name are balanced, so an inner closing tag does not end the outer call.
+
+    Text outside a tool call is discarded as soon as it has been scanned, and
+    text inside a tool call is only scanned once, so the cost of each delta is
+    proportional to the delta size rather than the buffered content.
+
+    Attributes:
+        tag_names (List[str]): XML tag names recognised as tool calls
+    """
+
+    def __init__(self, tag_names: Iterable[str]):
+        """Build the tag trie.
+
+        Args:
+            tag_names: XML tag names of the registered tools
+        """
+        self.tag_names = list(tag_names)
+        self._trie: Dict[str, dict] = {}
+        for tag_name in self.tag_names:
+            node = self._trie
+            for char in tag_name:
+                node = node.setdefault(char, {})
+            node[_END] = {}
+
+        self._buffer = ""
+        self._pos = 0                      # Next index in _buffer to scan
+        self._current_tag: Optional[str] = None
+        self._depth = 0
+
+    def feed(self, delta: str) -> List[str]:
+        """Consume a content delta and return any newly completed chunks.
+
+        Args:
+            delta: New content from the stream
+
+        Returns:
+            List of complete XML chunks (opening tag through closing tag)
+        """
+        if not delta or not self._trie:
+            return []
+
+        self._buffer += delta
+        chunks = []
+
+        while True:
+            if self._current_tag is None:
+                if not self._scan_for_opening_tag():
+                    break
+            else:
+                chunk = self._scan_for_closing_tag()
+                if chunk is None:
+                    break
+                chunks.append(chunk)
+
+        return chunks
+
+    def _match_tag_at(self, start: int) -> Tuple[Optional[str], bool]:
+        """Match a registered tag name starting right after the '<' at `start`.
+
+        Returns:
+            Tuple of (tag_name, needs_more): tag_name is the longest registered
+            name followed by a terminator, needs_more is True when the buffer
+            ends before the match can be decided.
+        """
+        node = self._trie
+        i = start + 1
+        matched = None
+        buffer_len = len(self._buffer)
+
+        while True:
+            if _END in node:
+                if i >= buffer_len:
+                    return None, True
+                if self._buffer[i] in _TAG_NAME_TERMINATORS:
+                    matched = self._buffer[start + 1:i]
+            if i >= buffer_len:
+                # Still inside a possible longer name; only wait if nothing matched yet
+                return (matched, False) if matched else (None, bool(node))
+            node = node.get(self._buffer[i])
+            if node is None:
+                return matched, False
+            i += 1
+
+    def _scan_for_opening_tag(self) -> bool:
+        """Advance to the next registered opening tag.
+
+        Returns:
+            True if a tool call was entered, False if more input is needed.
+        """
+        while True:
+            lt = self._buffer.find('<', self._pos)
+            if lt == -1:
+                # Nothing pending outside a tool call, drop the scanned text
+                self._buffer = ""
+                self._pos = 0
+                return False
+
+            tag_name, needs_more = self._match_tag_at(lt)
+            if needs_more:
+                # Keep only the undecided '<...' tail for the next delta
+                self._buffer = self._buffer[lt:]
+                self._pos = 0
+                return False
+
+            if tag_name:
+                self._buffer = self._buffer[lt:]
+                self._pos = 1 + len(tag_name)
+                self._current_tag = tag_name
+                self._depth = 1
+                return True
+
+            self._pos = lt + 1
+
+    def _scan_for_closing_tag(self) -> Optional[str]:
+        """Advance inside the current tool call until it is closed.
+
+        Returns:
+            The complete chunk once its matching closing tag is found, otherwise None.
+        """
+        start_pattern = f'<{self._current_tag}'
+        end_pattern = f'</{self._current_tag}>'
+        buffer_len = len(self._buffer)
+
+        while True:
+            lt = self._buffer.find('<', self._pos)
+            if lt == -1:
+                self._pos = buffer_len
+                return None
+
+            # Wait for enough characters to tell an opening or closing tag apart
+            tail = self._buffer[lt:lt + len(end_pattern)]
+            if len(tail) < len(end_pattern) and (end_pattern.startswith(tail) or start_pattern.startswith(tail)):
+                self._pos = lt
+                return None
+
+            if self._buffer.startswith(end_pattern, lt):
+                self._depth -= 1
+                if self._depth == 0:
+                    chunk_end = lt + len(end_pattern)
+                    chunk = self._buffer[:chunk_end]
+                    self._buffer = self._buffer[chunk_end:]
+                    self._pos = 0
+                    self._current_tag = None
+                    return chunk
+                self._pos = lt + len(end_pattern)
+                continue
+
+            if self._buffer.startswith(start_pattern, lt):
+                next_idx = lt + len(start_pattern)
+                if next_idx >= buffer_len:
+                    self._pos = lt
+                    return None
+                if self._buffer[next_idx] in _TAG_NAME_TERMINATORS:
+                    self._depth += 1
+                    self._pos = next_idx
+                    continue
+
+            self._pos = lt + 1
+
+
+def extract_xml_chunks(content: str, tag_names: Iterable[str]) -> List[str]:
+    """Extract all complete XML tool-call chunks from a full content string.
+
+    Args:
+        content: Complete LLM output
+        tag_names: XML tag names of the registered tools
+
+    Returns:
+        List of complete XML chunks in order of appearance
+    """
+    return XmlToolCallScanner(tag_names).feed(content)
@@ -9,12 +9,16 @@ from dotenv import load_dotenv
 from utils.config import config, EnvMode
 import asyncio
 from utils.logger import logger
+from agentpress.tool_cache import get_tool_cache_stats
+from services.llm_router import llm_router
 import uuid
 import time
+import httpx
 from collections import OrderedDict
 
 # Import the agent API module
 from agent import api as agent_api
+from agent import run as agent_run
 from sandbox import api as sandbox_api
 from services import billing as billing_api
 
@@ -48,6 +52,10 @@ async def lifespan(app: FastAPI):
             instance_id
         )
         
+        # HTTP client shared by the agent's tools, closed on shutdown
+        tools_http_client = httpx.AsyncClient()
+        agent_run.initialize(tools_http_client)
+
         # Initialize the sandbox API with shared resources
         sandbox_api.initialize(db)
         
@@ -62,12 +70,16 @@ async def lifespan(app: FastAPI):
         
         # Start background tasks
         asyncio.create_task(agent_api.restore_running_agent_runs())
+        usage_sweep_task = asyncio.create_task(agent_api.sweep_usage_periodically())
         
         yield
         
+        usage_sweep_task.cancel()
+
         # Clean up agent resources
         logger.info("Cleaning up agent resources")
         await agent_api.cleanup()
+        await tools_http_client.aclose()
         
         # Clean up Redis connection
         try:
@@ -133,7 +145,9 @@ async def health_check():
     return {
         "status": "ok", 
         "timestamp": datetime.now(timezone.utc).isoformat(),
-        "instance_id": instance_id
+        "instance_id": instance_id,
+        "tool_cache": get_tool_cache_stats(),
+        "llm_deployments": llm_router.get_stats()
     }
 
 if __name__ == "__main__":
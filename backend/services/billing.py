@@ -7,10 +7,13 @@ stripe listen --forward-to localhost:8000/api/billing/webhook
 from fastapi import APIRouter, HTTPException, Depends, Request
 from typing import Optional, Dict, Any, List, Tuple
 import stripe
+import json
 from datetime import datetime, timezone
 from utils.logger import logger
 from utils.config import config, EnvMode
 from services.supabase import DBConnection
+from services.entitlements import Entitlement, entitlement_cache
+from services import stripe_client
 from utils.auth_utils import get_current_user_id_from_jwt
 from pydantic import BaseModel, Field
 
@@ -70,7 +73,8 @@ async def get_stripe_customer_id(client, user_id: str) -> Optional[str]:
 async def create_stripe_customer(client, user_id: str, email: str) -> str:
     """Create a new Stripe customer for a user."""
     # Create customer in Stripe
-    customer = stripe.Customer.create(
+    customer = await stripe_client.call(
+        stripe.Customer.create,
         email=email,
         metadata={"user_id": user_id}
     )
@@ -97,7 +101,8 @@ async def get_user_subscription(user_id: str) -> Optional[Dict]:
             return None
             
         # Get all active subscriptions for the customer
-        subscriptions = stripe.Subscription.list(
+        subscriptions = await stripe_client.lookup(
+            stripe.Subscription.list,
             customer=customer_id,
             status='active'
         )
@@ -139,7 +144,8 @@ async def get_user_subscription(user_id: str) -> Optional[Dict]:
             for sub in our_subscriptions:
                 if sub['id'] != most_recent['id']:
                     try:
-                        stripe.Subscription.modify(
+                        await stripe_client.call(
+                            stripe.Subscription.modify,
                             sub['id'],
                             cancel_at_period_end=True
                         )
@@ -156,7 +162,31 @@ async def get_user_subscription(user_id: str) -> Optional[Dict]:
         return None
 
 async def calculate_monthly_usage(client, user_id: str) -> float:
-    """Calculate total agent run minutes for the current month for a user."""
+    """Calculate total agent run minutes for the current month for a user.
+
+    Reads the account's running usage counter, which is kept up to date by
+    record_agent_run_usage and sweep_agent_run_usage. Runs in progress are
+    counted up to the last sweep. Falls back to summing the runs if the
+    counter cannot be read.
+    """
+    now = datetime.now(timezone.utc)
+    start_of_month = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
+
+    try:
+        usage_result = await client.table('account_monthly_usage') \
+            .select('seconds') \
+            .eq('account_id', user_id) \
+            .eq('month', start_of_month.date().isoformat()) \
+            .execute()
+        if not usage_result.data:
+            return 0.0
+        return float(usage_result.data[0]['seconds']) / 60
+    except Exception as e:
+        logger.error(f"Error reading usage counter for {user_id}, summing agent runs instead: {str(e)}")
+        return await _calculate_monthly_usage_from_runs(client, user_id)
+
+async def _calculate_monthly_usage_from_runs(client, user_id: str) -> float:
+    """Calculate total agent run minutes for the current month by summing the user's runs."""
     # Get start of current month in UTC
     now = datetime.now(timezone.utc)
     start_of_month = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
@@ -198,60 +228,115 @@ async def calculate_monthly_usage(client, user_id: str) -> float:
     
     return total_seconds / 60  # Convert to minutes
 
-async def check_billing_status(client, user_id: str) -> Tuple[bool, str, Optional[Dict]]:
-    """
-    Check if a user can run agents based on their subscription and usage.
-    
-    Returns:
-        Tuple[bool, str, Optional[Dict]]: (can_run, message, subscription_info)
-    """
-    if config.ENV_MODE == EnvMode.LOCAL:
-        logger.info("Running in local development mode - billing checks are disabled")
-        return True, "Local development mode - billing disabled", {
-            "price_id": "local_dev",
-            "plan_name": "Local Development",
-            "minutes_limit": "no limit"
-        }
-    
+async def record_agent_run_usage(client, agent_run_id: str) -> None:
+    """Add an agent run's time since it was last counted to its account's usage counter."""
+    try:
+        await client.rpc('record_agent_run_usage', {'p_agent_run_id': agent_run_id}).execute()
+    except Exception as e:
+        # The periodic sweep picks up whatever was not counted here
+        logger.error(f"Error recording usage for agent run {agent_run_id}: {str(e)}")
+
+async def sweep_agent_run_usage(client) -> None:
+    """Count the time of runs in progress and of completed runs not yet counted."""
+    try:
+        result = await client.rpc('sweep_agent_run_usage', {}).execute()
+        logger.debug(f"Swept usage of {result.data} agent runs")
+    except Exception as e:
+        logger.error(f"Error sweeping agent run usage: {str(e)}")
+
+async def _load_entitlement(client, account_id: str) -> Entitlement:
+    """Resolve an account's entitlement from the admin role and its Stripe subscription."""
     # Check if user is an admin
     admin_check = await client.schema('basejump').from_('account_user') \
         .select('account_role') \
-        .eq('user_id', user_id) \
+        .eq('user_id', account_id) \
         .eq('account_role', 'admin') \
         .execute()
-    
+
     if admin_check.data and len(admin_check.data) > 0:
-        logger.info(f"User {user_id} is an admin - billing checks are disabled")
-        return True, "Admin access - billing disabled", {
-            "price_id": "admin",
-            "plan_name": "Admin",
-            "minutes_limit": "no limit"
-        }
-    
+        return Entitlement(
+            account_id=account_id,
+            is_admin=True,
+            subscription={
+                "price_id": "admin",
+                "plan_name": "Admin",
+                "minutes_limit": "no limit"
+            }
+        )
+
     # Get current subscription
-    subscription = await get_user_subscription(user_id)
-    # print("Current subscription:", subscription)
-    
+    subscription = await get_user_subscription(account_id)
+
     # If no subscription, they can use free tier
     if not subscription:
         subscription = {
             'price_id': config.STRIPE_FREE_TIER_ID,  # Free tier
             'plan_name': 'free'
         }
-    
+
     # Extract price ID from subscription items
     price_id = None
     if subscription.get('items') and subscription['items'].get('data') and len(subscription['items']['data']) > 0:
         price_id = subscription['items']['data'][0]['price']['id']
     else:
         price_id = subscription.get('price_id', config.STRIPE_FREE_TIER_ID)
-    
+
     # Get tier info - default to free tier if not found
     tier_info = SUBSCRIPTION_TIERS.get(price_id)
     if not tier_info:
         logger.warning(f"Unknown subscription tier: {price_id}, defaulting to free tier")
         tier_info = SUBSCRIPTION_TIERS[config.STRIPE_FREE_TIER_ID]
+
+    return Entitlement(
+        account_id=account_id,
+        is_admin=False,
+        price_id=price_id,
+        tier_name=tier_info['name'],
+        minutes_limit=tier_info['minutes'],
+        # Plain JSON so the entitlement can be shared through Redis
+        subscription=json.loads(json.dumps(subscription, default=str))
+    )
+
+async def get_entitlement(client, account_id: str) -> Entitlement:
+    """Get an account's entitlement, from the cache when possible."""
+    return await entitlement_cache.get(account_id, lambda: _load_entitlement(client, account_id))
+
+async def refresh_entitlement_for_customer(client, customer_id: str) -> None:
+    """Reload the cached entitlement of the account a Stripe customer belongs to."""
+    result = await client.schema('basejump').from_('billing_customers') \
+        .select('account_id') \
+        .eq('id', customer_id) \
+        .execute()
+    if not result.data:
+        logger.warning(f"No account found for Stripe customer {customer_id}, cannot refresh entitlement")
+        return
+    account_id = result.data[0]['account_id']
+    await entitlement_cache.refresh(account_id, lambda: _load_entitlement(client, account_id))
+    logger.info(f"Refreshed entitlement for account {account_id} (customer {customer_id})")
+
+async def check_billing_status(client, user_id: str) -> Tuple[bool, str, Optional[Dict]]:
+    """
+    Check if a user can run agents based on their subscription and usage.
     
+    Returns:
+        Tuple[bool, str, Optional[Dict]]: (can_run, message, subscription_info)
+    """
+    if config.ENV_MODE == EnvMode.LOCAL:
+        logger.info("Running in local development mode - billing checks are disabled")
+        return True, "Local development mode - billing disabled", {
+            "price_id": "local_dev",
+            "plan_name": "Local Development",
+            "minutes_limit": "no limit"
+        }
+    
+    entitlement = await get_entitlement(client, user_id)
+    if entitlement.is_admin:
+        logger.info(f"User {user_id} is an admin - billing checks are disabled")
+        return True, "Admin access - billing disabled", entitlement.subscription
+
+    subscription = entitlement.subscription
+    tier_info = {'name': entitlement.tier_name, 'minutes': entitlement.minutes_limit}
+
     # Calculate current month's usage
     current_usage = await calculate_monthly_usage(client, user_id)
     
@@ -284,7 +369,7 @@ async def create_checkout_session(
         
         # Get the target price and product ID
         try:
-            price = stripe.Price.retrieve(request.price_id, expand=['product'])
+            price = await stripe_client.lookup(stripe.Price.retrieve, request.price_id, expand=['product'])
             product_id = price['product']['id']
         except stripe.error.InvalidRequestError:
             raise HTTPException(status_code=400, detail=f"Invalid price ID: {request.price_id}")
@@ -319,13 +404,14 @@ async def create_checkout_session(
                     }
                 
                 # Get current and new price details
-                current_price = stripe.Price.retrieve(current_price_id)
+                current_price = await stripe_client.lookup(stripe.Price.retrieve, current_price_id)
                 new_price = price # Already retrieved
                 is_upgrade = new_price['unit_amount'] > current_price['unit_amount']
 
                 if is_upgrade:
                     # --- Handle Upgrade --- Immediate modification
-                    updated_subscription = stripe.Subscription.modify(
+                    updated_subscription = await stripe_client.call(
+                        stripe.Subscription.modify,
                         subscription_id,
                         items=[{
                             'id': subscription_item['id'],
@@ -343,7 +429,7 @@ async def create_checkout_session(
                     
                     latest_invoice = None
                     if updated_subscription.get('latest_invoice'):
-                       latest_invoice = stripe.Invoice.retrieve(updated_subscription['latest_invoice']) 
+                       latest_invoice = await stripe_client.lookup(stripe.Invoice.retrieve, updated_subscription['latest_invoice']) 
                     
                     return {
                         "subscription_id": updated_subscription['id'],
@@ -369,12 +455,12 @@ async def create_checkout_session(
                         
                         # Retrieve the subscription again to get the schedule ID if it exists
                         # This ensures we have the latest state before creating/modifying schedule
-                        sub_with_schedule = stripe.Subscription.retrieve(subscription_id)
+                        sub_with_schedule = await stripe_client.lookup(stripe.Subscription.retrieve, subscription_id)
                         schedule_id = sub_with_schedule.get('schedule')
 
                         # Get the current phase configuration from the schedule or subscription
                         if schedule_id:
-                            schedule = stripe.SubscriptionSchedule.retrieve(schedule_id)
+                            schedule = await stripe_client.lookup(stripe.SubscriptionSchedule.retrieve, schedule_id)
                             # Find the current phase in the schedule
                             # This logic assumes simple schedules; might need refinement for complex ones
                             current_phase = None
@@ -439,7 +525,8 @@ async def create_checkout_session(
                             logger.info(f"Updating existing schedule {schedule_id} for subscription {subscription_id}")
                             logger.debug(f"Current phase data: {current_phase_update_data}")
                             logger.debug(f"New phase data: {new_downgrade_phase_data}")
-                            updated_schedule = stripe.SubscriptionSchedule.modify(
+                            updated_schedule = await stripe_client.call(
+                                stripe.SubscriptionSchedule.modify,
                                 schedule_id,
                                 phases=[current_phase_update_data, new_downgrade_phase_data],
                                 end_behavior='release' 
@@ -454,7 +541,8 @@ async def create_checkout_session(
                             logger.debug(f"Current price: {current_price_id}, New price: {request.price_id}")
                             
                             try:
-                                updated_schedule = stripe.SubscriptionSchedule.create(
+                                updated_schedule = await stripe_client.call(
+                                    stripe.SubscriptionSchedule.create,
                                     from_subscription=subscription_id,
                                     phases=[
                                         {
@@ -486,7 +574,7 @@ async def create_checkout_session(
                                 # print(f"Created new schedule {updated_schedule['id']} from subscription {subscription_id}")
                                 
                                 # Verify the schedule was created correctly
-                                fetched_schedule = stripe.SubscriptionSchedule.retrieve(updated_schedule['id'])
+                                fetched_schedule = await stripe_client.lookup(stripe.SubscriptionSchedule.retrieve, updated_schedule['id'])
                                 logger.info(f"Schedule verification - Status: {fetched_schedule.get('status')}, Phase Count: {len(fetched_schedule.get('phases', []))}")
                                 logger.debug(f"Schedule details: {fetched_schedule}")
                             except Exception as schedule_error:
@@ -514,7 +602,8 @@ async def create_checkout_session(
                 raise HTTPException(status_code=500, detail=f"Error updating subscription: {str(e)}")
         else:
             # --- Create New Subscription via Checkout Session ---
-            session = stripe.checkout.Session.create(
+            session = await stripe_client.call(
+                stripe.checkout.Session.create,
                 customer=customer_id,
                 payment_method_types=['card'],
                     line_items=[{'price': request.price_id, 'quantity': 1}],
@@ -564,7 +653,7 @@ async def create_portal_session(
         # Ensure the portal configuration has subscription_update enabled
         try:
             # First, check if we have a configuration that already enables subscription update
-            configurations = stripe.billing_portal.Configuration.list(limit=100)
+            configurations = await stripe_client.lookup(stripe.billing_portal.Configuration.list, limit=100)
             active_config = None
             
             # Look for a configuration with subscription_update enabled
@@ -583,7 +672,8 @@ async def create_portal_session(
                     default_config = configurations['data'][0]
                     logger.info(f"Updating default portal configuration: {default_config['id']} to enable subscription_update")
                     
-                    active_config = stripe.billing_portal.Configuration.update(
+                    active_config = await stripe_client.call(
+                        stripe.billing_portal.Configuration.update,
                         default_config['id'],
                         features={
                             'subscription_update': {
@@ -600,7 +690,8 @@ async def create_portal_session(
                 else:
                     # Create a new configuration with subscription_update enabled
                     logger.info("Creating new portal configuration with subscription_update enabled")
-                    active_config = stripe.billing_portal.Configuration.create(
+                    active_config = await stripe_client.call(
+                        stripe.billing_portal.Configuration.create,
                         business_profile={
                             'headline': 'Subscription Management',
                             'privacy_policy_url': config.FRONTEND_URL + '/privacy',
@@ -638,7 +729,7 @@ async def create_portal_session(
             portal_params["configuration"] = active_config['id']
         
         # Create the session
-        session = stripe.billing_portal.Session.create(**portal_params)
+        session = await stripe_client.call(stripe.billing_portal.Session.create, **portal_params)
         
         return {"url": session.url}
         
@@ -697,7 +788,7 @@ async def get_subscription(
         schedule_id = subscription.get('schedule')
         if schedule_id:
             try:
-                schedule = stripe.SubscriptionSchedule.retrieve(schedule_id)
+                schedule = await stripe_client.lookup(stripe.SubscriptionSchedule.retrieve, schedule_id)
                 # Find the *next* phase after the current one
                 next_phase = None
                 current_phase_end = current_item['current_period_end']
@@ -797,11 +888,13 @@ async def stripe_webhook(request: Request):
                 else:
                     # Subscription is not active (e.g., past_due, canceled, etc.)
                     # Check if customer has any other active subscriptions before updating status
-                    has_active = len(stripe.Subscription.list(
+                    active_subscriptions = await stripe_client.lookup(
+                        stripe.Subscription.list,
                         customer=customer_id,
                         status='active',
                         limit=1
-                    ).get('data', [])) > 0
+                    )
+                    has_active = len(active_subscriptions.get('data', [])) > 0
                     
                     if not has_active:
                         await client.schema('basejump').from_('billing_customers').update(
@@ -811,11 +904,13 @@ async def stripe_webhook(request: Request):
             
             elif event.type == 'customer.subscription.deleted':
                 # Check if customer has any other active subscriptions
-                has_active = len(stripe.Subscription.list(
+                active_subscriptions = await stripe_client.lookup(
+                    stripe.Subscription.list,
                     customer=customer_id,
                     status='active',
                     limit=1
-                ).get('data', [])) > 0
+                )
+                has_active = len(active_subscriptions.get('data', [])) > 0
                 
                 if not has_active:
                     # If no active subscriptions left, set active to false
@@ -824,6 +919,12 @@ async def stripe_webhook(request: Request):
                     ).eq('id', customer_id).execute()
                     logger.info(f"Webhook: Updated customer {customer_id} active status to FALSE after subscription deletion")
             
+            # Billing checks read the cached entitlement, so update it now
+            try:
+                await refresh_entitlement_for_customer(client, customer_id)
+            except Exception as e:
+                logger.error(f"Failed to refresh entitlement for customer {customer_id}: {str(e)}")
+                
             logger.info(f"Processed {event.type} event for customer {customer_id}")
         
         return {"status": "success"}
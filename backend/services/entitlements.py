@@ -0,0 +1,160 @@
+"""
+Cached account entitlements for billing checks.
+
+Resolving what an account may do (admin flag, Stripe subscription, tier and
+minute limit) takes a Supabase query and a Stripe call, and billing is checked
+before every agent iteration. Entitlements are therefore cached per account:
+in process memory for ENTITLEMENT_LOCAL_TTL seconds, answering the hot path
+without I/O, and in Redis for ENTITLEMENT_CACHE_TTL seconds, shared between
+workers. The Stripe webhook refreshes an account's entry when its subscription
+changes, so the TTLs only bound staleness for missed events.
+"""
+
+import asyncio
+import json
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from services import redis
+from utils.config import config
+from utils.logger import logger
+
+REDIS_KEY_PREFIX = "entitlement"
+
+
+@dataclass
+class Entitlement:
+    """What an account is entitled to.
+
+    Attributes:
+        account_id: The account
+        is_admin: Admins are not subject to billing limits
+        price_id: Stripe price of the account's plan
+        tier_name: Name of the subscription tier
+        minutes_limit: Agent minutes per month
+        subscription: The subscription as returned to API clients
+    """
+    account_id: str
+    is_admin: bool
+    price_id: Optional[str] = None
+    tier_name: Optional[str] = None
+    minutes_limit: Optional[int] = None
+    subscription: Optional[Dict[str, Any]] = None
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), default=str)
+
+    @classmethod
+    def from_json(cls, data: str) -> "Entitlement":
+        return cls(**json.loads(data))
+
+
+EntitlementLoader = Callable[[], Awaitable[Entitlement]]
+
+
+class EntitlementCache:
+    """Two-level (memory, Redis) cache of entitlements by account."""
+
+    def __init__(self):
+        # account_id -> (entitlement, monotonic expiry)
+        self._local: Dict[str, Tuple[Entitlement, float]] = {}
+        # Loads in flight, so concurrent misses for an account share one load
+        self._loading: Dict[str, asyncio.Future] = {}
+        # Bumped by refresh and invalidate; a load only stores its result if no
+        # newer refresh or invalidation happened while it ran
+        self._generations: Dict[str, int] = {}
+
+    async def get(self, account_id: str, loader: EntitlementLoader) -> Entitlement:
+        """Get an account's entitlement, loading it on a miss.
+
+        Args:
+            account_id: The account
+            loader: Resolves the entitlement from the database and Stripe
+
+        Returns:
+            The entitlement
+        """
+        cached = self._local.get(account_id)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+
+        shared = await self._get_shared(account_id)
+        if shared is not None:
+            self._set_local(shared)
+            return shared
+
+        return await self._load(account_id, loader)
+
+    async def refresh(self, account_id: str, loader: EntitlementLoader) -> Entitlement:
+        """Reload an account's entitlement, replacing any cached copy.
+
+        Always starts a new load, since a load already in flight may have read
+        the account before the change that prompted the refresh; that load's
+        result is no longer cached.
+        """
+        self._bump_generation(account_id)
+        self._local.pop(account_id, None)
+        return await self._load(account_id, loader, join=False)
+
+    async def invalidate(self, account_id: str) -> None:
+        """Drop an account's cached entitlement everywhere."""
+        self._bump_generation(account_id)
+        self._local.pop(account_id, None)
+        try:
+            await redis.delete(f"{REDIS_KEY_PREFIX}:{account_id}")
+        except Exception as e:
+            logger.warning(f"Failed to invalidate shared entitlement for {account_id}: {str(e)}")
+
+    def _bump_generation(self, account_id: str) -> None:
+        self._generations[account_id] = self._generations.get(account_id, 0) + 1
+
+    async def _load(self, account_id: str, loader: EntitlementLoader, join: bool = True) -> Entitlement:
+        loading = self._loading.get(account_id)
+        if join and loading is not None:
+            return await asyncio.shield(loading)
+
+        generation = self._generations.get(account_id, 0)
+        future = asyncio.get_running_loop().create_future()
+        self._loading[account_id] = future
+        try:
+            entitlement = await loader()
+            if self._generations.get(account_id, 0) == generation:
+                self._set_local(entitlement)
+                await self._set_shared(entitlement)
+            else:
+                logger.debug(f"Not caching superseded entitlement load for {account_id}")
+            future.set_result(entitlement)
+            return entitlement
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            # A newer load may have taken the slot
+            if self._loading.get(account_id) is future:
+                del self._loading[account_id]
+
+    def _set_local(self, entitlement: Entitlement) -> None:
+        self._local[entitlement.account_id] = (entitlement, time.monotonic() + config.ENTITLEMENT_LOCAL_TTL)
+
+    async def _get_shared(self, account_id: str) -> Optional[Entitlement]:
+        try:
+            data = await redis.get(f"{REDIS_KEY_PREFIX}:{account_id}")
+            return Entitlement.from_json(data) if data else None
+        except Exception as e:
+            logger.warning(f"Failed to read shared entitlement for {account_id}: {str(e)}")
+            return None
+
+    async def _set_shared(self, entitlement: Entitlement) -> None:
+        try:
+            await redis.set(f"{REDIS_KEY_PREFIX}:{entitlement.account_id}", entitlement.to_json(), ex=config.ENTITLEMENT_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Failed to store shared entitlement for {entitlement.account_id}: {str(e)}")
+
+
+entitlement_cache = EntitlementCache()
@@ -10,14 +10,19 @@ This module provides a unified interface for making API calls to different LLM p
 - Comprehensive error handling and logging
 """
 
-from typing import Union, Dict, Any, Optional, AsyncGenerator, List
+from typing import Union, Dict, Any, Optional, AsyncGenerator, List, Literal, Callable
 import os
 import json
 import asyncio
-from openai import OpenAIError
+import time
+from openai import OpenAIError, APIError, APIConnectionError
 import litellm
 from utils.logger import logger
 from utils.config import config
+from services.llm_router import llm_router
+from services import redis
+from services.llm_replay import is_replay_model, is_model_allowed, replay_response, record_stream, record_response
+from utils import tracing
 from datetime import datetime
 import traceback
 
@@ -29,6 +34,16 @@ MAX_RETRIES = 3
 RATE_LIMIT_DELAY = 30
 RETRY_DELAY = 5
 
+# Prompt cache layout: "legacy" marks the system prompt, the last two user messages and the
+# last assistant message; "stable" keeps breakpoints on an append-only prefix (see prepare_params)
+PromptCacheLayout = Literal["legacy", "stable"]
+MAX_CACHE_BREAKPOINTS = 4           # Anthropic allows at most 4 cache_control blocks per request
+MIN_CACHEABLE_PREFIX_CHARS = 4096   # ~1024 tokens, the smallest prefix Anthropic will cache
+CACHE_ANCHOR_STRIDE_CHARS = 40000   # ~10k tokens between fixed anchor breakpoints in the history
+
+# Hedged streaming requests
+HEDGE_MIN_SAMPLES = 10              # TTFT samples a deployment needs before its p90 is trusted
+
 class LLMError(Exception):
     """Base exception for LLM-related errors."""
     pass
@@ -66,6 +81,30 @@ def setup_api_keys() -> None:
     else:
         logger.warning(f"Missing AWS credentials for Bedrock integration - access_key: {bool(aws_access_key)}, secret_key: {bool(aws_secret_key)}, region: {aws_region}")
 
+def is_deployment_error(error: BaseException) -> bool:
+    """Check whether an error counts against the deployment that raised it.
+
+    Rate limits, server errors, connection problems, timeouts and unreadable
+    responses do, and another deployment may succeed. Client errors (bad request,
+    context window exceeded, authentication, not found, ...) would fail the same
+    way everywhere, and other exceptions are local bugs, so neither does.
+    """
+    if isinstance(error, (json.JSONDecodeError, asyncio.TimeoutError, APIConnectionError)):
+        return True
+    if not isinstance(error, OpenAIError):
+        return False
+    status_code = getattr(error, "status_code", None)
+    if isinstance(status_code, int):
+        return status_code in (408, 429) or status_code >= 500
+    return isinstance(error, APIError)
+
+def _record_error(deployment: str, error: BaseException) -> None:
+    """Record a failed request against its deployment, if the error is the deployment's."""
+    if is_deployment_error(error):
+        llm_router.record_failure(deployment, error)
+    else:
+        llm_router.release(deployment)
+
 async def handle_error(error: Exception, attempt: int, max_attempts: int) -> None:
     """Handle API errors with appropriate delays and logging."""
     delay = RATE_LIMIT_DELAY if isinstance(error, litellm.exceptions.RateLimitError) else RETRY_DELAY
@@ -87,9 +126,16 @@ def prepare_params(
     top_p: Optional[float] = None,
     model_id: Optional[str] = None,
     enable_thinking: Optional[bool] = False,
-    reasoning_effort: Optional[str] = 'low'
+    reasoning_effort: Optional[str] = 'low',
+    cache_layout: PromptCacheLayout = "legacy",
+    volatile_tail: int = 0
 ) -> Dict[str, Any]:
-    """Prepare parameters for the API call."""
+    """Prepare parameters for the API call.
+
+    With cache_layout="stable", the last `volatile_tail` messages (e.g. a temporary
+    browser/image message) are treated as volatile and never cached, and usage is
+    requested for streamed responses so cache read/write tokens can be reported.
+    """
     params = {
         "model": model_name,
         "messages": messages,
@@ -160,7 +206,12 @@ def prepare_params(
     # Apply Anthropic prompt caching (minimal implementation)
     # Check model name *after* potential modifications (like adding bedrock/ prefix)
     effective_model_name = params.get("model", model_name) # Use model from params if set, else original
-    if "claude" in effective_model_name.lower() or "anthropic" in effective_model_name.lower():
+    if cache_layout == "stable":
+        if stream:
+            params["stream_options"] = {"include_usage": True}
+        if "claude" in effective_model_name.lower() or "anthropic" in effective_model_name.lower():
+            params["messages"] = apply_stable_cache_breakpoints(params["messages"], volatile_tail)
+    elif "claude" in effective_model_name.lower() or "anthropic" in effective_model_name.lower():
         messages = params["messages"] # Direct reference, modification affects params
 
         # Ensure messages is a list
@@ -238,6 +289,103 @@ def prepare_params(
 
     return params
 
+def _message_chars(message: Dict[str, Any]) -> int:
+    """Approximate the size of a message from the length of its text."""
+    content = message.get("content")
+    if isinstance(content, str):
+        return len(content)
+    if isinstance(content, list):
+        return sum(len(item.get("text", "")) for item in content if isinstance(item, dict))
+    return len(json.dumps(content)) if content is not None else 0
+
+def _with_cache_control(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Return a copy of a message with cache_control on its last text block."""
+    content = message.get("content")
+    if isinstance(content, str):
+        return {**message, "content": [{"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}]}
+    if isinstance(content, list):
+        blocks = [dict(item) if isinstance(item, dict) else item for item in content]
+        for item in reversed(blocks):
+            if isinstance(item, dict) and item.get("type") == "text":
+                item["cache_control"] = {"type": "ephemeral"}
+                return {**message, "content": blocks}
+    return message
+
+def apply_stable_cache_breakpoints(messages: List[Dict[str, Any]], volatile_tail: int = 0) -> List[Dict[str, Any]]:
+    """Place Anthropic cache breakpoints for an append-only prompt.
+
+    Breakpoints go on the system prompt, on the last stable message (everything
+    before the volatile tail) and on up to two anchor messages in the history,
+    chosen where the cumulative prefix size crosses a multiple of
+    CACHE_ANCHOR_STRIDE_CHARS. Anchors only depend on the messages before them,
+    so as the thread grows they stay on the same messages and keep hitting the
+    cache even when many messages were appended since the previous call.
+    Prefixes below MIN_CACHEABLE_PREFIX_CHARS are not marked.
+
+    Args:
+        messages: Messages to send; not modified
+        volatile_tail: Number of trailing messages that change on every call
+
+    Returns:
+        New message list with cache_control applied
+    """
+    if not isinstance(messages, list) or not messages:
+        return messages
+
+    stable_count = max(0, len(messages) - max(0, volatile_tail))
+    breakpoints = []
+
+    prefix_chars = 0
+    anchors = []
+    for i in range(stable_count):
+        previous_stride = prefix_chars // CACHE_ANCHOR_STRIDE_CHARS
+        prefix_chars += _message_chars(messages[i])
+        if i > 0 and prefix_chars // CACHE_ANCHOR_STRIDE_CHARS > previous_stride:
+            anchors.append(i)
+
+    if messages[0].get("role") == "system" and _message_chars(messages[0]) >= MIN_CACHEABLE_PREFIX_CHARS:
+        breakpoints.append(0)
+    if stable_count > 0 and prefix_chars >= MIN_CACHEABLE_PREFIX_CHARS:
+        breakpoints.append(stable_count - 1)
+    for anchor in reversed(anchors):
+        if len(breakpoints) >= MAX_CACHE_BREAKPOINTS:
+            break
+        breakpoints.append(anchor)
+
+    result = list(messages)
+    for i in set(breakpoints):
+        result[i] = _with_cache_control(result[i])
+    logger.debug(f"Stable prompt cache breakpoints at {sorted(set(breakpoints))} of {len(messages)} messages ({volatile_tail} volatile)")
+    return result
+
+def extract_cache_usage(usage: Any) -> Optional[Dict[str, int]]:
+    """Get prompt/completion and prompt cache read/write token counts from a response's usage.
+
+    Args:
+        usage: The usage object (or dict) of an LLM response
+
+    Returns:
+        Dict with prompt_tokens, completion_tokens, cache_read_tokens and cache_write_tokens,
+        or None if no usage is available
+    """
+    if usage is None:
+        return None
+
+    def _get(obj: Any, name: str) -> Any:
+        return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+    cache_read = _get(usage, "cache_read_input_tokens")
+    if cache_read is None:
+        details = _get(usage, "prompt_tokens_details")
+        cache_read = _get(details, "cached_tokens") if details is not None else None
+
+    return {
+        "prompt_tokens": _get(usage, "prompt_tokens") or 0,
+        "completion_tokens": _get(usage, "completion_tokens") or 0,
+        "cache_read_tokens": cache_read or 0,
+        "cache_write_tokens": _get(usage, "cache_creation_input_tokens") or 0,
+    }
+
 async def make_llm_api_call(
     messages: List[Dict[str, Any]],
     model_name: str,
@@ -252,11 +400,19 @@ async def make_llm_api_call(
     top_p: Optional[float] = None,
     model_id: Optional[str] = None,
     enable_thinking: Optional[bool] = False,
-    reasoning_effort: Optional[str] = 'low'
+    reasoning_effort: Optional[str] = 'low',
+    cache_layout: PromptCacheLayout = "legacy",
+    volatile_tail: int = 0,
+    hedge_account_id: Optional[str] = None
 ) -> Union[Dict[str, Any], AsyncGenerator]:
     """
     Make an API call to a language model using LiteLLM.
 
+    If the model has equivalent deployments (see services.llm_router), the call goes to
+    the fastest healthy one and fails over to the others on errors or a stalled first chunk.
+    Streamed calls with a hedge_account_id may also be hedged (see _open_hedged_stream).
+    Models named "replay/<fixture>" play back a recorded response (see services.llm_replay).
+
     Args:
         messages: List of message dictionaries for the conversation
         model_name: Name of the model to use (e.g., "gpt-4", "claude-3", "openrouter/openai/gpt-4", "bedrock/anthropic.claude-3-sonnet-20240229-v1:0")
@@ -272,58 +428,375 @@ async def make_llm_api_call(
         model_id: Optional ARN for Bedrock inference profiles
         enable_thinking: Whether to enable thinking
         reasoning_effort: Level of reasoning effort
+        cache_layout: Prompt cache breakpoint layout ("legacy" or "stable")
+        volatile_tail: Number of trailing messages that must not be cached (stable layout)
+        hedge_account_id: Account to charge hedged requests to; hedging is off without it
 
     Returns:
         Union[Dict[str, Any], AsyncGenerator]: API response or stream
 
     Raises:
         LLMRetryError: If API call fails after retries
-        LLMError: For other API-related errors
+        LLMError: For other API-related errors, including requests the provider
+                  rejects (4xx), which are neither retried nor failed over
     """
+    llm_span = tracing.start_span("llm.call", model=model_name, stream=stream)
+    call_start = time.monotonic()
+    try:
+        response = await _make_llm_api_call(
+            llm_span,
+            messages=messages,
+            model_name=model_name,
+            response_format=response_format,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            tools=tools,
+            tool_choice=tool_choice,
+            api_key=api_key,
+            api_base=api_base,
+            stream=stream,
+            top_p=top_p,
+            model_id=model_id,
+            enable_thinking=enable_thinking,
+            reasoning_effort=reasoning_effort,
+            cache_layout=cache_layout,
+            volatile_tail=volatile_tail,
+            hedge_account_id=hedge_account_id
+        )
+    except BaseException as e:
+        llm_span.record_error(e)
+        llm_span.end()
+        raise
+
+    if not tracing.enabled():
+        return response
+    if stream:
+        return _traced_stream(response, llm_span, call_start)
+    _end_llm_span(llm_span, getattr(response, "usage", None), call_start, None, 0)
+    return response
+
+async def _make_llm_api_call(
+    llm_span: tracing.Span,
+    messages: List[Dict[str, Any]],
+    model_name: str,
+    response_format: Optional[Any] = None,
+    temperature: float = 0,
+    max_tokens: Optional[int] = None,
+    tools: Optional[List[Dict[str, Any]]] = None,
+    tool_choice: str = "auto",
+    api_key: Optional[str] = None,
+    api_base: Optional[str] = None,
+    stream: bool = False,
+    top_p: Optional[float] = None,
+    model_id: Optional[str] = None,
+    enable_thinking: Optional[bool] = False,
+    reasoning_effort: Optional[str] = 'low',
+    cache_layout: PromptCacheLayout = "legacy",
+    volatile_tail: int = 0,
+    hedge_account_id: Optional[str] = None
+) -> Union[Dict[str, Any], AsyncGenerator]:
+    """Make the LLM API call; see make_llm_api_call."""
     # debug <timestamp>.json messages
     logger.info(f"Making LLM API call to model: {model_name} (Thinking: {enable_thinking}, Effort: {reasoning_effort})")
     logger.info(f"📡 API Call: Using model {model_name}")
-    params = prepare_params(
-        messages=messages,
-        model_name=model_name,
-        temperature=temperature,
-        max_tokens=max_tokens,
-        response_format=response_format,
-        tools=tools,
-        tool_choice=tool_choice,
-        api_key=api_key,
-        api_base=api_base,
-        stream=stream,
-        top_p=top_p,
-        model_id=model_id,
-        enable_thinking=enable_thinking,
-        reasoning_effort=reasoning_effort
-    )
+
+    if is_replay_model(model_name):
+        if not is_model_allowed(model_name):
+            raise LLMError(f"API call failed: replay models are disabled (model: {model_name})")
+        try:
+            return await replay_response(model_name, stream)
+        except FileNotFoundError as e:
+            logger.error(f"Replay fixture error: {str(e)}")
+            raise LLMError(f"API call failed: {str(e)}")
+
+    # Equivalent deployments of the model; a failed attempt fails over to the next
+    # fastest healthy one before any backoff, so the caller only sees the response
+    deployments = llm_router.deployments_for(model_name)
+    if len(deployments) > 1:
+        logger.debug(f"Routing {model_name} between deployments: {deployments}")
+    max_attempts = max(MAX_RETRIES, len(deployments))
+
+    def _build_params(deployment: str) -> Dict[str, Any]:
+        return prepare_params(
+            messages=messages,
+            model_name=deployment,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            response_format=response_format,
+            tools=tools,
+            tool_choice=tool_choice,
+            api_key=api_key,
+            api_base=api_base,
+            stream=stream,
+            top_p=top_p,
+            model_id=model_id if deployment == model_name else None,
+            enable_thinking=enable_thinking,
+            reasoning_effort=reasoning_effort,
+            cache_layout=cache_layout,
+            volatile_tail=volatile_tail
+        )
+
+    tried: List[str] = []
     last_error = None
-    for attempt in range(MAX_RETRIES):
+    for attempt in range(max_attempts):
+        if len(tried) >= len(deployments):
+            tried = []
+        # If every circuit is open, keep trying the preferred deployment rather than failing outright
+        deployment = llm_router.select(deployments, exclude=tried) or deployments[0]
+        llm_span.set_attributes({"deployment": deployment, "attempts": attempt + 1})
+        attempt_start = time.monotonic()
         try:
-            logger.debug(f"Attempt {attempt + 1}/{MAX_RETRIES}")
+            logger.debug(f"Attempt {attempt + 1}/{max_attempts} via {deployment}")
+            params = _build_params(deployment)
             # logger.debug(f"API request parameters: {json.dumps(params, indent=2)}")
 
-            response = await litellm.acompletion(**params)
-            logger.debug(f"Successfully received API response from {model_name}")
+            if stream:
+                # Wait for the first chunk so a stalled deployment can still be failed over
+                if hedge_account_id and config.LLM_HEDGING_ENABLED:
+                    response = await _open_hedged_stream(params, deployment, deployments, _build_params, hedge_account_id)
+                else:
+                    response = await _open_stream(params, deployment)
+            else:
+                response = await litellm.acompletion(**params)
+                llm_router.record_success(deployment)
+            logger.debug(f"Successfully received API response from {deployment}")
+
+            # Fixtures for replay/<fixture> models
+            if config.LLM_RECORD_DIR:
+                if stream:
+                    response = record_stream(response, deployment, attempt_start)
+                else:
+                    await record_response(response, deployment, attempt_start)
             logger.debug(f"Response: {response}")
             return response
 
-        except (litellm.exceptions.RateLimitError, OpenAIError, json.JSONDecodeError) as e:
-            last_error = e
-            await handle_error(e, attempt, MAX_RETRIES)
+        except asyncio.CancelledError:
+            llm_router.release(deployment)
+            raise
 
         except Exception as e:
-            logger.error(f"Unexpected error during API call: {str(e)}", exc_info=True)
-            raise LLMError(f"API call failed: {str(e)}")
+            if not is_deployment_error(e):
+                # Every deployment would reject the request the same way, and a local
+                # bug says nothing about the provider, so don't retry or fail over
+                llm_router.release(deployment)
+                logger.error(f"LLM API call to {deployment} failed: {str(e)}", exc_info=True)
+                raise LLMError(f"API call failed: {str(e)}") from e
 
-    error_msg = f"Failed to make API call after {MAX_RETRIES} attempts"
+            last_error = e
+            llm_router.record_failure(deployment, e)
+            tried.append(deployment)
+            if len(tried) < len(deployments):
+                logger.warning(f"Error from {deployment} on attempt {attempt + 1}/{max_attempts}, failing over: {str(e)}")
+                continue
+            await handle_error(e, attempt, max_attempts)
+
+    error_msg = f"Failed to make API call after {max_attempts} attempts"
     if last_error:
         error_msg += f". Last error: {str(last_error)}"
     logger.error(error_msg, exc_info=True)
     raise LLMRetryError(error_msg)
 
+def _end_llm_span(llm_span: tracing.Span, usage: Any, call_start: float, first_chunk_time: Optional[float], chunks: int) -> None:
+    """Add timing and token usage to an LLM call span and end it."""
+    end_time = time.monotonic()
+    usage_info = extract_cache_usage(usage)
+    if usage_info:
+        llm_span.set_attributes(usage_info)
+    completion_tokens = usage_info["completion_tokens"] if usage_info else chunks
+    generation_start = first_chunk_time if first_chunk_time is not None else call_start
+    if completion_tokens and end_time > generation_start:
+        llm_span.set_attribute("tokens_per_second", round(completion_tokens / (end_time - generation_start), 2))
+    llm_span.set_attribute("chunks", chunks)
+    llm_span.end()
+
+async def _traced_stream(stream: AsyncGenerator, llm_span: tracing.Span, call_start: float) -> AsyncGenerator:
+    """Pass a stream through, recording time to first token and throughput on the call's span."""
+    first_chunk_time = None
+    chunks = 0
+    usage = None
+    try:
+        async for chunk in stream:
+            if first_chunk_time is None:
+                first_chunk_time = time.monotonic()
+                llm_span.set_attribute("ttft_ms", round((first_chunk_time - call_start) * 1000))
+            chunks += 1
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            yield chunk
+    except Exception as e:
+        llm_span.record_error(e)
+        raise
+    finally:
+        _end_llm_span(llm_span, usage, call_start, first_chunk_time, chunks)
+
+async def _close_stream(response: Any) -> None:
+    """Close an abandoned LiteLLM stream, ignoring errors."""
+    close = getattr(response, "aclose", None)
+    if close is None:
+        return
+    try:
+        await close()
+    except Exception as e:
+        logger.debug(f"Error closing abandoned LLM stream: {str(e)}")
+
+class _RoutedStream:
+    """A stream whose first chunk was already received, recording mid-stream failures.
+
+    Closing it closes the underlying response, even if it was never iterated.
+    """
+
+    def __init__(self, response: Any, first_chunk: Any, deployment: str):
+        self.response = response
+        self.first_chunk = first_chunk
+        self.deployment = deployment
+
+    async def __aiter__(self):
+        if self.first_chunk is None:
+            return
+        yield self.first_chunk
+        try:
+            async for chunk in self.response:
+                yield chunk
+        except Exception as e:
+            # Content was already passed on, so the error cannot be hidden; later calls avoid the deployment
+            _record_error(self.deployment, e)
+            raise
+
+    async def aclose(self) -> None:
+        await _close_stream(self.response)
+
+async def _open_stream(params: Dict[str, Any], deployment: str) -> _RoutedStream:
+    """Start a streamed call and wait for its first chunk, recording the deployment's time to first token.
+
+    Failures are left to the caller to record.
+
+    Raises:
+        asyncio.TimeoutError: If no chunk arrives within LLM_FIRST_CHUNK_TIMEOUT
+    """
+    start_time = time.monotonic()
+    try:
+        response = await litellm.acompletion(**params)
+    except asyncio.CancelledError:
+        llm_router.release(deployment)
+        raise
+    timeout = config.LLM_FIRST_CHUNK_TIMEOUT if config.LLM_FIRST_CHUNK_TIMEOUT > 0 else None
+    try:
+        first_chunk = await asyncio.wait_for(response.__anext__(), timeout=timeout)
+    except StopAsyncIteration:
+        first_chunk = None
+    except asyncio.TimeoutError:
+        await _close_stream(response)
+        raise asyncio.TimeoutError(f"No first chunk from {deployment} within {timeout}s")
+    except asyncio.CancelledError:
+        # Lost a hedge race, or the caller went away
+        llm_router.release(deployment)
+        await _close_stream(response)
+        raise
+    llm_router.record_success(deployment, time.monotonic() - start_time)
+    return _RoutedStream(response, first_chunk, deployment)
+
+# Hedge counts by budget key, used when Redis is unavailable
+_local_hedge_counts: Dict[str, int] = {}
+
+async def _consume_hedge_budget(account_id: str) -> bool:
+    """Take one hedge from an account's hourly budget (shared through Redis when available).
+
+    Returns:
+        True if the account may send a hedged request
+    """
+    budget = config.LLM_HEDGE_BUDGET_PER_HOUR
+    if budget <= 0:
+        return False
+    window = int(time.time() // 3600)
+    key = f"llm_hedge_budget:{account_id}:{window}"
+    try:
+        client = await redis.get_client()
+        used = await client.incr(key)
+        if used == 1:
+            await client.expire(key, 3600)
+    except Exception as e:
+        logger.warning(f"Hedge budget check failed for account {account_id}, using local count: {str(e)}")
+        if len(_local_hedge_counts) > 10000:
+            _local_hedge_counts.clear()
+        used = _local_hedge_counts.get(key, 0) + 1
+        _local_hedge_counts[key] = used
+    return used <= budget
+
+def _hedge_delay(deployment: str) -> Optional[float]:
+    """Time to wait for the first chunk before hedging: the deployment's recent p90 TTFT.
+
+    Returns:
+        Delay in seconds, or None if there are too few samples to hedge
+    """
+    stats = llm_router.stats(deployment)
+    if len(stats.latencies) < HEDGE_MIN_SAMPLES:
+        return None
+    return max(stats.percentile(0.9), config.LLM_HEDGE_MIN_DELAY_MS / 1000)
+
+async def _open_hedged_stream(
+    params: Dict[str, Any],
+    deployment: str,
+    deployments: List[str],
+    build_params: Callable[[str], Dict[str, Any]],
+    account_id: str
+) -> _RoutedStream:
+    """Start a streamed call, sending a second identical request if its first chunk is late.
+
+    If no chunk arrives within _hedge_delay, and the account has hedge budget left,
+    the request is also sent to an alternate deployment (or the same one if there
+    is no other). The stream that yields its first chunk first is returned and the
+    other request is cancelled, or closed if it has opened as well. Errors of the
+    primary request are raised only if the hedge fails too.
+    """
+    primary = asyncio.create_task(_open_stream(params, deployment))
+    delay = _hedge_delay(deployment)
+    if delay is None:
+        return await primary
+
+    task_deployments = {primary: deployment}
+    winner = None
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not await _consume_hedge_budget(account_id):
+            winner = primary
+            return await primary
+
+        alternate = llm_router.select(deployments, exclude=[deployment]) or deployment
+        logger.info(f"Hedging LLM request: no first chunk from {deployment} after {delay:.1f}s, also sending to {alternate}")
+        hedge = asyncio.create_task(_open_stream(build_params(alternate), alternate))
+        task_deployments[hedge] = alternate
+        pending = {primary, hedge}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    if task is hedge:
+                        _record_error(alternate, task.exception())
+                    continue
+                if task is hedge:
+                    logger.info(f"Hedged LLM request won by {alternate}")
+                    if primary.done() and primary.exception() is not None:
+                        # The caller never sees this error, so record it here
+                        _record_error(deployment, primary.exception())
+                else:
+                    logger.info(f"Hedged LLM request won by {deployment}")
+                winner = task
+                return task.result()
+        # Both failed: the caller records and handles the primary error
+        raise primary.exception()
+    finally:
+        # Stop the losing request (or both, if the caller went away)
+        for task, task_deployment in task_deployments.items():
+            if task is winner:
+                continue
+            if not task.done():
+                task.cancel()
+                # A task cancelled before it ran cannot release its probe itself
+                llm_router.release(task_deployment)
+            elif not task.cancelled() and task.exception() is None:
+                # Both opened in the same round; close the loser so its response is not left streaming
+                await _close_stream(task.result())
+
 # Initialize API keys on module import
 setup_api_keys()
 
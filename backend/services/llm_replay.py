@@ -0,0 +1,247 @@
+"""
+Recording and replay of LLM responses for offline benchmarking.
+
+When LLM_RECORD_DIR is set, every LLM response is written to a JSONL fixture
+together with the time each streamed chunk arrived. A model name of the form
+`replay/<fixture>` plays such a fixture back instead of calling a provider, at
+the original chunk timing or LLM_REPLAY_SPEED times faster, so the full
+ThreadManager -> ResponseProcessor -> run_agent_background path can be run and
+benchmarked without provider keys.
+
+Fixture format (one JSON object per line):
+    {"model": "...", "stream": true, "recorded_at": "..."}   header
+    {"t": 0.412, "chunk": {...}}                              streamed chunk, t = seconds since the request
+    {"t": 1.930, "response": {...}}                           non-streamed response
+
+Replay models are only accepted with LLM_REPLAY_ENABLED set, since they would
+let any caller read fixture files (possibly other users' recorded responses)
+and skip provider billing.
+
+`<fixture>` is either a single file (`<name>.jsonl`) or a directory of files
+that are replayed in name order, one per call, so multi-turn runs can be
+recorded and played back as a sequence.
+"""
+
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timezone
+from itertools import count
+from types import SimpleNamespace
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from utils.config import config
+from utils.logger import logger
+
+REPLAY_PREFIX = "replay/"
+
+
+def is_replay_model(model_name: str) -> bool:
+    """Whether a model name selects the replay backend."""
+    return bool(model_name) and model_name.startswith(REPLAY_PREFIX)
+
+
+def is_model_allowed(model_name: str) -> bool:
+    """Whether a model may be used; replay models only with LLM_REPLAY_ENABLED."""
+    return not is_replay_model(model_name) or config.LLM_REPLAY_ENABLED
+
+
+def _to_dict(obj: Any) -> Any:
+    """Convert a LiteLLM response or chunk to plain JSON-compatible data."""
+    if isinstance(obj, dict):
+        return obj
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if hasattr(obj, "json"):
+        return json.loads(obj.json())
+    return obj
+
+
+def _to_namespace(data: Any) -> Any:
+    """Convert recorded data to objects with attribute access, like LiteLLM responses."""
+    if isinstance(data, dict):
+        return SimpleNamespace(**{key: _to_namespace(value) for key, value in data.items()})
+    if isinstance(data, list):
+        return [_to_namespace(item) for item in data]
+    return data
+
+
+# ---------------------------------------------------------------------------
+# Recording
+# ---------------------------------------------------------------------------
+
+_record_sequence = count(1)
+
+
+def _fixture_path(model_name: str) -> str:
+    """Path of the next recording; the sequence number keeps a run's calls in order."""
+    safe_model = "".join(c if c.isalnum() or c in "-." else "_" for c in model_name)
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    return os.path.join(config.LLM_RECORD_DIR, f"{timestamp}_{next(_record_sequence):05d}_{safe_model}.jsonl")
+
+
+def _write_fixture(path: str, lines: List[Dict[str, Any]]) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(json.dumps(line, default=str) + "\n")
+    os.replace(tmp_path, path)
+
+
+def _header(model_name: str, stream: bool) -> Dict[str, Any]:
+    return {"model": model_name, "stream": stream, "recorded_at": datetime.now(timezone.utc).isoformat()}
+
+
+async def record_stream(stream: AsyncGenerator, model_name: str, start_time: float) -> AsyncGenerator:
+    """Pass a stream through unchanged while recording its chunks and their timing.
+
+    Args:
+        stream: The LLM response stream
+        model_name: Model (deployment) the response came from
+        start_time: time.monotonic() when the request was sent
+
+    Yields:
+        The chunks of the stream
+    """
+    lines = [_header(model_name, True)]
+    try:
+        async for chunk in stream:
+            try:
+                lines.append({"t": round(time.monotonic() - start_time, 4), "chunk": _to_dict(chunk)})
+            except Exception as e:
+                logger.warning(f"Could not record LLM chunk: {str(e)}")
+            yield chunk
+    finally:
+        path = _fixture_path(model_name)
+        try:
+            await asyncio.to_thread(_write_fixture, path, lines)
+            logger.info(f"Recorded LLM stream with {len(lines) - 1} chunks to {path}")
+        except Exception as e:
+            logger.error(f"Failed to record LLM stream to {path}: {str(e)}")
+
+
+async def record_response(response: Any, model_name: str, start_time: float) -> None:
+    """Record a non-streamed LLM response and its latency."""
+    path = _fixture_path(model_name)
+    try:
+        lines = [_header(model_name, False), {"t": round(time.monotonic() - start_time, 4), "response": _to_dict(response)}]
+        await asyncio.to_thread(_write_fixture, path, lines)
+        logger.info(f"Recorded LLM response to {path}")
+    except Exception as e:
+        logger.error(f"Failed to record LLM response to {path}: {str(e)}")
+
+
+# ---------------------------------------------------------------------------
+# Replay
+# ---------------------------------------------------------------------------
+
+# Next file index of directory fixtures
+_replay_cursors: Dict[str, int] = {}
+
+
+def _resolve_fixture(name: str) -> str:
+    """Get the fixture file for the next call to a `replay/<name>` model.
+
+    Raises:
+        FileNotFoundError: If the fixture does not exist or is outside LLM_REPLAY_DIR
+    """
+    base_dir = os.path.abspath(config.LLM_REPLAY_DIR)
+    path = os.path.abspath(os.path.join(base_dir, name))
+    if os.path.commonpath([base_dir, path]) != base_dir:
+        raise FileNotFoundError(f"Replay fixture {name} is outside {base_dir}")
+
+    if os.path.isdir(path):
+        files = sorted(f for f in os.listdir(path) if f.endswith(".jsonl"))
+        if not files:
+            raise FileNotFoundError(f"Replay fixture directory {path} has no .jsonl files")
+        index = _replay_cursors.get(path, 0)
+        _replay_cursors[path] = (index + 1) % len(files)
+        return os.path.join(path, files[index])
+
+    if not path.endswith(".jsonl"):
+        path += ".jsonl"
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"Replay fixture {path} not found")
+    return path
+
+
+def _load_fixture(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def _sleep_until(start_time: float, offset: float) -> None:
+    """Sleep until a recorded offset, scaled by LLM_REPLAY_SPEED (0 = no delays)."""
+    if config.LLM_REPLAY_SPEED <= 0:
+        return
+    delay = start_time + offset / config.LLM_REPLAY_SPEED - time.monotonic()
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+async def _replay_stream(lines: List[Dict[str, Any]]) -> AsyncGenerator:
+    start_time = time.monotonic()
+    for line in lines:
+        if "chunk" in line:
+            await _sleep_until(start_time, line.get("t", 0))
+            yield _to_namespace(line["chunk"])
+        elif "response" in line:
+            # A non-streamed recording played as a stream: one chunk with the whole message
+            await _sleep_until(start_time, line.get("t", 0))
+            response = line["response"]
+            choices = [
+                {"index": c.get("index", 0), "finish_reason": c.get("finish_reason"), "delta": c.get("message", {})}
+                for c in response.get("choices", [])
+            ]
+            yield _to_namespace({**response, "choices": choices})
+
+
+def _assemble_response(lines: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Build a non-streamed response from a recording (streamed recordings are concatenated)."""
+    for line in lines:
+        if "response" in line:
+            return line["response"]
+
+    content = ""
+    finish_reason = None
+    usage = None
+    for line in lines:
+        chunk = line.get("chunk")
+        if not chunk:
+            continue
+        usage = chunk.get("usage") or usage
+        for choice in chunk.get("choices") or []:
+            content += (choice.get("delta") or {}).get("content") or ""
+            finish_reason = choice.get("finish_reason") or finish_reason
+    return {
+        "choices": [{"index": 0, "finish_reason": finish_reason or "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": usage,
+    }
+
+
+async def replay_response(model_name: str, stream: bool) -> Any:
+    """Play back a recorded response for a `replay/<fixture>` model.
+
+    Args:
+        model_name: Model name starting with "replay/"
+        stream: Whether to return a stream of chunks or a complete response
+
+    Returns:
+        An async generator of chunks, or a response object
+
+    Raises:
+        FileNotFoundError: If the fixture does not exist
+    """
+    path = _resolve_fixture(model_name[len(REPLAY_PREFIX):])
+    lines = await asyncio.to_thread(_load_fixture, path)
+    logger.info(f"Replaying LLM fixture {path} (speed: {config.LLM_REPLAY_SPEED}x)")
+
+    if stream:
+        return _replay_stream(lines)
+
+    start_time = time.monotonic()
+    offset = max((line.get("t", 0) for line in lines[1:]), default=0)
+    await _sleep_until(start_time, offset)
+    return _to_namespace(_assemble_response(lines))
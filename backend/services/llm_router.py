@@ -0,0 +1,253 @@
+"""
+Latency-aware routing between equivalent LLM deployments.
+
+The same model is often reachable through several providers (e.g. Claude via
+Anthropic, AWS Bedrock and OpenRouter). This module groups such deployments,
+keeps rolling time-to-first-token and outcome statistics for each one, and
+picks the fastest deployment whose circuit breaker is closed. A deployment
+that keeps failing is taken out of rotation for a cool-down period and then
+probed again with a single request.
+
+Routing is off unless LLM_ROUTING_ENABLED is set, in which case a small share
+of requests (EXPLORE_RATE) also goes to slower deployments to keep their
+statistics current. Statistics are kept per process.
+"""
+
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional
+
+from utils.config import config
+from utils.logger import logger
+
+# Rolling window sizes
+LATENCY_WINDOW = 50
+OUTCOME_WINDOW = 20
+
+# Circuit breaker settings
+CIRCUIT_FAILURE_THRESHOLD = 3       # Consecutive failures that open the circuit
+CIRCUIT_ERROR_RATE = 0.5            # Error rate over the outcome window that opens the circuit
+CIRCUIT_MIN_OUTCOMES = 10           # Outcomes needed before the error rate is considered
+CIRCUIT_OPEN_SECONDS = 30           # Initial cool-down; doubles on every consecutive trip
+CIRCUIT_MAX_OPEN_SECONDS = 300
+CIRCUIT_PROBE_TIMEOUT_SECONDS = 120 # A probe with no outcome by then (e.g. lost track of) no longer blocks others
+
+# Share of requests sent to a deployment other than the fastest, to keep its statistics current
+EXPLORE_RATE = 0.05
+
+# Equivalent deployments by requested model, in order of preference
+DEFAULT_DEPLOYMENT_GROUPS: Dict[str, List[str]] = {
+    "anthropic/claude-3-7-sonnet-latest": [
+        "anthropic/claude-3-7-sonnet-latest",
+        "bedrock/anthropic.claude-3-7-sonnet-20250219-v1:0",
+        "openrouter/anthropic/claude-3.7-sonnet",
+    ],
+}
+
+
+@dataclass
+class DeploymentStats:
+    """Rolling statistics and circuit breaker state of one deployment.
+
+    Attributes:
+        name: Model name of the deployment as passed to LiteLLM
+        latencies: Recent time-to-first-token samples of streamed requests in seconds
+        outcomes: Recent request outcomes (True = success)
+        consecutive_failures: Failures since the last success
+        open_until: Monotonic time until which the circuit is open (0 = closed)
+        trips: Consecutive times the circuit has opened, for the back-off
+        probe_until: Monotonic time until which a half-open probe request is
+                     considered running (0 = no probe)
+    """
+    name: str
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=LATENCY_WINDOW))
+    outcomes: Deque[bool] = field(default_factory=lambda: deque(maxlen=OUTCOME_WINDOW))
+    consecutive_failures: int = 0
+    open_until: float = 0.0
+    trips: int = 0
+    probe_until: float = 0.0
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Get a latency percentile (0-1) over the window, or None without samples."""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def is_available(self, now: float) -> bool:
+        """Whether a request may be sent: circuit closed, or half-open with no probe running."""
+        if self.open_until == 0.0:
+            return True
+        return now >= self.open_until and now >= self.probe_until
+
+    def as_dict(self) -> Dict[str, object]:
+        p50 = self.percentile(0.5)
+        p90 = self.percentile(0.9)
+        return {
+            "p50_ttft_ms": round(p50 * 1000) if p50 is not None else None,
+            "p90_ttft_ms": round(p90 * 1000) if p90 is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "circuit_open": self.open_until > 0.0,
+        }
+
+
+class LLMRouter:
+    """Selects deployments for a model and records how they perform."""
+
+    def __init__(self, groups: Optional[Dict[str, List[str]]] = None):
+        """Initialize the router.
+
+        Args:
+            groups: Equivalent deployments by model name; defaults to the built-in
+                    groups or the LLM_DEPLOYMENTS setting
+        """
+        self.groups = groups if groups is not None else _load_groups()
+        self._stats: Dict[str, DeploymentStats] = {}
+
+    def stats(self, name: str) -> DeploymentStats:
+        if name not in self._stats:
+            self._stats[name] = DeploymentStats(name=name)
+        return self._stats[name]
+
+    def deployments_for(self, model_name: str) -> List[str]:
+        """Get the usable deployments for a model in order of preference.
+
+        Deployments whose provider has no credentials configured are left out. A
+        model without a group (or with routing disabled) only has itself.
+        """
+        if not config.LLM_ROUTING_ENABLED or model_name not in self.groups:
+            return [model_name]
+        deployments = [name for name in self.groups[model_name] if _has_credentials(name)]
+        return deployments or [model_name]
+
+    def select(self, deployments: List[str], exclude: Optional[List[str]] = None) -> Optional[str]:
+        """Pick the deployment to send the next request to.
+
+        Available deployments are ranked by median time-to-first-token. The
+        preferred (first) deployment is used until it has been measured, other
+        unmeasured ones rank behind measured ones, and a small share of requests
+        goes to another available deployment so its statistics do not go stale.
+
+        Args:
+            deployments: Candidate deployments in order of preference
+            exclude: Deployments already tried for this request
+
+        Returns:
+            Deployment name, or None if every candidate is excluded or has an open circuit
+        """
+        now = time.monotonic()
+        exclude = exclude or []
+        ranked = []
+        for index, name in enumerate(deployments):
+            if name in exclude:
+                continue
+            stats = self.stats(name)
+            if not stats.is_available(now):
+                continue
+            p50 = stats.percentile(0.5)
+            if p50 is None:
+                p50 = 0.0 if index == 0 else float('inf')
+            ranked.append((p50, index, name))
+        if not ranked:
+            return None
+
+        ranked.sort()
+        name = ranked[0][2]
+        if len(ranked) > 1 and random.random() < EXPLORE_RATE:
+            name = random.choice(ranked[1:])[2]
+        stats = self.stats(name)
+        if stats.open_until > 0.0:
+            # Half-open: let this single request probe the deployment
+            stats.probe_until = now + CIRCUIT_PROBE_TIMEOUT_SECONDS
+            logger.info(f"Probing LLM deployment {name} after circuit cool-down")
+        return name
+
+    def record_success(self, name: str, ttft: Optional[float] = None) -> None:
+        """Record a successful request.
+
+        Args:
+            name: The deployment
+            ttft: Time to first token in seconds, for streamed requests. Non-streamed
+                  requests have none, as their total time would skew the TTFT window.
+        """
+        stats = self.stats(name)
+        if ttft is not None:
+            stats.latencies.append(ttft)
+        stats.outcomes.append(True)
+        stats.consecutive_failures = 0
+        if stats.open_until > 0.0:
+            logger.info(f"Closing circuit for LLM deployment {name}")
+        stats.open_until = 0.0
+        stats.trips = 0
+        stats.probe_until = 0.0
+
+    def record_failure(self, name: str, error: Exception) -> None:
+        """Record a failed request, opening the deployment's circuit when it keeps failing."""
+        stats = self.stats(name)
+        stats.outcomes.append(False)
+        stats.consecutive_failures += 1
+        was_probe = stats.probe_until > 0.0
+        stats.probe_until = 0.0
+
+        too_many_errors = len(stats.outcomes) >= CIRCUIT_MIN_OUTCOMES and stats.error_rate >= CIRCUIT_ERROR_RATE
+        if was_probe or stats.consecutive_failures >= CIRCUIT_FAILURE_THRESHOLD or too_many_errors:
+            cool_down = min(CIRCUIT_OPEN_SECONDS * (2 ** stats.trips), CIRCUIT_MAX_OPEN_SECONDS)
+            stats.open_until = time.monotonic() + cool_down
+            stats.trips += 1
+            logger.warning(f"Opening circuit for LLM deployment {name} for {cool_down}s after error: {str(error)[:200]}")
+
+    def release(self, name: str) -> None:
+        """Forget a request that ended without an outcome (e.g. cancelled), so it no longer holds the probe."""
+        stats = self.stats(name)
+        if stats.probe_until > 0.0:
+            logger.debug(f"Probe of LLM deployment {name} ended without an outcome")
+        stats.probe_until = 0.0
+
+    def get_stats(self) -> Dict[str, Dict[str, object]]:
+        """Get a summary of every deployment's statistics (e.g. for health checks)."""
+        return {name: stats.as_dict() for name, stats in self._stats.items()}
+
+
+def _has_credentials(name: str) -> bool:
+    """Whether the provider of a deployment has credentials configured."""
+    if name.startswith("bedrock/"):
+        return bool(config.AWS_ACCESS_KEY_ID and config.AWS_SECRET_ACCESS_KEY and config.AWS_REGION_NAME)
+    if name.startswith("openrouter/"):
+        return bool(config.OPENROUTER_API_KEY)
+    if name.startswith("anthropic/") or "claude" in name:
+        return bool(config.ANTHROPIC_API_KEY)
+    if name.startswith("openai/"):
+        return bool(config.OPENAI_API_KEY)
+    if name.startswith("groq/"):
+        return bool(config.GROQ_API_KEY)
+    return True
+
+
+def _load_groups() -> Dict[str, List[str]]:
+    """Get the deployment groups, parsing LLM_DEPLOYMENTS ("model=dep1,dep2;model2=...") if set."""
+    if not config.LLM_DEPLOYMENTS:
+        return dict(DEFAULT_DEPLOYMENT_GROUPS)
+
+    groups: Dict[str, List[str]] = {}
+    for entry in config.LLM_DEPLOYMENTS.split(";"):
+        if "=" not in entry:
+            continue
+        model, deployments = entry.split("=", 1)
+        names = [name.strip() for name in deployments.split(",") if name.strip()]
+        if model.strip() and names:
+            groups[model.strip()] = names
+    if not groups:
+        logger.warning("LLM_DEPLOYMENTS is set but contains no valid groups, using the built-in groups")
+        return dict(DEFAULT_DEPLOYMENT_GROUPS)
+    return groups
+
+
+llm_router = LLMRouter()
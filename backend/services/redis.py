@@ -3,7 +3,8 @@ import os
 from dotenv import load_dotenv
 import asyncio
 from utils.logger import logger
-from typing import List, Any
+from utils import tracing
+from typing import List, Any, Dict, Optional, Tuple
 
 # Redis client
 client = None
@@ -88,12 +89,14 @@ async def get_client():
 
 
 # Basic Redis operations
+@tracing.traced("redis.set")
 async def set(key: str, value: str, ex: int = None):
     """Set a Redis key."""
     redis_client = await get_client()
     return await redis_client.set(key, value, ex=ex)
 
 
+@tracing.traced("redis.get")
 async def get(key: str, default: str = None):
     """Get a Redis key."""
     redis_client = await get_client()
@@ -101,12 +104,21 @@ async def get(key: str, default: str = None):
     return result if result is not None else default
 
 
+@tracing.traced("redis.getdel")
+async def getdel(key: str):
+    """Get a Redis key and delete it in one atomic operation."""
+    redis_client = await get_client()
+    return await redis_client.getdel(key)
+
+
+@tracing.traced("redis.delete")
 async def delete(key: str):
     """Delete a Redis key."""
     redis_client = await get_client()
     return await redis_client.delete(key)
 
 
+@tracing.traced("redis.publish")
 async def publish(channel: str, message: str):
     """Publish a message to a Redis channel."""
     redis_client = await get_client()
@@ -120,31 +132,59 @@ async def create_pubsub():
 
 
 # List operations
+@tracing.traced("redis.rpush")
 async def rpush(key: str, *values: Any):
     """Append one or more values to a list."""
     redis_client = await get_client()
     return await redis_client.rpush(key, *values)
 
 
+@tracing.traced("redis.lrange")
 async def lrange(key: str, start: int, end: int) -> List[str]:
     """Get a range of elements from a list."""
     redis_client = await get_client()
     return await redis_client.lrange(key, start, end)
 
 
+@tracing.traced("redis.llen")
 async def llen(key: str) -> int:
     """Get the length of a list."""
     redis_client = await get_client()
     return await redis_client.llen(key)
 
 
+# Stream operations
+@tracing.traced("redis.xadd")
+async def xadd(key: str, fields: Dict[str, str], maxlen: Optional[int] = None) -> str:
+    """Append an entry to a stream, trimming it to about maxlen entries; returns the entry ID."""
+    redis_client = await get_client()
+    return await redis_client.xadd(key, fields, maxlen=maxlen, approximate=True)
+
+
+@tracing.traced("redis.xrange")
+async def xrange(key: str, start: str = "-", end: str = "+", count: Optional[int] = None) -> List[Tuple[str, Dict[str, str]]]:
+    """Get the entries of a stream between two IDs (prefix an ID with "(" to exclude it)."""
+    redis_client = await get_client()
+    return await redis_client.xrange(key, min=start, max=end, count=count)
+
+
+@tracing.traced("redis.xread")
+async def xread(key: str, last_id: str, block_ms: Optional[int] = None, count: Optional[int] = None) -> List[Tuple[str, Dict[str, str]]]:
+    """Get the entries of a stream after last_id, waiting up to block_ms for new ones if there are none."""
+    redis_client = await get_client()
+    result = await redis_client.xread({key: last_id}, count=count, block=block_ms)
+    return result[0][1] if result else []
+
+
 # Key management
+@tracing.traced("redis.expire")
 async def expire(key: str, time: int):
     """Set a key's time to live in seconds."""
     redis_client = await get_client()
     return await redis_client.expire(key, time)
 
 
+@tracing.traced("redis.keys")
 async def keys(pattern: str) -> List[str]:
     """Get keys matching a pattern."""
     redis_client = await get_client()
@@ -0,0 +1,84 @@
+"""
+Non-blocking access to the synchronous Stripe SDK.
+
+Called directly from async handlers, each Stripe round trip blocks the event
+loop, and with it every agent stream the process is serving. Billing code calls
+the SDK through this module instead:
+
+- `call` runs an SDK call on a dedicated pool of STRIPE_MAX_CONCURRENCY worker
+  threads, which also bounds the number of concurrent Stripe requests. The
+  SDK's requests-based HTTP client keeps a keep-alive session per thread, so
+  the long-lived workers reuse their connections to the Stripe API.
+- `lookup` does the same for read-only calls, and lets concurrent calls with
+  the same arguments share one request. Coalesced callers receive the same
+  Stripe object, so they must not modify it.
+
+Usage:
+    from services import stripe_client
+
+    price = await stripe_client.lookup(stripe.Price.retrieve, price_id)
+    session = await stripe_client.call(stripe.checkout.Session.create, customer=customer_id, ...)
+"""
+
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict
+
+from utils.config import config
+
+_executor = ThreadPoolExecutor(max_workers=config.STRIPE_MAX_CONCURRENCY, thread_name_prefix="stripe")
+
+# Lookups in flight by call key
+_in_flight: Dict[str, asyncio.Future] = {}
+
+
+async def call(fn: Callable, *args: Any, **kwargs: Any) -> Any:
+    """Run a Stripe SDK call on the Stripe thread pool.
+
+    Args:
+        fn: SDK method, e.g. stripe.Subscription.modify
+        *args: Positional arguments of the call
+        **kwargs: Keyword arguments of the call
+
+    Returns:
+        The result of the call; its exceptions are raised unchanged
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(fn, *args, **kwargs))
+
+
+def _call_key(fn: Callable, args: tuple, kwargs: Dict[str, Any]) -> str:
+    # Methods like list() are shared by resource classes, so include the class
+    owner = getattr(getattr(fn, "__self__", None), "__name__", "")
+    arguments = json.dumps([args, kwargs], sort_keys=True, default=str)
+    return f"{owner}.{getattr(fn, '__name__', repr(fn))}:{arguments}"
+
+
+def _retrieve_exception(future: asyncio.Future) -> None:
+    # Avoid "exception was never retrieved" if every waiter was cancelled
+    if not future.cancelled():
+        future.exception()
+
+
+async def lookup(fn: Callable, *args: Any, **kwargs: Any) -> Any:
+    """Run a read-only Stripe SDK call, sharing one request between identical concurrent calls.
+
+    Args:
+        fn: Read-only SDK method, e.g. stripe.Price.retrieve
+        *args: Positional arguments of the call
+        **kwargs: Keyword arguments of the call
+
+    Returns:
+        The result of the call; its exceptions are raised unchanged
+    """
+    key = _call_key(fn, args, kwargs)
+    future = _in_flight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(call(fn, *args, **kwargs))
+        _in_flight[key] = future
+        future.add_done_callback(lambda done: _in_flight.pop(key, None) if _in_flight.get(key) is done else None)
+        future.add_done_callback(_retrieve_exception)
+    # A cancelled caller must not cancel the request for the others
+    return await asyncio.shield(future)
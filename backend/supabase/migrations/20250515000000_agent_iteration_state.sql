@@ -0,0 +1,57 @@
+-- Everything an agent loop iteration reads from the messages table, in one round trip:
+-- the type of the latest conversation message, plus the latest browser_state and
+-- image_context rows, which are deleted in the same transaction so they are
+-- consumed exactly once. Nothing is consumed if the latest message is from the
+-- assistant, since the loop stops without using them.
+CREATE OR REPLACE FUNCTION consume_agent_iteration_state(p_thread_id UUID)
+RETURNS JSONB
+SECURITY DEFINER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    latest_type TEXT;
+    browser_state_content JSONB;
+    image_context_content JSONB;
+BEGIN
+    SELECT type INTO latest_type
+    FROM messages
+    WHERE thread_id = p_thread_id
+    AND type IN ('assistant', 'tool', 'user')
+    ORDER BY created_at DESC
+    LIMIT 1;
+
+    IF latest_type = 'assistant' THEN
+        RETURN jsonb_build_object('latest_message_type', latest_type);
+    END IF;
+
+    DELETE FROM messages
+    WHERE message_id = (
+        SELECT message_id FROM messages
+        WHERE thread_id = p_thread_id AND type = 'browser_state'
+        ORDER BY created_at DESC
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING content INTO browser_state_content;
+
+    DELETE FROM messages
+    WHERE message_id = (
+        SELECT message_id FROM messages
+        WHERE thread_id = p_thread_id AND type = 'image_context'
+        ORDER BY created_at DESC
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING content INTO image_context_content;
+
+    RETURN jsonb_build_object(
+        'latest_message_type', latest_type,
+        'browser_state', browser_state_content,
+        'image_context', image_context_content
+    );
+END;
+$$;
+
+-- Consumes rows, so only the backend may call it
+REVOKE EXECUTE ON FUNCTION consume_agent_iteration_state FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION consume_agent_iteration_state TO service_role;
@@ -0,0 +1,121 @@
+-- Running per-account, per-month agent run usage, so billing checks read one row
+-- instead of scanning every run of the account.
+--
+-- A run's time is counted in the month it started (as the previous scan did).
+-- agent_runs.usage_accounted_until records how far a run has been counted:
+-- record_agent_run_usage adds the time since then, up to completed_at (or now
+-- for a run still in progress), so it can be called any number of times, when a
+-- run completes and periodically while it runs, without counting time twice.
+CREATE TABLE account_monthly_usage (
+    account_id UUID NOT NULL REFERENCES basejump.accounts(id) ON DELETE CASCADE,
+    month DATE NOT NULL,
+    seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT TIMEZONE('utc'::text, NOW()) NOT NULL,
+    PRIMARY KEY (account_id, month)
+);
+
+ALTER TABLE account_monthly_usage ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY account_monthly_usage_select_policy ON account_monthly_usage
+    FOR SELECT
+    USING (basejump.has_role_on_account(account_id) = true);
+
+GRANT SELECT ON TABLE account_monthly_usage TO authenticated;
+GRANT ALL PRIVILEGES ON TABLE account_monthly_usage TO service_role;
+
+ALTER TABLE agent_runs ADD COLUMN usage_accounted_until TIMESTAMP WITH TIME ZONE;
+
+-- Runs with time not yet counted: in progress, or completed since last counted
+CREATE INDEX idx_agent_runs_usage_pending ON agent_runs(started_at)
+    WHERE completed_at IS NULL OR usage_accounted_until IS DISTINCT FROM completed_at;
+
+-- Count a run's time since it was last counted; returns the seconds added.
+-- If a run's completed_at ends up before the time already counted (a sweep ran
+-- between the last iteration and the status update), the difference is taken back.
+CREATE OR REPLACE FUNCTION record_agent_run_usage(p_agent_run_id UUID)
+RETURNS DOUBLE PRECISION
+SECURITY DEFINER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    run_started_at TIMESTAMP WITH TIME ZONE;
+    run_completed_at TIMESTAMP WITH TIME ZONE;
+    run_accounted_until TIMESTAMP WITH TIME ZONE;
+    run_account_id UUID;
+    accounted_from TIMESTAMP WITH TIME ZONE;
+    accounted_until TIMESTAMP WITH TIME ZONE;
+    added_seconds DOUBLE PRECISION;
+BEGIN
+    SELECT agent_runs.started_at, agent_runs.completed_at, agent_runs.usage_accounted_until, threads.account_id
+    INTO run_started_at, run_completed_at, run_accounted_until, run_account_id
+    FROM agent_runs
+    JOIN threads ON threads.thread_id = agent_runs.thread_id
+    WHERE agent_runs.id = p_agent_run_id
+    FOR UPDATE OF agent_runs;
+
+    IF NOT FOUND OR run_account_id IS NULL THEN
+        RETURN 0;
+    END IF;
+
+    accounted_from := COALESCE(run_accounted_until, run_started_at);
+    accounted_until := COALESCE(run_completed_at, NOW());
+    IF accounted_until = accounted_from THEN
+        RETURN 0;
+    END IF;
+
+    added_seconds := EXTRACT(EPOCH FROM accounted_until - accounted_from);
+
+    INSERT INTO account_monthly_usage (account_id, month, seconds)
+    VALUES (run_account_id, date_trunc('month', run_started_at AT TIME ZONE 'utc')::date, added_seconds)
+    ON CONFLICT (account_id, month) DO UPDATE
+    SET seconds = account_monthly_usage.seconds + EXCLUDED.seconds,
+        updated_at = TIMEZONE('utc'::text, NOW());
+
+    UPDATE agent_runs SET usage_accounted_until = accounted_until WHERE id = p_agent_run_id;
+
+    RETURN added_seconds;
+END;
+$$;
+
+-- Count the time of all runs in progress, and of completed runs whose final
+-- time was not recorded (e.g. the process stopped first); returns the number of runs.
+CREATE OR REPLACE FUNCTION sweep_agent_run_usage()
+RETURNS INTEGER
+SECURITY DEFINER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    pending_run_id UUID;
+    swept INTEGER := 0;
+BEGIN
+    FOR pending_run_id IN
+        SELECT id FROM agent_runs
+        WHERE completed_at IS NULL OR usage_accounted_until IS DISTINCT FROM completed_at
+    LOOP
+        PERFORM record_agent_run_usage(pending_run_id);
+        swept := swept + 1;
+    END LOOP;
+    RETURN swept;
+END;
+$$;
+
+-- These change billed usage, so only the backend may call them
+REVOKE EXECUTE ON FUNCTION record_agent_run_usage FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION record_agent_run_usage TO service_role;
+REVOKE EXECUTE ON FUNCTION sweep_agent_run_usage FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION sweep_agent_run_usage TO service_role;
+
+-- Count the existing runs
+WITH accounted AS (
+    UPDATE agent_runs
+    SET usage_accounted_until = COALESCE(completed_at, NOW())
+    RETURNING thread_id, started_at, usage_accounted_until
+)
+INSERT INTO account_monthly_usage (account_id, month, seconds)
+SELECT threads.account_id,
+       date_trunc('month', accounted.started_at AT TIME ZONE 'utc')::date,
+       SUM(EXTRACT(EPOCH FROM accounted.usage_accounted_until - accounted.started_at))
+FROM accounted
+JOIN threads ON threads.thread_id = accounted.thread_id
+WHERE threads.account_id IS NOT NULL
+GROUP BY 1, 2;
@@ -0,0 +1,47 @@
+-- Insert a batch of messages in order, for write-behind message persistence.
+--
+-- Rows inserted by one statement would all get the same NOW() and lose their
+-- order, so each row is stamped with clock_timestamp() as it is inserted (moved
+-- 1 microsecond past the previous row if the clock has not advanced). Timestamps
+-- thus come from the database clock, like those of rows inserted one by one.
+CREATE OR REPLACE FUNCTION insert_messages(p_messages JSONB)
+RETURNS SETOF messages
+SECURITY DEFINER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    message JSONB;
+    message_created_at TIMESTAMP WITH TIME ZONE;
+    previous_created_at TIMESTAMP WITH TIME ZONE;
+    inserted messages;
+BEGIN
+    FOR message IN
+        SELECT value FROM jsonb_array_elements(p_messages) WITH ORDINALITY ORDER BY ordinality
+    LOOP
+        message_created_at := TIMEZONE('utc'::text, clock_timestamp());
+        IF previous_created_at IS NOT NULL AND message_created_at <= previous_created_at THEN
+            message_created_at := previous_created_at + INTERVAL '1 microsecond';
+        END IF;
+
+        INSERT INTO messages (message_id, thread_id, type, is_llm_message, content, metadata, created_at, updated_at)
+        VALUES (
+            (message->>'message_id')::UUID,
+            (message->>'thread_id')::UUID,
+            message->>'type',
+            COALESCE((message->>'is_llm_message')::BOOLEAN, TRUE),
+            message->'content',
+            COALESCE(message->'metadata', '{}'::jsonb),
+            message_created_at,
+            message_created_at
+        )
+        RETURNING * INTO inserted;
+
+        previous_created_at := message_created_at;
+        RETURN NEXT inserted;
+    END LOOP;
+END;
+$$;
+
+-- Bypasses the messages policies, so only the backend may call it
+REVOKE EXECUTE ON FUNCTION insert_messages FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION insert_messages TO service_role;
@@ -0,0 +1,39 @@
+-- browser_state rows are kept for the UI, which shows the screenshot of each
+-- browser action from them; the agent loop gets the browser state for its next
+-- LLM call from the thread's context slots. Stop consuming the rows.
+CREATE OR REPLACE FUNCTION consume_agent_iteration_state(p_thread_id UUID)
+RETURNS JSONB
+SECURITY DEFINER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    latest_type TEXT;
+    image_context_content JSONB;
+BEGIN
+    SELECT type INTO latest_type
+    FROM messages
+    WHERE thread_id = p_thread_id
+    AND type IN ('assistant', 'tool', 'user')
+    ORDER BY created_at DESC
+    LIMIT 1;
+
+    IF latest_type = 'assistant' THEN
+        RETURN jsonb_build_object('latest_message_type', latest_type);
+    END IF;
+
+    DELETE FROM messages
+    WHERE message_id = (
+        SELECT message_id FROM messages
+        WHERE thread_id = p_thread_id AND type = 'image_context'
+        ORDER BY created_at DESC
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING content INTO image_context_content;
+
+    RETURN jsonb_build_object(
+        'latest_message_type', latest_type,
+        'image_context', image_context_content
+    );
+END;
+$$;
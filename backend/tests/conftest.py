@@ -0,0 +1,29 @@
+"""
+Shared test setup.
+
+utils.config validates its required settings when it is imported, so
+placeholder values are set for any that are missing from the environment.
+Tests never reach the services these settings point to.
+"""
+
+import os
+
+REQUIRED_SETTINGS = {
+    "SUPABASE_URL": "http://localhost:54321",
+    "SUPABASE_ANON_KEY": "test",
+    "SUPABASE_SERVICE_ROLE_KEY": "test",
+    "REDIS_HOST": "localhost",
+    "REDIS_PASSWORD": "",
+    "DAYTONA_API_KEY": "test",
+    "DAYTONA_SERVER_URL": "http://localhost:3986/api",
+    "DAYTONA_TARGET": "us",
+    "TAVILY_API_KEY": "test",
+    "RAPID_API_KEY": "test",
+    "FIRECRAWL_API_KEY": "test",
+}
+
+for key, value in REQUIRED_SETTINGS.items():
+    os.environ.setdefault(key, value)
+
+# Use LiteLLM's bundled model cost map instead of fetching it on import
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from services import billing
+
+
+class FakeQuery:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.filters = []
+
+    def select(self, columns):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(("eq", column, value))
+        return self
+
+    def in_(self, column, values):
+        self.filters.append(("in", column, values))
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(("gte", column, value))
+        return self
+
+    async def execute(self):
+        self.client.queries.append((self.table, self.filters))
+        rows = self.client.tables[self.table]
+        if isinstance(rows, Exception):
+            raise rows
+        return type("Result", (), {"data": rows})()
+
+
+class FakeRpc:
+    def __init__(self, client, name, params):
+        self.client = client
+        self.name = name
+        self.params = params
+
+    async def execute(self):
+        self.client.rpcs.append((self.name, self.params))
+        if self.client.rpc_error:
+            raise self.client.rpc_error
+        return type("Result", (), {"data": 2})()
+
+
+class FakeClient:
+    def __init__(self, **tables):
+        self.tables = tables
+        self.queries = []
+        self.rpcs = []
+        self.rpc_error = None
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params):
+        return FakeRpc(self, name, params)
+
+
+def iso(moment):
+    return moment.isoformat().replace("+00:00", "Z")
+
+
+@pytest.mark.asyncio
+async def test_monthly_usage_reads_the_current_month_counter_in_minutes():
+    client = FakeClient(account_monthly_usage=[{"seconds": 4530.0}])
+
+    assert await billing.calculate_monthly_usage(client, "account-1") == pytest.approx(75.5)
+
+    now = datetime.now(timezone.utc)
+    table, filters = client.queries[0]
+    assert table == "account_monthly_usage"
+    assert ("eq", "account_id", "account-1") in filters
+    assert ("eq", "month", f"{now.year:04d}-{now.month:02d}-01") in filters
+
+
+@pytest.mark.asyncio
+async def test_monthly_usage_without_a_counter_row_is_zero():
+    client = FakeClient(account_monthly_usage=[])
+    assert await billing.calculate_monthly_usage(client, "account-1") == 0.0
+
+
+@pytest.mark.asyncio
+async def test_monthly_usage_falls_back_to_summing_runs():
+    now = datetime.now(timezone.utc)
+    runs = [
+        # 10 minutes, completed
+        {"started_at": iso(now - timedelta(minutes=30)), "completed_at": iso(now - timedelta(minutes=20))},
+        # 90 seconds so far, in progress
+        {"started_at": iso(now - timedelta(seconds=90)), "completed_at": None},
+    ]
+    client = FakeClient(
+        account_monthly_usage=RuntimeError("relation does not exist"),
+        threads=[{"thread_id": "t1"}, {"thread_id": "t2"}],
+        agent_runs=runs,
+    )
+
+    assert await billing.calculate_monthly_usage(client, "account-1") == pytest.approx(11.5, abs=0.05)
+
+    table, filters = client.queries[-1]
+    assert table == "agent_runs"
+    assert ("in", "thread_id", ["t1", "t2"]) in filters
+
+
+@pytest.mark.asyncio
+async def test_recording_usage_calls_the_rpc_and_survives_errors():
+    client = FakeClient()
+    await billing.record_agent_run_usage(client, "run-1")
+    await billing.sweep_agent_run_usage(client)
+    assert client.rpcs == [
+        ("record_agent_run_usage", {"p_agent_run_id": "run-1"}),
+        ("sweep_agent_run_usage", {}),
+    ]
+
+    # The sweep catches up on anything not recorded, so errors are only logged
+    client.rpc_error = ConnectionError("database unavailable")
+    await billing.record_agent_run_usage(client, "run-2")
+    await billing.sweep_agent_run_usage(client)
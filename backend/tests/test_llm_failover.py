@@ -0,0 +1,91 @@
+import asyncio
+import json
+
+import litellm
+import pytest
+
+from services import llm
+from services.llm_router import LLMRouter
+
+PRIMARY = "anthropic/claude-3-7-sonnet-latest"
+FALLBACK = "bedrock/anthropic.claude-3-7-sonnet-20250219-v1:0"
+
+
+@pytest.fixture
+def router(monkeypatch):
+    router = LLMRouter(groups={PRIMARY: [PRIMARY, FALLBACK]})
+    monkeypatch.setattr(router, "deployments_for", lambda model_name: [PRIMARY, FALLBACK])
+    monkeypatch.setattr(llm, "llm_router", router)
+    monkeypatch.setattr(llm.config, "LLM_RECORD_DIR", None, raising=False)
+    return router
+
+
+@pytest.fixture
+def completion_calls(monkeypatch):
+    calls = []
+    errors = []
+
+    async def fake_acompletion(**params):
+        calls.append(params["model"])
+        if errors:
+            raise errors.pop(0)
+        return {"model": params["model"]}
+
+    monkeypatch.setattr(litellm, "acompletion", fake_acompletion)
+    return calls, errors
+
+
+async def call():
+    return await llm.make_llm_api_call([{"role": "user", "content": "hi"}], PRIMARY)
+
+
+def bad_request():
+    return litellm.exceptions.BadRequestError("prompt is too long", model=PRIMARY, llm_provider="anthropic")
+
+
+@pytest.mark.parametrize("error,expected", [
+    (litellm.exceptions.RateLimitError("slow down", llm_provider="anthropic", model=PRIMARY), True),
+    (litellm.exceptions.ServiceUnavailableError("overloaded", llm_provider="anthropic", model=PRIMARY), True),
+    (litellm.exceptions.InternalServerError("oops", llm_provider="anthropic", model=PRIMARY), True),
+    (litellm.exceptions.APIConnectionError("reset", llm_provider="anthropic", model=PRIMARY), True),
+    (litellm.exceptions.Timeout("timed out", model=PRIMARY, llm_provider="anthropic"), True),
+    (asyncio.TimeoutError(), True),
+    (json.JSONDecodeError("bad", "{", 0), True),
+    (bad_request(), False),
+    (litellm.exceptions.ContextWindowExceededError("too long", model=PRIMARY, llm_provider="anthropic"), False),
+    (litellm.exceptions.AuthenticationError("bad key", llm_provider="anthropic", model=PRIMARY), False),
+    (litellm.exceptions.NotFoundError("no such model", model=PRIMARY, llm_provider="anthropic"), False),
+    (TypeError("unexpected keyword argument"), False),
+])
+def test_only_deployment_errors_count_against_a_deployment(error, expected):
+    assert llm.is_deployment_error(error) is expected
+
+
+@pytest.mark.asyncio
+async def test_bad_request_neither_fails_over_nor_changes_the_circuit(router, completion_calls):
+    calls, errors = completion_calls
+
+    for _ in range(5):
+        errors.append(bad_request())
+        with pytest.raises(llm.LLMError):
+            await call()
+
+    assert calls == [PRIMARY] * 5
+    stats = router.stats(PRIMARY)
+    assert list(stats.outcomes) == []
+    assert stats.consecutive_failures == 0
+    assert stats.open_until == 0.0
+    assert router.select([PRIMARY, FALLBACK]) is not None
+
+
+@pytest.mark.asyncio
+async def test_server_error_fails_over_to_the_next_deployment(router, completion_calls, monkeypatch):
+    monkeypatch.setattr("services.llm_router.EXPLORE_RATE", 0)
+    calls, errors = completion_calls
+    errors.append(litellm.exceptions.ServiceUnavailableError("overloaded", llm_provider="anthropic", model=PRIMARY))
+
+    response = await call()
+
+    assert response == {"model": FALLBACK}
+    assert calls == [PRIMARY, FALLBACK]
+    assert router.stats(PRIMARY).consecutive_failures == 1
@@ -0,0 +1,158 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import pytest_asyncio
+
+from agentpress import message_buffer
+from agentpress.message_buffer import MessagePersistenceError, MessageWriteBuffer
+
+
+class FakeRpc:
+    def __init__(self, client, name, params):
+        self.client = client
+        self.name = name
+        self.params = params
+
+    async def execute(self):
+        return self.client.run(self.name, self.params)
+
+
+class FakeClient:
+    """Records insert_messages batches and stamps created_at like the RPC does."""
+
+    def __init__(self):
+        self.batches = []
+        self.failures = 0
+        self.clock = datetime(2025, 5, 17, tzinfo=timezone.utc)
+
+    def rpc(self, name, params):
+        return FakeRpc(self, name, params)
+
+    def run(self, name, params):
+        assert name == "insert_messages"
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("database unavailable")
+        batch = params["p_messages"]
+        self.batches.append([row["message_id"] for row in batch])
+        saved = []
+        for row in batch:
+            self.clock += timedelta(microseconds=1)
+            saved.append({**row, "created_at": self.clock.isoformat()})
+        return type("Result", (), {"data": saved})()
+
+
+class FakeDB:
+    def __init__(self, client):
+        self._client = client
+
+    @property
+    async def client(self):
+        return self._client
+
+
+@pytest.fixture
+def db_client():
+    return FakeClient()
+
+
+@pytest_asyncio.fixture
+async def make_buffer(db_client):
+    buffers = []
+
+    def make(**kwargs):
+        kwargs.setdefault("flush_interval_ms", 60_000)
+        buffer = MessageWriteBuffer(**kwargs)
+        buffer.db = FakeDB(db_client)
+        buffers.append(buffer)
+        return buffer
+
+    yield make
+    for buffer in buffers:
+        timers = list(buffer._timers.values())
+        for task in timers:
+            task.cancel()
+        await asyncio.gather(*timers)
+
+
+def enqueue(buffer, thread_id, text):
+    return buffer.enqueue(buffer.build_row(thread_id, "user", {"role": "user", "content": text}, is_llm_message=True))
+
+
+@pytest.mark.asyncio
+async def test_build_row_leaves_created_at_to_the_database(make_buffer):
+    row = make_buffer().build_row("t1", "assistant", {"role": "assistant", "content": "hi"}, metadata={"a": 1})
+
+    assert "created_at" not in row
+    assert row["message_id"]
+    assert json.loads(row["content"]) == {"role": "assistant", "content": "hi"}
+    assert json.loads(row["metadata"]) == {"a": 1}
+
+
+@pytest.mark.asyncio
+async def test_rows_are_written_and_reported_in_queue_order(make_buffer, db_client):
+    saved = []
+    buffer = make_buffer(on_saved=saved.append)
+    rows = [enqueue(buffer, "t1", str(i)) for i in range(5)]
+    assert buffer.pending_count("t1") == 5
+
+    await buffer.flush("t1")
+
+    ids = [row["message_id"] for row in rows]
+    assert db_client.batches == [ids]
+    assert [row["message_id"] for row in saved] == ids
+    assert [row["created_at"] for row in saved] == sorted(row["created_at"] for row in saved)
+    assert buffer.pending_count() == 0
+
+
+@pytest.mark.asyncio
+async def test_flush_only_writes_the_requested_thread(make_buffer, db_client):
+    buffer = make_buffer()
+    first = enqueue(buffer, "t1", "a")
+    enqueue(buffer, "t2", "b")
+
+    await buffer.flush("t1")
+
+    assert db_client.batches == [[first["message_id"]]]
+    assert buffer.pending_count("t2") == 1
+
+
+@pytest.mark.asyncio
+async def test_full_batch_is_flushed_in_the_background(make_buffer, db_client):
+    buffer = make_buffer(max_batch_size=3)
+    rows = [enqueue(buffer, "t1", str(i)) for i in range(3)]
+
+    await asyncio.gather(*buffer._background_tasks)
+
+    assert db_client.batches == [[row["message_id"] for row in rows]]
+
+
+@pytest.mark.asyncio
+async def test_rows_are_flushed_after_the_interval(make_buffer, db_client):
+    buffer = make_buffer(flush_interval_ms=10)
+    row = enqueue(buffer, "t1", "a")
+
+    await asyncio.sleep(0.1)
+
+    assert db_client.batches == [[row["message_id"]]]
+    assert buffer.pending_count() == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_stays_ahead_of_newer_rows(make_buffer, db_client, monkeypatch):
+    monkeypatch.setattr(message_buffer, "MAX_FLUSH_RETRIES", 1)
+    buffer = make_buffer()
+    failed = [enqueue(buffer, "t1", str(i)) for i in range(2)]
+
+    db_client.failures = 1
+    with pytest.raises(MessagePersistenceError):
+        await buffer.flush("t1")
+    assert buffer.pending_count("t1") == 2
+
+    newer = enqueue(buffer, "t1", "later")
+    await buffer.flush("t1")
+
+    assert db_client.batches == [[row["message_id"] for row in failed + [newer]]]
+    assert buffer.pending_count() == 0
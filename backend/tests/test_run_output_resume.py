@@ -0,0 +1,51 @@
+import pytest
+
+from agent import run_output
+from agent.api import STREAM_ENTRY_ID_PATTERN
+from agent.run_output import RunOutputEntry
+
+
+@pytest.fixture
+def xrange_calls(monkeypatch):
+    calls = []
+    entries = [
+        ("1715000000000-0", {"data": '{"type": "assistant"}'}),
+        ("1715000000000-1", {"control": "STOP"}),
+    ]
+
+    async def fake_xrange(key, start="-", end="+", count=None):
+        calls.append((key, start))
+        return entries
+
+    monkeypatch.setattr(run_output.redis, "xrange", fake_xrange)
+    return calls
+
+
+@pytest.mark.parametrize("entry_id", ["0-0", "1715000000000-0", "1715000000000-12"])
+def test_stream_entry_ids_are_accepted(entry_id):
+    assert STREAM_ENTRY_ID_PATTERN.fullmatch(entry_id)
+
+
+@pytest.mark.parametrize("entry_id", ["", "42", "abc-1", "1-2-3", "(1-0", "1-0 ", "-", "+", "$"])
+def test_other_resume_ids_are_rejected(entry_id):
+    assert not STREAM_ENTRY_ID_PATTERN.fullmatch(entry_id)
+
+
+@pytest.mark.asyncio
+async def test_read_entries_resumes_after_the_given_id(xrange_calls):
+    entries = await run_output.read_entries("run-1", after_id="1714999999999-3")
+
+    assert xrange_calls == [(run_output.stream_key("run-1"), "(1714999999999-3")]
+    assert [entry.id for entry in entries] == ["1715000000000-0", "1715000000000-1"]
+
+
+@pytest.mark.asyncio
+async def test_read_entries_without_an_id_reads_from_the_start(xrange_calls):
+    await run_output.read_entries("run-1")
+    assert xrange_calls == [(run_output.stream_key("run-1"), "-")]
+
+
+def test_entries_are_parsed_from_stream_fields():
+    assert RunOutputEntry.from_fields("1-0", {"data": "{}"}) == RunOutputEntry(id="1-0", data="{}")
+    assert RunOutputEntry.from_fields("1-1", {"control": "STOP"}) == RunOutputEntry(id="1-1", control="STOP", end=True)
+    assert RunOutputEntry.from_fields("1-2", {"end": "1"}).end
@@ -0,0 +1,96 @@
+import io
+
+import pytest
+from PIL import Image, ImageDraw
+
+from agent.run import screen_unchanged
+from agentpress.image_pipeline import (
+    PERCEPTUAL_HASH_HEIGHT,
+    PERCEPTUAL_HASH_WIDTH,
+    ImagePipeline,
+    _difference_hash,
+    hash_distance,
+)
+from utils.config import config
+
+HASH_BITS = PERCEPTUAL_HASH_WIDTH * PERCEPTUAL_HASH_HEIGHT
+LINES = [f"Result {i}: lorem ipsum dolor sit amet {i * 7}" for i in range(25)]
+
+
+def page(lines=LINES, scroll=0, cursor=False):
+    """A 1024x768 screenshot of a page of text."""
+    image = Image.new("RGB", (1024, 768), "white")
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((40, 40 - scroll + i * 24), line, fill="black")
+    if cursor:
+        draw.rectangle((600, 300, 601, 316), fill="black")
+    return image
+
+
+def horizontal_gradient(reverse=False):
+    """A 256x64 image whose brightness falls from left to right (or rises, if reversed)."""
+    row = bytes(range(256)) if reverse else bytes(range(255, -1, -1))
+    return Image.frombytes("L", (256, 64), row * 64)
+
+
+class FakeContextSlots:
+    def __init__(self):
+        self.slots = {}
+
+    async def put(self, thread_id, slot, value):
+        self.slots[(thread_id, slot)] = value
+
+    async def consume(self, thread_id, slot):
+        return self.slots.pop((thread_id, slot), None)
+
+
+def test_hash_distance_counts_differing_bits():
+    assert hash_distance(0b1011, 0b1011) == 0
+    assert hash_distance(0b1011, 0b0110) == 3
+    assert hash_distance(0, (1 << HASH_BITS) - 1) == HASH_BITS
+
+
+def test_difference_hash_sets_a_bit_where_a_pixel_is_brighter_than_its_right_neighbour():
+    assert _difference_hash(horizontal_gradient()) == (1 << HASH_BITS) - 1
+    assert _difference_hash(horizontal_gradient(reverse=True)) == 0
+    assert _difference_hash(Image.new("RGB", (300, 200), "white")) == 0
+
+
+def test_unchanged_screen_with_a_blinking_cursor_is_within_the_threshold():
+    still = _difference_hash(page())
+    assert _difference_hash(page()) == still
+    assert hash_distance(still, _difference_hash(page(cursor=True))) <= config.SCREENSHOT_UNCHANGED_MAX_DISTANCE
+
+
+def test_scrolled_or_different_pages_are_far_apart():
+    still = _difference_hash(page())
+    threshold = config.SCREENSHOT_UNCHANGED_MAX_DISTANCE
+    assert hash_distance(still, _difference_hash(page(scroll=48))) > 4 * threshold
+    other = [f"Other {i}: something else entirely {i * 3}" for i in range(25)]
+    assert hash_distance(still, _difference_hash(page(lines=other))) > 4 * threshold
+
+
+@pytest.mark.asyncio
+async def test_pipeline_reports_the_hash_of_the_original_image():
+    image = page()
+    data = io.BytesIO()
+    image.save(data, "PNG")
+
+    normalized = await ImagePipeline(workers=1, output_format="webp", quality=80).normalize(data.getvalue(), "image/png", "gpt-4o")
+
+    assert normalized.perceptual_hash == _difference_hash(image)
+
+
+@pytest.mark.asyncio
+async def test_screen_unchanged_compares_with_the_threads_last_screenshot():
+    slots = FakeContextSlots()
+    still = _difference_hash(page())
+
+    assert not await screen_unchanged(slots, "t1", still)
+    assert await screen_unchanged(slots, "t1", _difference_hash(page(cursor=True)))
+    assert not await screen_unchanged(slots, "t2", still)
+    assert not await screen_unchanged(slots, "t1", _difference_hash(page(scroll=48)))
+    # The last screenshot is kept even when it is not reported as unchanged
+    assert slots.slots[("t1", "last_screenshot")] == {"perceptual_hash": format(_difference_hash(page(scroll=48)), "x")}
+    assert not await screen_unchanged(slots, "t1", None)
@@ -0,0 +1,102 @@
+import asyncio
+import json
+
+import pytest
+
+from agentpress.stream_coalescer import ContentChunkCoalescer, is_content_chunk
+
+
+def chunk(text):
+    return {
+        "type": "assistant",
+        "message_id": None,
+        "content": json.dumps({"role": "assistant", "content": text}),
+        "metadata": json.dumps({"stream_status": "chunk", "thread_run_id": "run-1"}),
+    }
+
+
+def status(name):
+    return {"type": "status", "message_id": None, "content": json.dumps({"status_type": name}), "metadata": "{}"}
+
+
+def text_of(frame):
+    return json.loads(frame["content"])["content"]
+
+
+async def from_list(responses):
+    for response in responses:
+        yield response
+
+
+async def collect(coalescer, source):
+    return [response async for response in coalescer.coalesce(source)]
+
+
+def test_is_content_chunk():
+    assert is_content_chunk(chunk("a"))
+    assert not is_content_chunk(status("tool_started"))
+    assert not is_content_chunk({**chunk("a"), "message_id": "saved-message"})
+    assert not is_content_chunk({**chunk("a"), "metadata": json.dumps({"stream_status": "complete"})})
+    assert not is_content_chunk({**chunk("a"), "metadata": "not json"})
+
+
+def test_is_content_chunk_does_not_depend_on_metadata_formatting():
+    compact = json.dumps({"thread_run_id": "run-1", "stream_status": "chunk"}, separators=(",", ":"))
+    assert is_content_chunk({**chunk("a"), "metadata": compact})
+    assert is_content_chunk({**chunk("a"), "metadata": {"stream_status": "chunk"}})
+
+
+@pytest.mark.asyncio
+async def test_adjacent_chunks_are_merged_into_one_frame():
+    coalescer = ContentChunkCoalescer(window_ms=1000)
+    frames = await collect(coalescer, from_list([chunk("Hel"), chunk("lo"), chunk(" world")]))
+
+    assert len(frames) == 1
+    assert text_of(frames[0]) == "Hello world"
+    metadata = json.loads(frames[0]["metadata"])
+    assert metadata["sequence"] == 0
+    assert metadata["chunk_count"] == 3
+    assert metadata["thread_run_id"] == "run-1"
+    assert (coalescer.frames_in, coalescer.frames_out) == (3, 1)
+
+
+@pytest.mark.asyncio
+async def test_other_messages_flush_pending_chunks_first_and_keep_order():
+    source = [chunk("a"), chunk("b"), status("tool_started"), chunk("c"), status("finish")]
+    frames = await collect(ContentChunkCoalescer(window_ms=1000), from_list(source))
+
+    assert [f["type"] for f in frames] == ["assistant", "status", "assistant", "status"]
+    assert text_of(frames[0]) == "ab"
+    assert text_of(frames[2]) == "c"
+    assert json.loads(frames[2]["metadata"])["sequence"] == 2
+
+
+@pytest.mark.asyncio
+async def test_frame_is_flushed_when_it_reaches_max_bytes():
+    frames = await collect(ContentChunkCoalescer(window_ms=1000, max_bytes=4), from_list([chunk("ab"), chunk("cd"), chunk("e")]))
+    assert [text_of(f) for f in frames] == ["abcd", "e"]
+
+
+@pytest.mark.asyncio
+async def test_window_elapses_while_the_source_is_idle():
+    release = asyncio.Event()
+
+    async def source():
+        yield chunk("first")
+        await release.wait()
+        yield chunk("second")
+
+    frames = ContentChunkCoalescer(window_ms=20).coalesce(source())
+    first = await asyncio.wait_for(frames.__anext__(), timeout=1)
+    assert text_of(first) == "first"
+
+    release.set()
+    assert text_of(await frames.__anext__()) == "second"
+    with pytest.raises(StopAsyncIteration):
+        await frames.__anext__()
+
+
+@pytest.mark.asyncio
+async def test_zero_window_passes_responses_through():
+    source = [chunk("a"), chunk("b"), status("finish")]
+    assert await collect(ContentChunkCoalescer(window_ms=0), from_list(source)) == source
@@ -0,0 +1,69 @@
+from agentpress.xml_scanner import XmlToolCallScanner, extract_xml_chunks
+
+TAGS = ["create-file", "create-file-batch", "execute-command"]
+
+
+def feed_all(scanner, deltas):
+    chunks = []
+    for delta in deltas:
+        chunks.extend(scanner.feed(delta))
+    return chunks
+
+
+def test_extracts_tool_calls_and_drops_surrounding_text():
+    content = (
+        "Let me create it.\n"
+        '<create-file file_path="a.txt">hello</create-file>\n'
+        "Now run it: <execute-command>cat a.txt</execute-command> done"
+    )
+    assert extract_xml_chunks(content, TAGS) == [
+        '<create-file file_path="a.txt">hello</create-file>',
+        "<execute-command>cat a.txt</execute-command>",
+    ]
+
+
+def test_character_by_character_stream_matches_full_content():
+    content = (
+        "text <create-file-batch>\n<create-file>x</create-file>\n</create-file-batch>"
+        " <execute-command>ls -la</execute-command> <create-file file_path='b'>y</create-file>"
+    )
+    scanner = XmlToolCallScanner(TAGS)
+    assert feed_all(scanner, content) == extract_xml_chunks(content, TAGS)
+
+
+def test_chunk_is_emitted_with_the_delta_that_closes_it():
+    scanner = XmlToolCallScanner(TAGS)
+    assert scanner.feed("<execute-command>echo hi</exec") == []
+    assert scanner.feed("ute-comm") == []
+    assert scanner.feed("and> trailing") == ["<execute-command>echo hi</execute-command>"]
+
+
+def test_prefers_the_longest_registered_tag_name():
+    content = "<create-file-batch><create-file>a</create-file></create-file-batch><create-file>b</create-file>"
+    assert extract_xml_chunks(content, TAGS) == [
+        "<create-file-batch><create-file>a</create-file></create-file-batch>",
+        "<create-file>b</create-file>",
+    ]
+
+
+def test_tag_name_split_across_deltas_is_decided_when_it_completes():
+    scanner = XmlToolCallScanner(TAGS)
+    assert scanner.feed("<create-fi") == []
+    assert scanner.feed("le") == []
+    assert scanner.feed("-batch>") == []
+    assert scanner.feed("</create-file-batch>") == ["<create-file-batch></create-file-batch>"]
+
+
+def test_ignores_unregistered_tags_and_names_that_only_share_a_prefix():
+    content = "<div>x</div> <create-filesystem>y</create-filesystem> <execute>z</execute>"
+    assert extract_xml_chunks(content, TAGS) == []
+
+
+def test_nested_tags_of_the_same_name_are_balanced():
+    content = "<create-file>outer <create-file>inner</create-file> tail</create-file>"
+    scanner = XmlToolCallScanner(TAGS)
+    assert feed_all(scanner, [content[:30], content[30:]]) == [content]
+
+
+def test_no_registered_tags_yields_nothing():
+    assert XmlToolCallScanner([]).feed("<create-file>x</create-file>") == []
@@ -125,6 +125,56 @@ class Configuration:
     # Model configuration
     MODEL_TO_USE: Optional[str] = "anthropic/claude-3-7-sonnet-latest"
     
+    # LLM deployment routing
+    LLM_ROUTING_ENABLED: bool = False  # Route between equivalent deployments (Anthropic, Bedrock, OpenRouter), including a share of requests to the slower ones
+    LLM_DEPLOYMENTS: Optional[str] = None  # "model=deployment1,deployment2;model2=..." overrides the built-in groups
+    LLM_FIRST_CHUNK_TIMEOUT: int = 60  # Seconds to wait for the first streamed chunk before failing over
+    LLM_HEDGING_ENABLED: bool = False  # Send a second request when the first chunk is later than the recent p90
+    LLM_HEDGE_MIN_DELAY_MS: int = 1500  # Never hedge earlier than this
+    LLM_HEDGE_BUDGET_PER_HOUR: int = 20  # Hedged requests allowed per account and hour
+    
+    # LLM response recording and replay
+    LLM_RECORD_DIR: Optional[str] = None  # Record every LLM response with chunk timing to this directory
+    LLM_REPLAY_ENABLED: bool = False  # Allow "replay/<fixture>" models (local benchmarking only; they skip providers and billing)
+    LLM_REPLAY_DIR: str = "replays"  # Fixtures for "replay/<fixture>" models
+    LLM_REPLAY_SPEED: int = 1  # 1 = original timing, N = N times faster, 0 = no delays
+    
+    # Tracing
+    TRACING_EXPORTER: str = "none"  # "none", "json" (append spans to TRACING_JSON_PATH) or "otlp" (post to TRACING_OTLP_ENDPOINT)
+    TRACING_JSON_PATH: str = "logs/traces.jsonl"
+    TRACING_OTLP_ENDPOINT: str = "http://localhost:4318/v1/traces"
+    
+    # Agent run output streaming
+    STREAM_COALESCE_WINDOW_MS: int = 40  # Merge content chunks arriving within this window (0 = disabled)
+    STREAM_COALESCE_MAX_BYTES: int = 4096  # Flush a merged frame once it reaches this size
+    AGENT_RUN_STREAM_BLOCK_MS: int = 4000  # Longest blocking read by a viewer; keep below the Redis socket timeout (5s)
+    
+    # Tool result caching
+    TOOL_CACHE_ENABLED: bool = True
+    
+    # Large tool output offloading
+    TOOL_OUTPUT_OFFLOAD_CHARS: int = 20000  # Outputs longer than this are stored outside the thread (0 = disabled)
+    TOOL_OUTPUT_PREVIEW_CHARS: int = 2000  # Characters kept from the start and end of an offloaded output
+    TOOL_OUTPUT_STORE: str = "redis"  # "redis" or "disk"
+    TOOL_OUTPUT_STORE_DIR: str = "/tmp/agentpress/tool_outputs"
+    TOOL_OUTPUT_TTL: int = 7 * 24 * 3600  # Seconds offloaded outputs are kept in Redis
+    
+    # Message persistence
+    MESSAGE_WRITE_BEHIND: bool = False  # Save agent run messages in batches; a batch that cannot be saved fails the run
+    
+    # Thread message caching
+    THREAD_MESSAGE_CACHE_REDIS: bool = False  # Share thread message snapshots between workers
+    
+    # Ephemeral thread context (browser state, images for the next LLM call)
+    THREAD_CONTEXT_TTL: int = 600  # Seconds unconsumed context is kept
+    
+    # Image normalization before LLM submission
+    IMAGE_NORMALIZATION_ENABLED: bool = True
+    IMAGE_FORMAT: str = "webp"  # "webp" or "jpeg"
+    IMAGE_QUALITY: int = 80
+    IMAGE_WORKERS: int = 2  # Threads decoding and encoding images
+    SCREENSHOT_UNCHANGED_MAX_DISTANCE: int = 8  # Screenshots within this many (of 3072) perceptual hash bits of the thread's last one are noted as unchanged (-1 = disabled)
+    
     # Supabase configuration
     SUPABASE_URL: str
     SUPABASE_ANON_KEY: str
@@ -153,6 +203,10 @@ class Configuration:
     STRIPE_WEBHOOK_SECRET: Optional[str] = None
     STRIPE_DEFAULT_PLAN_ID: Optional[str] = None
     STRIPE_DEFAULT_TRIAL_DAYS: int = 14
+    STRIPE_MAX_CONCURRENCY: int = 8  # Concurrent Stripe API requests per process
+    ENTITLEMENT_CACHE_TTL: int = 300  # Seconds an account's resolved plan is shared through Redis
+    ENTITLEMENT_LOCAL_TTL: int = 30  # Seconds it is answered from process memory
+    USAGE_SWEEP_INTERVAL: int = 60  # Seconds between counting the time of runs in progress towards usage
     
     # Stripe Product IDs
     STRIPE_PRODUCT_ID_PROD: str = 'prod_SH7nxrLxYVFTgM'  # Production product ID
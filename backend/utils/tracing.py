@@ -0,0 +1,355 @@
+"""
+Lightweight span tracing for agent runs.
+
+Spans follow the OpenTelemetry data model (trace/span IDs, parent IDs,
+nanosecond timestamps, attributes and status) and are exported as OTLP JSON,
+either appended to a local JSON lines file or posted to an OTLP/HTTP collector
+(e.g. http://localhost:4318/v1/traces). Tracing is off unless TRACING_EXPORTER
+is set, in which case every call below is a cheap no-op.
+
+An agent run opens a run scope (`start_run`) that carries the agent_run_id and
+thread_id attributes to every span created under it, including spans created
+in tasks. The agent generator is advanced from a different task on every step,
+so context variables set inside it do not survive between steps; the current
+iteration is therefore kept on the shared run scope (`start_step`) rather than
+in a context variable.
+
+Usage:
+    from utils import tracing
+
+    with tracing.span("tool.execute", function_name=name) as s:
+        result = await tool_fn(**arguments)
+        s.set_attribute("success", result.success)
+"""
+
+import asyncio
+import atexit
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from utils.config import config
+from utils.logger import logger
+
+SERVICE_NAME = "agentpress"
+EXPORT_BATCH_SIZE = 100
+EXPORT_INTERVAL_SECONDS = 2.0
+
+# OTLP status codes
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+def enabled() -> bool:
+    """Whether spans are recorded and exported."""
+    return config.TRACING_EXPORTER in ("json", "otlp")
+
+
+class Span:
+    """A timed operation within a trace."""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.status_code = STATUS_UNSET
+        self.status_message = ""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        self.attributes.update(attributes)
+
+    def record_error(self, error: BaseException) -> None:
+        """Mark the span as failed."""
+        self.status_code = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {str(error)[:500]}"
+
+    def end(self) -> None:
+        """End the span and queue it for export; later calls do nothing."""
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        _exporter.add(self)
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """Convert to the OTLP JSON span representation."""
+        data = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items() if v is not None],
+            "status": {"code": self.status_code, "message": self.status_message} if self.status_code else {},
+        }
+        if self.parent_id:
+            data["parentSpanId"] = self.parent_id
+        return data
+
+
+class _NoopSpan(Span):
+    """Span returned while tracing is disabled; records nothing."""
+
+    def __init__(self):
+        self.name = ""
+        self.trace_id = ""
+        self.span_id = ""
+        self.parent_id = None
+        self.attributes = {}
+        self.start_ns = 0
+        self.end_ns = 0
+        self.status_code = STATUS_UNSET
+        self.status_message = ""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        pass
+
+    def record_error(self, error: BaseException) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+@dataclass
+class _RunScope:
+    """Trace state shared by everything under one agent run.
+
+    Attributes:
+        trace_id: Trace ID of the run
+        attributes: Attributes added to every span of the run (agent_run_id, thread_id)
+        root: The run's root span
+        step: The current iteration span, if one is open
+    """
+    trace_id: str
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    root: Optional[Span] = None
+    step: Optional[Span] = None
+
+
+_run_scope: ContextVar[Optional[_RunScope]] = ContextVar('trace_run_scope', default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar('trace_current_span', default=None)
+
+
+def _new_span(name: str, attributes: Dict[str, Any]) -> Span:
+    """Create a span under the current span, iteration or run, inheriting the run's attributes."""
+    scope = _run_scope.get()
+    parent = _current_span.get()
+    if parent is None and scope is not None:
+        parent = scope.step or scope.root
+
+    merged = dict(scope.attributes) if scope is not None else {}
+    merged.update(attributes)
+    if parent is not None:
+        trace_id = parent.trace_id
+    elif scope is not None:
+        trace_id = scope.trace_id
+    else:
+        trace_id = secrets.token_hex(16)
+    return Span(name, trace_id, parent.span_id if parent is not None else None, merged)
+
+
+def start_run(name: str, **attributes: Any) -> Span:
+    """Open the root span of an agent run and the scope its other spans belong to.
+
+    Must be called in the task that runs the agent, before any tasks are created
+    for it. End the returned span when the run is finished.
+    """
+    if not enabled():
+        return NOOP_SPAN
+    scope = _RunScope(trace_id=secrets.token_hex(16), attributes=dict(attributes))
+    _run_scope.set(scope)
+    scope.root = _new_span(name, {})
+    return scope.root
+
+
+def start_step(name: str, **attributes: Any) -> Span:
+    """Open the span of a run step (e.g. an agent iteration), ending the previous one.
+
+    Spans created anywhere under the run are parented to the open step.
+    """
+    if not enabled():
+        return NOOP_SPAN
+    end_step()
+    scope = _run_scope.get()
+    step = _new_span(name, attributes)
+    if scope is not None:
+        scope.step = step
+    return step
+
+
+def end_step() -> None:
+    """End the open step span of the current run, if any."""
+    scope = _run_scope.get()
+    if scope is not None and scope.step is not None:
+        scope.step.end()
+        scope.step = None
+
+
+def start_span(name: str, **attributes: Any) -> Span:
+    """Create a span without making it current; the caller must end() it.
+
+    For operations that outlive the call that starts them, like a streamed response.
+    """
+    if not enabled():
+        return NOOP_SPAN
+    return _new_span(name, attributes)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """Run a block in a span that is current for nested spans.
+
+    Exceptions mark the span as failed and are re-raised. The block must not
+    cross a yield of an async generator.
+    """
+    if not enabled():
+        yield NOOP_SPAN
+        return
+
+    current = _new_span(name, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        if not isinstance(e, (GeneratorExit, asyncio.CancelledError)):
+            current.record_error(e)
+        raise
+    finally:
+        current.end()
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            _current_span.set(None)
+
+
+def traced(name: str) -> Callable:
+    """Decorator that runs a coroutine function in a span."""
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not enabled():
+                return await func(*args, **kwargs)
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _SpanExporter:
+    """Batches finished spans and exports them from a background thread.
+
+    A batch is exported once it is full or EXPORT_INTERVAL_SECONDS after the
+    previous export, so neither the JSON file writes nor the collector requests
+    run on the event loop.
+    """
+
+    def __init__(self):
+        self._batch: List[Span] = []
+        self._lock = threading.Lock()
+        # Serializes exports, so batches are written whole and in order
+        self._export_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+
+    def add(self, finished: Span) -> None:
+        with self._lock:
+            self._batch.append(finished)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                self._worker.start()
+                atexit.register(self.flush)
+            if len(self._batch) >= EXPORT_BATCH_SIZE:
+                self._wake.set()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(EXPORT_INTERVAL_SECONDS)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        with self._export_lock:
+            with self._lock:
+                batch, self._batch = self._batch, []
+            if batch:
+                self._export(batch)
+
+    def _export(self, batch: List[Span]) -> None:
+        spans = [s.to_otlp() for s in batch]
+        try:
+            if config.TRACING_EXPORTER == "json":
+                self._write_json(spans)
+            elif config.TRACING_EXPORTER == "otlp":
+                self._post_otlp(spans)
+        except Exception as e:
+            logger.warning(f"Failed to export {len(spans)} trace spans: {str(e)}")
+
+    @staticmethod
+    def _write_json(spans: List[Dict[str, Any]]) -> None:
+        directory = os.path.dirname(config.TRACING_JSON_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(config.TRACING_JSON_PATH, "a", encoding="utf-8") as f:
+            for s in spans:
+                f.write(json.dumps(s) + "\n")
+
+    @staticmethod
+    def _post_otlp(spans: List[Dict[str, Any]]) -> None:
+        import httpx
+
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": spans}],
+            }]
+        }
+        httpx.post(config.TRACING_OTLP_ENDPOINT, json=payload, timeout=5)
+
+
+_exporter = _SpanExporter()
+
+
+def flush() -> None:
+    """Export all finished spans that are still batched.
+
+    Blocks until they are written; batches are also exported in the background
+    and at interpreter exit.
+    """
+    _exporter.flush()
@@ -1,4 +1,4 @@
-import React, { useMemo } from 'react';
+import React, { useEffect, useMemo, useState } from 'react';
 import {
   Globe,
   MonitorPlay,
@@ -16,6 +16,7 @@ import {
 } from './utils';
 import { ApiMessageType } from '@/components/thread/types';
 import { safeJsonParse } from '@/components/thread/utils';
+import { getSandboxFileContent } from '@/lib/api';
 import { cn } from '@/lib/utils';
 
 export function BrowserToolView({
@@ -72,6 +73,7 @@ export function BrowserToolView({
 
   // Find the browser_state message and extract the screenshot
   let screenshotBase64: string | null = null;
+  let screenshotPath: string | null = null;
   if (browserStateMessageId && messages.length > 0) {
     const browserStateMessage = messages.find(
       (msg) =>
@@ -80,14 +82,47 @@ export function BrowserToolView({
     );
 
     if (browserStateMessage) {
-      const browserStateContent = safeJsonParse<{ screenshot_base64?: string }>(
-        browserStateMessage.content,
-        {},
-      );
+      const browserStateContent = safeJsonParse<{
+        screenshot_base64?: string;
+        screenshot_path?: string;
+      }>(browserStateMessage.content, {});
       screenshotBase64 = browserStateContent?.screenshot_base64 || null;
+      screenshotPath = browserStateContent?.screenshot_path || null;
     }
   }
 
+  // Newer browser_state messages keep the screenshot in the sandbox
+  const sandboxId = project?.sandbox?.id;
+  const [screenshotUrl, setScreenshotUrl] = useState<string | null>(null);
+
+  useEffect(() => {
+    setScreenshotUrl(null);
+    if (!sandboxId || !screenshotPath) return;
+
+    let cancelled = false;
+    let objectUrl: string | null = null;
+    getSandboxFileContent(sandboxId, screenshotPath)
+      .then((content) => {
+        if (cancelled) return;
+        objectUrl = URL.createObjectURL(
+          new Blob([content], { type: 'image/jpeg' }),
+        );
+        setScreenshotUrl(objectUrl);
+      })
+      .catch((error) => {
+        console.error('[BrowserToolView] Error loading screenshot:', error);
+      });
+
+    return () => {
+      cancelled = true;
+      if (objectUrl) URL.revokeObjectURL(objectUrl);
+    };
+  }, [sandboxId, screenshotPath]);
+
+  const screenshotSrc =
+    screenshotUrl ||
+    (screenshotBase64 ? `data:image/jpeg;base64,${screenshotBase64}` : null);
+
   // Check if we have a VNC preview URL from the project
   const vncPreviewUrl = project?.sandbox?.vnc_preview
     ? `${project.sandbox.vnc_preview}/vnc_lite.html?password=${project?.sandbox?.pass}&autoconnect=true&scale=local&width=1024&height=768`
@@ -139,10 +174,10 @@ export function BrowserToolView({
               isRunning && vncIframe ? (
                 // Use the memoized iframe for live preview
                 vncIframe
-              ) : screenshotBase64 ? (
+              ) : screenshotSrc ? (
                 <div className="flex items-center justify-center w-full h-full max-h-[650px] overflow-auto">
                   <img
-                    src={`data:image/jpeg;base64,${screenshotBase64}`}
+                    src={screenshotSrc}
                     alt="Browser Screenshot"
                     className="max-w-full max-h-full object-contain"
                   />
@@ -169,10 +204,10 @@ export function BrowserToolView({
                 </div>
               )
             ) : // For non-last tool calls, only show screenshot if available, otherwise show "No Browser State image found"
-            screenshotBase64 ? (
+            screenshotSrc ? (
               <div className="flex items-center justify-center w-full h-full max-h-[650px] overflow-auto">
                 <img
-                  src={`data:image/jpeg;base64,${screenshotBase64}`}
+                  src={screenshotSrc}
                   alt="Browser Screenshot"
                   className="max-w-full max-h-full object-contain"
                 />